@@ -0,0 +1,279 @@
+"""게임 턴 요청의 입장 제어(admission control).
+
+턴 요청은 대부분 Gemini 호출로 이어지므로, 전송 버튼을 연타하거나 플레이어가 한꺼번에 몰리면
+그대로 API 할당량을 소진하고 500 오류로 번집니다. AdmissionController는 턴 처리 앞단에서
+
+- 같은 세션의 같은 턴이 이미 처리 중이면 새로 처리하지 않고 그 결과를 함께 받게 하고 (중복 제거)
+- 세션별 토큰 버킷으로 한 플레이어의 요청 속도를 제한하고
+- 전체 동시 처리 수와 분당 요청 수(RPM)를 API 할당량에 맞춰 제한하며
+- 자리가 없으면 길이가 제한된 대기열에서 기다리게 합니다. 대기열은 클라이언트별로 번갈아 꺼내므로
+  한 클라이언트가 요청을 몰아 보내도 다른 플레이어의 순서가 밀리지 않습니다.
+
+받아들일 수 없는 요청은 AdmissionRejected(retry_after 포함)로 알려 429 + Retry-After로 응답하게 합니다.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from turn_metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """턴 요청을 지금 받아들일 수 없을 때 발생합니다. `retry_after`초 뒤에 다시 시도하면 됩니다."""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.reason = reason
+
+
+class TokenBucket:
+    """초당 `rate`개씩 채워지고 최대 `burst`개까지 쌓이는 토큰 버킷."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now=None):
+        """토큰을 하나 꺼냅니다. 성공하면 0, 실패하면 다음 토큰까지 남은 초를 반환합니다."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def wait_time(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class _InFlight:
+    """처리 중인 턴 하나. 중복 요청은 done 이벤트를 기다렸다가 같은 결과를 받습니다."""
+    __slots__ = ('fingerprint', 'done', 'result', 'followers')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None  # (payload, status)
+        self.followers = 0
+
+
+class TurnTicket:
+    """admit()의 결과. leader면 턴을 처리한 뒤 publish()와 release()를 호출해야 합니다."""
+
+    def __init__(self, controller, session_key, entry, leader):
+        self._controller = controller
+        self.session_key = session_key
+        self._entry = entry
+        self.leader = leader
+        self._released = False
+
+    def publish(self, payload, status):
+        """처리 결과를 같은 턴을 기다리는 중복 요청들에 전달합니다."""
+        self._entry.result = (payload, status)
+
+    def wait_result(self, timeout):
+        """(중복 요청) 먼저 들어온 요청의 결과 (payload, status)를 기다립니다. 시간이 지나거나 결과가 없으면 None."""
+        if not self._entry.done.wait(timeout):
+            return None
+        return self._entry.result
+
+    def release(self):
+        if self.leader and not self._released:
+            self._released = True
+            self._controller._release(self.session_key, self._entry)
+
+
+class _Waiter:
+    __slots__ = ('client_key', 'admitted')
+
+    def __init__(self, client_key):
+        self.client_key = client_key
+        self.admitted = False
+
+
+class AdmissionController:
+    """세션별 속도 제한 + 전체 동시 처리/RPM 제한 + 공정 대기열 + 같은 턴 중복 제거.
+
+    session_rate_per_minute가 0이면 세션별 속도 제한을, rpm이 0이면 분당 요청 수 제한을 끕니다.
+    """
+
+    def __init__(self, session_rate_per_minute=20, session_burst=5, max_concurrent=4, rpm=0,
+                 max_queue=32, max_wait_seconds=20.0, idle_seconds=600, prefix='trpg'):
+        self.session_rate = session_rate_per_minute / 60.0
+        self.session_burst = session_burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.idle_seconds = idle_seconds
+        # 분당 요청 수 제한 (0이면 끔). 1분 동안 rpm개까지 몰려도 되도록 burst = rpm
+        self._rpm_bucket = TokenBucket(rpm / 60.0, rpm) if rpm else None
+        self._session_buckets = OrderedDict()  # 세션 -> TokenBucket (오래 안 쓴 것부터 정리)
+        self._in_flight_turns = {}  # 세션 -> _InFlight
+        self._queues = OrderedDict()  # 클라이언트 -> deque[_Waiter] (앞에서부터 번갈아 입장)
+        self._queued = 0
+        self._running = 0
+        self._turn_seconds = 5.0  # 턴 처리 시간 이동 평균 (Retry-After 추정용)
+        self._cond = threading.Condition()
+        self._counters = {'admitted': 0, 'deduplicated': 0, 'queued': 0}
+        self.rejections = Counter(f'{prefix}_admission_rejected_total', 'Turn requests rejected by admission control',
+                                  ('reason',))
+        self._rejected = {}
+
+    # --- 입장 ---
+    def admit(self, session_key, client_key, fingerprint):
+        """턴 처리 권한(TurnTicket)을 반환합니다. 받아들일 수 없으면 AdmissionRejected가 발생합니다."""
+        with self._cond:
+            current = self._in_flight_turns.get(session_key)
+            if current is not None:
+                if current.fingerprint == fingerprint:
+                    current.followers += 1
+                    self._counters['deduplicated'] += 1
+                    return TurnTicket(self, session_key, current, leader=False)
+                self._reject("이전 턴을 아직 처리하고 있습니다", 1, 'session_busy')
+
+            bucket = self._session_bucket(session_key) if self.session_rate > 0 else None
+            wait = bucket.try_take() if bucket is not None else 0
+            if wait:
+                self._reject("요청이 너무 잦습니다", wait, 'session_rate')
+
+            entry = _InFlight(fingerprint)
+            self._in_flight_turns[session_key] = entry
+            try:
+                self._acquire_slot(client_key)
+            except AdmissionRejected:
+                del self._in_flight_turns[session_key]
+                entry.done.set()  # 이 턴을 기다리던 중복 요청도 결과 없이 깨움
+                if bucket is not None:
+                    bucket.tokens = min(bucket.burst, bucket.tokens + 1)  # 처리하지 않은 요청의 토큰은 돌려줌
+                raise
+            self._counters['admitted'] += 1
+            return TurnTicket(self, session_key, entry, leader=True)
+
+    def _acquire_slot(self, client_key):
+        """전체 동시 처리 수/RPM 안에서 자리를 얻을 때까지 대기열에서 기다립니다. (self._cond를 잡은 상태에서 호출)"""
+        if not self._queued and self._slot_wait() == 0:
+            self._take_slot()
+            return
+        if self._queued >= self.max_queue:
+            self._reject("요청이 몰려 대기열이 가득 찼습니다", self._estimated_wait(), 'queue_full')
+
+        waiter = _Waiter(client_key)
+        self._queues.setdefault(client_key, deque()).append(waiter)
+        self._queued += 1
+        self._counters['queued'] += 1
+        deadline = time.monotonic() + self.max_wait_seconds
+        try:
+            while True:
+                self._dispatch()
+                if waiter.admitted:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject("요청이 몰려 대기 시간을 넘겼습니다", self._estimated_wait(), 'queue_timeout')
+                # RPM 토큰이 채워지는 시점에도 깨어나 다시 확인
+                self._cond.wait(timeout=min(remaining, max(0.05, self._slot_wait() or remaining)))
+        finally:
+            if not waiter.admitted:
+                queue = self._queues.get(client_key)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[client_key]
+
+    def _dispatch(self):
+        """자리가 있는 만큼 클라이언트를 번갈아 가며 대기 중인 요청을 입장시킵니다."""
+        while self._queues and self._slot_wait() == 0:
+            client_key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            del self._queues[client_key]
+            if queue:
+                self._queues[client_key] = queue  # 남은 요청은 맨 뒤 순서로
+            self._take_slot()
+            waiter.admitted = True
+            self._cond.notify_all()
+
+    def _slot_wait(self):
+        """지금 자리를 얻으려면 기다려야 하는 초 (동시 처리 수가 차 있으면 무한대)."""
+        if self._running >= self.max_concurrent:
+            return float('inf')
+        return self._rpm_bucket.wait_time() if self._rpm_bucket is not None else 0.0
+
+    def _take_slot(self):
+        self._running += 1
+        if self._rpm_bucket is not None:
+            self._rpm_bucket.try_take()
+
+    def _release(self, session_key, entry):
+        with self._cond:
+            self._running -= 1
+            if self._in_flight_turns.get(session_key) is entry:
+                del self._in_flight_turns[session_key]
+            self._dispatch()
+            self._cond.notify_all()
+        entry.done.set()
+
+    def observe_turn_seconds(self, seconds):
+        with self._cond:
+            self._turn_seconds = 0.8 * self._turn_seconds + 0.2 * seconds
+
+    # --- 보조 ---
+    def _estimated_wait(self):
+        rounds = (self._queued + 1) / max(1, self.max_concurrent)
+        wait = rounds * self._turn_seconds
+        if self._rpm_bucket is not None and self._rpm_bucket.rate > 0:
+            wait = max(wait, (self._queued + 1) / self._rpm_bucket.rate)
+        return wait
+
+    def _reject(self, message, retry_after, reason):
+        self.rejections.inc(reason=reason)
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        logger.info(f"턴 요청 거절: {reason} (Retry-After {retry_after:.1f}s)", extra={'category': 'admission'})
+        raise AdmissionRejected(message, retry_after, reason)
+
+    def _session_bucket(self, session_key):
+        bucket = self._session_buckets.pop(session_key, None) or TokenBucket(self.session_rate, self.session_burst)
+        self._session_buckets[session_key] = bucket
+        # 오래 쓰지 않은 세션의 버킷 정리 (가득 찬 버킷과 같으므로 지워도 동작은 같음)
+        now = time.monotonic()
+        while self._session_buckets:
+            oldest_key, oldest = next(iter(self._session_buckets.items()))
+            if now - oldest.updated < self.idle_seconds:
+                break
+            del self._session_buckets[oldest_key]
+        return bucket
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    @property
+    def running(self):
+        return self._running
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._counters,
+                'rejected': dict(self._rejected),
+                'running': self._running,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': self._queued,
+                'max_queue': self.max_queue,
+                'rpm': self._rpm_bucket.burst if self._rpm_bucket is not None else None,
+                'avg_turn_seconds': round(self._turn_seconds, 2),
+            }
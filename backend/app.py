@@ -1,43 +1,74 @@
-from flask import Flask, jsonify, request, session # session 임포트 추가
+import time
+_IMPORT_STARTED = time.perf_counter() # 시작 프로파일 기준 시각 (다른 import보다 먼저)
+from flask import Flask, jsonify, request, session, Response, stream_with_context, g # session 임포트 추가
 from flask_cors import CORS
 import random
 import os
-import google.generativeai as genai
 import json
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
 from dotenv import load_dotenv
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import re # 정규식 사용을 위해 추가
+import copy
+import queue
+from contextlib import nullcontext
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from log_setup import configure_logging, parse_category_map, blob_ref
+from speculation import RollSpeculator, speculation_key
+from rooms import RoomManager, RoomError
+from session_store import create_session_store, new_session_id
+from json_stream import extract_partial_string_field, loads_tolerant
+from llm_client import LLMClient, LLMTimeoutError, LazyModel, is_transient_error
+from admission import AdmissionController, AdmissionRejected
+from hedging import Hedger, LateAnswers, TurnDeadlineExceeded
+from model_router import ModelRouter, ModelTier, RoutingPolicy, classify_action, parse_cost
+from prompt_templates import compile_prompt_templates, PrefixContextCache
+from prompt_budget import PromptBudget, TokenCounter
+from lorebook_registry import LorebookRegistry
+from lore_index import estimate_tokens
+from fake_model import FakeGenerativeModel
+from response_cache import ResponseCache, make_cache_key
+from dice_odds import ROLL_VARIANTS, get_modifier, outcome_odds, roll_outcome, stat_odds, stat_odds_table
+from campaign_log import (CampaignLog, LogView, apply_state_changes, character_delta, new_event,
+                          render_html, roll_dice, state_delta)
+from story_memory import StoryMemory, build_summary_prompt, strip_log_markup
+from turn_metrics import TurnMetrics, TurnTrace
+from turn_schema import (STAT_MAPPING_KO, TURN_GENERATION_CONFIG, ROOM_GENERATION_CONFIG,
+                         normalize_turn_response, normalize_room_response)
+from startup_profile import StartupProfile
+
+# google.generativeai는 import에만 1초 가까이 걸리므로 모델을 처음 만들 때 불러옵니다 (아래 _gemini_model).
+startup_profile = StartupProfile(started=_IMPORT_STARTED)
+startup_profile.mark('imports')
 
 # --- Gemini API 안전 설정 (검열 해제) ---
+# SDK를 import하지 않아도 되도록 enum 대신 이름 문자열로 지정합니다 (SDK가 같은 값으로 변환).
 safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
+    'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
+    'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE',
+    'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE',
 }
 
 # --- 로깅 설정 ---
-LOG_FILE = 'debug.log'
+# 요청 스레드는 로그를 큐에 넣기만 하고, 파일/콘솔 기록은 별도 스레드가 담당합니다 (log_setup.py).
+# LOG_SAMPLE_RATES="turn=0.1" 처럼 카테고리별 샘플링 비율을, LOG_RATE_LIMITS="turn=50" 처럼 초당 최대 개수를 지정할 수 있습니다.
+load_dotenv(dotenv_path='api_key.env')
+LOG_FILE = os.getenv('LOG_FILE', 'debug.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json') # json 또는 text (콘솔은 항상 text)
+log_listener = configure_logging(
+    LOG_FILE, level=LOG_LEVEL, console_level=os.getenv('LOG_CONSOLE_LEVEL', 'INFO').upper(),
+    json_format=LOG_FORMAT == 'json',
+    sample_rates=parse_category_map(os.getenv('LOG_SAMPLE_RATES')),
+    rate_limits=parse_category_map(os.getenv('LOG_RATE_LIMITS')),
+)
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# 파일 핸들러 (로그 파일에 기록)
-file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1024 * 1024 * 5, backupCount=5, encoding='utf-8') # 5MB, 5개 파일 순환
-file_handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-
-# 콘솔 핸들러 (터미널에도 출력 - 개발 중 확인용)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO) # 콘솔에는 INFO 레벨 이상만 (너무 많은 디버그 로그 방지)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+# STARTUP_PROFILE=1 이면 서버 시작/미리 데우기 단계별 소요 시간을 INFO 로그로 남깁니다. (/healthz?verbose=1 에서도 확인 가능)
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '0') == '1'
+startup_profile.mark('logging')
 
 # --- 초기 설정 ---
-load_dotenv(dotenv_path='api_key.env')
 
 app = Flask(__name__)
 app.config.update(
@@ -55,63 +86,159 @@ if not app.secret_key:
     logger.warning("경고: FLASK_SECRET_KEY 환경 변수가 설정되지 않았습니다. 임시 키를 사용합니다. 서버 재시작 시 세션이 초기화됩니다.")
     app.secret_key = os.urandom(24) # 개발용 임시 키
 
+# --- 서버 측 세션 저장소 설정 ---
+# 쿠키에는 세션 ID만 저장하고, 게임 로그/캐릭터 데이터는 서버 측 저장소에 보관합니다.
+# SESSION_BACKEND=memory (기본, 프로세스 메모리 LRU) 또는 sqlite (재시작 후에도 유지, 여러 워커 간 공유)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '1000'))
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH') # 비어 있으면 backend/sessions.db 사용
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(60 * 60 * 24 * 7))) # 기본 7일
+# 캠페인 로그: 턴을 타입 이벤트(행동/판정/GM 서술)로 기록합니다. 세션 상태에는 최근 이벤트만 두고
+# CAMPAIGN_EVENT_CHUNK개마다 스냅샷과 함께 `<sid>:events:<n>` 키로 옮기므로 세션 크기가 일정합니다.
+# 옮긴 묶음은 세션 상태와 별도의 저장소(sqlite면 campaign_archive 테이블)에 두어, 진행 중인 캠페인들의 묶음이
+# 세션 LRU에서 서로를 밀어내지 않게 합니다. memory 저장소일 때는 CAMPAIGN_ARCHIVE_MAX_ENTRIES개까지 보관하고,
+# sqlite는 자체 TTL 없이 세션이 정리되거나 새 캐릭터로 바뀔 때 그 세션의 묶음(과 스토리 메모리)을 함께 지웁니다.
+CAMPAIGN_EVENT_CHUNK = int(os.getenv('CAMPAIGN_EVENT_CHUNK', '50'))
+CAMPAIGN_ARCHIVE_MAX_ENTRIES = int(os.getenv('CAMPAIGN_ARCHIVE_MAX_ENTRIES', '20000'))
+campaign_archive = create_session_store(
+    SESSION_BACKEND, max_sessions=CAMPAIGN_ARCHIVE_MAX_ENTRIES, path=SESSION_DB_PATH, table='campaign_archive'
+)
+campaign_log = CampaignLog(campaign_archive, chunk_size=CAMPAIGN_EVENT_CHUNK)
+
+def _drop_session_data(sid, state):
+    """더 이상 쓰지 않는 세션에 딸린 보관 데이터(이벤트 묶음, 스토리 메모리)를 지웁니다."""
+    if isinstance(state, dict) and 'event_seq' in state:
+        campaign_log.delete(sid, state)
+    story_memory.delete(sid)
+
+session_store = create_session_store(
+    SESSION_BACKEND, max_sessions=SESSION_MAX_ENTRIES, path=SESSION_DB_PATH, ttl_seconds=SESSION_TTL_SECONDS,
+    on_expire=_drop_session_data
+)
+logger.info(f"세션 저장소: {SESSION_BACKEND}")
+startup_profile.mark('session_store')
+
 # +++ 테스트 모드 플래그 +++
-# True로 설정하면 실제 AI를 호출하지 않고 가짜 응답을 반환합니다.
-TEST_MODE = False
+# TEST_MODE=1 이면 실제 AI를 호출하지 않고 로컬 대체 모델(fake_model)이 가짜 응답을 반환합니다.
+# API 키 없이 개발하거나 benchmark.py로 서버 처리량/지연을 측정할 때 사용합니다.
+TEST_MODE = os.getenv('TEST_MODE', '0') == '1'
 
 # --- Gemini API 설정 ---
-if not TEST_MODE:
+# 서술이 중요한 턴은 Pro 모델, 판정 여부만 정하면 되는 짧은 행동은 빠른 모델(GEMINI_FAST_MODEL)이 처리합니다.
+GEMINI_MODEL_NAME = 'models/gemini-2.5-pro'
+GEMINI_FAST_MODEL_NAME = os.getenv('GEMINI_FAST_MODEL', 'models/gemini-2.5-flash')
+
+def _fake_model(latency_ms):
+    # 대체 모델의 지연 분포/오류율/출력 크기 (응답 내용은 get_mock_response 기반)
+    return FakeGenerativeModel(
+        lambda prompt_text: _mock_model_reply(prompt_text),
+        latency_ms=latency_ms,
+        latency_distribution=os.getenv('FAKE_MODEL_LATENCY_DIST', 'lognormal'),
+        error_rate=float(os.getenv('FAKE_MODEL_ERROR_RATE', '0')),
+        story_chars=int(os.getenv('FAKE_MODEL_STORY_CHARS', '0')),
+        seed=int(os.environ['FAKE_MODEL_SEED']) if os.getenv('FAKE_MODEL_SEED') else None,
+    )
+
+if TEST_MODE:
+    FAKE_MODEL_LATENCY_MS = float(os.getenv('FAKE_MODEL_LATENCY_MS', '800'))
+    model = _fake_model(FAKE_MODEL_LATENCY_MS)
+    fast_model = _fake_model(float(os.getenv('FAKE_MODEL_FAST_LATENCY_MS', str(FAKE_MODEL_LATENCY_MS / 4))))
+    logger.info(f"TEST_MODE: 로컬 대체 모델 사용 (평균 지연 {model.latency_ms}ms/빠른 모델 {fast_model.latency_ms}ms, {model.latency_distribution}, 오류율 {model.error_rate})")
+else:
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     if not GEMINI_API_KEY:
         logger.error("GEMINI_API_KEY 환경 변수가 설정되지 않았습니다. .env 파일을 확인해주세요.")
         raise ValueError("GEMINI_API_KEY 환경 변수가 설정되지 않았습니다. .env 파일을 확인해주세요.")
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('models/gemini-2.5-pro')
+
+    def _gemini_model(model_name):
+        def factory():
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            return genai.GenerativeModel(model_name)
+        return factory
+
+    # SDK import와 모델 생성은 첫 호출(또는 /warmup, 시작 후 백그라운드 데우기) 때 수행합니다.
+    def _record_model_load(name, seconds):
+        startup_profile.record(f'model_load.{name}', seconds)
+        logger.info(f"모델 클라이언트 생성: {name} ({seconds * 1000:.0f}ms)")
+    model = LazyModel(_gemini_model(GEMINI_MODEL_NAME), GEMINI_MODEL_NAME, on_load=_record_model_load)
+    fast_model = LazyModel(_gemini_model(GEMINI_FAST_MODEL_NAME), GEMINI_FAST_MODEL_NAME, on_load=_record_model_load)
+
+# --- LLM 호출 계층 설정 ---
+# 모델 호출은 전용 스레드 풀에서 실행되며, 동시 호출 수/마감 시간/재시도 정책을 여기서 조정합니다.
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '4'))
+LLM_TURN_DEADLINE_SECONDS = float(os.getenv('LLM_TURN_DEADLINE_SECONDS', '60'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+llm_client = LLMClient(
+    model, name='pro',
+    max_in_flight=LLM_MAX_IN_FLIGHT, default_deadline=LLM_TURN_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES
+)
+fast_llm_client = LLMClient(
+    fast_model, name='fast', max_in_flight=int(os.getenv('LLM_FAST_MAX_IN_FLIGHT', str(LLM_MAX_IN_FLIGHT))),
+    default_deadline=LLM_TURN_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES
+)
+
+# --- 모델 라우팅 ---
+# MODEL_ROUTING=auto 이면 행동 문장을 분류해 계층을 고르고, fast/pro 이면 모든 행동 턴에 그 계층을 씁니다.
+# 로어북의 `## 모델 라우팅` 섹션(- 행동 턴 / - 판정 턴 / - 짧은 행동 글자 수 / - 서술 키워드)으로 로어북마다 바꿀 수 있습니다.
+# 비용은 100만 토큰당 달러 '입력,출력' 추정치로, /llm-status와 /metrics의 계층별 비용 집계에만 쓰입니다.
+MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'auto')
+model_router = ModelRouter(
+    [
+        ModelTier('fast', fast_llm_client, GEMINI_FAST_MODEL_NAME, *parse_cost(os.getenv('MODEL_COST_FAST'), '0.30,2.50')),
+        ModelTier('pro', llm_client, GEMINI_MODEL_NAME, *parse_cost(os.getenv('MODEL_COST_PRO'), '1.25,10')),
+    ],
+    default_policy=RoutingPolicy(
+        action_mode=MODEL_ROUTING,
+        roll_tier=os.getenv('MODEL_ROUTING_ROLL_TIER', 'pro'),
+        max_fast_action_chars=int(os.getenv('MODEL_ROUTING_FAST_MAX_CHARS', '40')),
+    ),
+)
+logger.info(f"모델 라우팅: {MODEL_ROUTING} (fast={GEMINI_FAST_MODEL_NAME}, pro={GEMINI_MODEL_NAME})")
+startup_profile.mark('model_clients')
 
 # --- Lorebook 불러오기 ---
-def parse_lorebook(content):
-    """Parses the lorebook markdown content into a dictionary."""
-    sections = {}
-    # H2 (##)를 기준으로 섹션 분리
-    parts = content.split('\n## ')
-    for part in parts:
-        if not part.strip():
-            continue
-        
-        lines = part.strip().splitlines()
-        # 제목에서 '##' 와 앞뒤 공백을 모두 제거
-        section_title = lines[0].strip().lstrip('#').strip()
-        # --- 추가된 디버깅 로그 ---
-        logger.info(f"Cleaned section title: '[{section_title}]'")
-        section_content = '\n'.join(lines[1:]).strip()
-
-        if section_title == '시작 설정':
-            settings = {}
-            import re
-            # 수정된 정규식: 굵은 글씨(**)가 있어도 되고 없어도 되도록 변경
-            # 포맷: - 키: 값  또는  - **키**: 값
-            # (?=\s*-\s*|\Z)는 다음 항목 시작 또는 문자열 끝까지를 값으로 봄
-            pattern = re.compile(r'^\s*-\s*(?:\*\*)?(.*?)(?:\*\*)?:\s*(.*?)(?=\s*-\s*|\Z)', re.DOTALL | re.MULTILINE)
-            matches = pattern.findall(section_content)
-            for key, value in matches: # _는 lookahead 그룹 무시
-                settings[key.strip()] = value.strip()
-            sections[section_title] = settings
-        elif section_title:
-            sections[section_title] = section_content
-            
-    return sections
-
-LOREBOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lorebook.md')
-LOREBOOK_DATA = {}
-try:
-    with open(LOREBOOK_PATH, 'r', encoding='utf-8') as f:
-        lorebook_content = f.read()
-        LOREBOOK_DATA = parse_lorebook(lorebook_content)
-        logger.info(f"Lorebook loaded and parsed successfully. Sections: {list(LOREBOOK_DATA.keys())}")
-except FileNotFoundError:
-    logger.warning(f"{LOREBOOK_PATH} not found. AI will operate without lorebook context.")
-except Exception as e:
-    logger.error(f"Error parsing lorebook: {e}")
+# backend 폴더(또는 LOREBOOK_DIR)의 모든 lorebook*.md를 색인하고, 파일이 바뀌면 자동으로 다시 읽습니다.
+# 세션마다 /create-character 요청의 'lorebook' 값으로 로어북을 고를 수 있습니다.
+LOREBOOK_DIR = os.getenv('LOREBOOK_DIR', os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOREBOOK_ID = os.getenv('DEFAULT_LOREBOOK', 'lorebook')
+LOREBOOK_RELOAD_INTERVAL_SECONDS = float(os.getenv('LOREBOOK_RELOAD_INTERVAL_SECONDS', '2'))
+# 로어북 파싱/색인은 첫 요청 또는 미리 데우기(warm_up) 때 수행합니다.
+lorebook_registry = LorebookRegistry(
+    LOREBOOK_DIR, default_id=DEFAULT_LOREBOOK_ID, check_interval=LOREBOOK_RELOAD_INTERVAL_SECONDS, lazy=True
+)
+
+# 로어북을 찾을 수 없을 때 사용할 빈 템플릿
+EMPTY_PROMPT_TEMPLATES = compile_prompt_templates({})
+
+# 턴마다 플레이어 행동/위치/상황과 관련된 로어북 조각을 검색해 프롬프트에 넣습니다.
+LORE_TOP_K = int(os.getenv('LORE_TOP_K', '4'))
+LORE_TOKEN_BUDGET = int(os.getenv('LORE_TOKEN_BUDGET', '600'))
+
+# 프롬프트 전체 토큰 예산: 넘으면 관련 로어북 조각 → 스토리 요약 → 인벤토리 목록 순으로 줄입니다. 0이면 줄이지 않고 크기만 집계.
+# PROMPT_TOKEN_COUNTER=api 이면 Gemini count_tokens로 세고(결과 캐시), 기본값 estimate는 로컬 추정치를 씁니다.
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '6000'))
+PROMPT_TOKEN_COUNTER = os.getenv('PROMPT_TOKEN_COUNTER', 'estimate')
+if PROMPT_TOKEN_COUNTER == 'api' and not TEST_MODE:
+    token_counter = TokenCounter(lambda text: model.count_tokens(text).total_tokens, name='api')
+else:
+    token_counter = TokenCounter()
+prompt_budget = PromptBudget(PROMPT_TOKEN_BUDGET, token_counter)
+
+# 구조화 출력: 턴 응답 JSON의 스키마(turn_schema.py)를 모델에 함께 보내 스키마에 맞는 JSON만 생성하게 합니다.
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', '1') == '1'
+turn_generation_config = TURN_GENERATION_CONFIG if STRUCTURED_OUTPUT else None
+
+# PROMPT_CONTEXT_CACHE=1 이면 프롬프트 고정 부분을 Gemini 캐시 컨텍스트로 등록해 재사용합니다.
+# (prefix가 모델의 최소 캐시 토큰 수보다 짧으면 자동으로 전체 프롬프트 전송으로 돌아갑니다.)
+PROMPT_CONTEXT_CACHE = os.getenv('PROMPT_CONTEXT_CACHE', '0') == '1'
+PROMPT_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv('PROMPT_CONTEXT_CACHE_TTL_SECONDS', '3600'))
+prefix_context_caches = {} # 모델 계층 -> PrefixContextCache (캐시 컨텍스트는 모델마다 따로 등록해야 함)
+if PROMPT_CONTEXT_CACHE and not TEST_MODE:
+    prefix_context_caches = {
+        tier.name: PrefixContextCache(tier.model_name, ttl_seconds=PROMPT_CONTEXT_CACHE_TTL_SECONDS)
+        for tier in model_router.tiers.values()
+    }
 
 # --- 게임 상태 관리 ---
 # 세션에 캐릭터 데이터가 없을 때 사용될 기본 캐릭터 데이터
@@ -127,6 +254,58 @@ DEFAULT_PLAYER_CHARACTER = {
     'maxSp': 5
 }
 
+def _turn_trace():
+    """현재 요청에서 처리 중인 턴의 TurnTrace. 턴 요청이 아니면 None."""
+    return g.get('turn_trace')
+
+def _turn_span(phase):
+    """현재 턴의 단계 소요 시간을 기록하는 context manager. 턴 요청이 아니면 아무것도 하지 않습니다."""
+    trace = _turn_trace()
+    return trace.span(phase) if trace is not None else nullcontext()
+
+def _load_game_state():
+    """쿠키의 세션 ID로 서버 측 저장소에서 게임 상태를 불러옵니다."""
+    sid = session.get('sid')
+    state = session_store.load(sid) if sid else None
+    if state is None:
+        return campaign_log.new_state(DEFAULT_PLAYER_CHARACTER, DEFAULT_LOREBOOK_ID)
+    state.setdefault('character_data', copy.deepcopy(DEFAULT_PLAYER_CHARACTER))
+    state.setdefault('pending_action_for_roll', None)
+    state.setdefault('lorebook_id', DEFAULT_LOREBOOK_ID)
+    return campaign_log.upgrade(sid, state)  # game_log로 저장된 이전 형식의 세션은 이벤트 로그로 옮김
+
+def _record_event(state, event):
+    """이벤트를 캠페인 로그에 기록하고 게임 상태에 적용합니다."""
+    return campaign_log.append(_ensure_session_id(), state, event)
+
+def _log_view(state, sid=None):
+    """이벤트 로그를 HTML 줄 목록처럼 읽는 보기 (스토리 요약/메모리용)."""
+    return LogView(campaign_log, sid or session.get('sid'), state)
+
+def _get_session_lorebook(state):
+    """세션이 선택한 로어북을 반환합니다. 로어북이 사라졌으면 기본 로어북을 사용합니다."""
+    return lorebook_registry.get_or_default(state.get('lorebook_id'))
+
+def _ensure_session_id():
+    """쿠키에 세션 ID가 없으면 새로 발급하고, 세션 ID를 반환합니다."""
+    sid = session.get('sid')
+    if not sid:
+        sid = new_session_id()
+        session['sid'] = sid
+    return sid
+
+def _save_game_state(state):
+    """게임 상태를 서버 측 저장소에 저장합니다. 세션 ID가 없으면 새로 발급합니다."""
+    sid = _ensure_session_id()
+    with _turn_span('session_save'):
+        size = session_store.save(sid, state)
+    trace = _turn_trace()
+    if trace is not None:
+        trace.sizes['session_bytes'] = size
+    logger.debug("세션 상태 저장됨: sid=%s…, %s bytes, 이벤트 %s개 (최근 %s개)", sid[:6], size, state.get('event_seq', 0),
+                 len(state.get('recent_events', [])), extra={'category': 'state'})
+    return size
+
 def calculate_resources(stats):
     """주어진 능력치를 기반으로 최대 HP와 SP를 계산합니다."""
     strength = stats.get('strength', 1)
@@ -137,23 +316,27 @@ def calculate_resources(stats):
     
     return {'max_hp': max_hp, 'max_sp': max_sp}
 
-# --- 수정치 계산 함수 (사용자 피드백 반영) ---
-def get_modifier(stat_value):
-    if stat_value >= 3: return 1
-    elif stat_value >= 2: return 0
-    else: return -1 # 1일 때 -1
-
 
 def parse_ai_response(response_text):
-    try:
-        json_str_start = response_text.find("```json")
-        json_str_end = response_text.rfind("```")
-        if json_str_start != -1 and json_str_end != -1:
-            json_payload = response_text[json_str_start + len("```json"):json_str_end].strip()
-            return json.loads(json_payload)
-    except Exception as e:
-        logger.error(f"AI 응답 파싱 오류: {e}\n응답 내용: {response_text}")
-        return {"story": f"GM: AI 응답 파싱 오류. 응답 내용: {response_text}", "require_roll": False, "roll_stat": None}
+    """AI 응답에서 턴 JSON을 읽어 스키마에 맞게 정규화합니다.
+
+    코드 펜스가 없거나, 출력이 잘렸거나, 약간 깨진 JSON도 복구해서 읽습니다 (복구했으면 parse_repaired 표시).
+    JSON을 전혀 찾을 수 없으면 응답 텍스트를 그대로 story로 사용하고 parse_error를 표시합니다.
+    """
+    data, repaired = loads_tolerant(response_text or '')
+    ai_json = normalize_turn_response(data)
+    if ai_json is not None:
+        if repaired:
+            logger.warning(f"AI 응답 JSON을 복구해서 사용합니다. 응답 길이: {len(response_text)}")
+            ai_json['parse_repaired'] = True
+        return ai_json
+
+    logger.error(f"AI 응답 파싱 오류: JSON 객체를 찾을 수 없습니다. 응답: {blob_ref(response_text)}", extra={'response_head': (response_text or '')[:200]})
+    story = re.sub(r'```(?:json)?', '', response_text or '').strip()
+    return {
+        "story": story or "GM: AI 응답을 해석할 수 없습니다. 다시 시도해주세요.",
+        "require_roll": False, "roll_stat": None, "parse_error": True
+    }
 
 
 def get_mock_response(turn_type, player_action=None, modifier_stat=None, player_char_name='탐험가'):
@@ -167,38 +350,52 @@ def get_mock_response(turn_type, player_action=None, modifier_stat=None, player_
     elif turn_type == 'roll':
         return { "story": f"[테스트 모드] {modifier_stat} 판정 결과, {player_char_name}님, 당신은 멋지게 성공했습니다! 문이 열립니다.", "require_roll": False, "roll_stat": None, "hp_change": -2, "add_inventory": ["녹슨 기어"] }
 
+_FALLBACK_ROLL_STORIES = {
+    "완전한 성공": "{name}님의 시도는 깔끔하게 성공합니다. 상황이 원하는 방향으로 움직이기 시작합니다.",
+    "대가를 치르는 성공": "{name}님은 원하는 바를 이루지만, 대가가 따릅니다. 무언가가 뜻대로 되지 않았다는 느낌이 남습니다.",
+    "실패": "{name}님의 시도는 실패로 돌아갑니다. 상황을 다시 살피고 다른 방법을 찾아야 합니다.",
+}
 
-def apply_state_changes(character, changes):
-    """AI 응답에 따라 캐릭터의 상태(HP, SP, 인벤토리)를 변경합니다."""
-    # HP 변경
-    hp_change = changes.get('hp_change', 0)
-    if hp_change != 0:
-        character['hp'] = max(0, min(character['maxHp'], character['hp'] + hp_change))
-
-    # SP 변경
-    sp_change = changes.get('sp_change', 0)
-    if sp_change != 0:
-        character['sp'] = max(0, min(character['maxSp'], character['sp'] + sp_change))
-
-    # 인벤토리 추가
-    items_to_add = changes.get('add_inventory', [])
-    if items_to_add:
-        character['inventory'].extend(items_to_add)
-        # 중복 제거 (선택 사항)
-        character['inventory'] = sorted(list(set(character['inventory'])))
-
-    # 인벤토리 제거
-    items_to_remove = changes.get('remove_inventory', [])
-    if items_to_remove:
-        for item in items_to_remove:
-            if item in character['inventory']:
-                character['inventory'].remove(item)
-    
-    logger.debug(f"캐릭터 상태 변경 적용됨: {character}")
-    return character
+def get_fallback_response(turn_type, player_action=None, modifier_stat=None, player_char_name='탐험가', roll_outcome=None):
+    """모델이 턴 마감 시각까지 응답하지 못했을 때 쓰는 로컬 GM 응답 (degraded).
 
-def _create_story_summary(player_char, game_log_session):
-    """현재 게임 상태를 기반으로 AI를 위한 요약 객체를 생성합니다."""
+    get_mock_response와 같은 방식으로 행동 키워드만 보고 판정 여부를 정하며, 체력/인벤토리/장소는 바꾸지 않습니다.
+    """
+    if turn_type == 'action':
+        roll_stat = get_mock_response('action', player_action=player_action)['roll_stat'] or classify_action(player_action)[1]
+        if roll_stat:
+            story = f"{player_char_name}님이 '{player_action}' 행동을 시도합니다. 결과는 '{STAT_MAPPING_KO[roll_stat]}' 판정에 달려 있습니다."
+        else:
+            story = f"{player_char_name}님이 '{player_action}' 행동을 합니다. 주변은 잠시 고요합니다. 다음 행동을 이어가 주세요."
+        response = {"story": story, "require_roll": roll_stat is not None, "roll_stat": roll_stat}
+    else:
+        story = _FALLBACK_ROLL_STORIES.get(roll_outcome, _FALLBACK_ROLL_STORIES["실패"]).format(name=player_char_name)
+        response = {"story": story, "require_roll": False, "roll_stat": None}
+    response['story'] = f"(GM의 응답이 늦어져 간단히 진행합니다) {response['story']}"
+    response['degraded'] = True
+    return response
+
+_MOCK_ACTION_PATTERN = re.compile(r'Player\'s Last Action: "(.*)"')
+_MOCK_PLAYER_PATTERN = re.compile(r"# Player: '(.*?)'")
+_MOCK_STAT_PATTERN = re.compile(r'Stat: (.*?), Modifier')
+
+def _mock_model_reply(prompt_text):
+    """TEST_MODE의 대체 모델용 응답. 프롬프트 종류(행동/판정/메모리 요약)를 보고 get_mock_response를 호출합니다."""
+    if '[TRPG CAMPAIGN MEMORY' in prompt_text:
+        # 메모리 요약 요청에는 이전 요약을 그대로 돌려줌
+        previous = prompt_text.split('# --- Previous Memory ---', 1)[-1].split('# --- New Log Entries ---', 1)[0]
+        return json.loads(previous)
+    player = _MOCK_PLAYER_PATTERN.search(prompt_text)
+    player_char_name = player.group(1) if player else '탐험가'
+    if '[ROLL CONTINUITY RULE' in prompt_text:
+        stat = _MOCK_STAT_PATTERN.search(prompt_text)
+        return get_mock_response('roll', modifier_stat=stat.group(1) if stat else None, player_char_name=player_char_name)
+    action = _MOCK_ACTION_PATTERN.search(prompt_text)
+    return get_mock_response('action', player_action=action.group(1) if action else None, player_char_name=player_char_name)
+
+
+def _create_story_summary(player_char, game_log_session, sid=None):
+    """현재 게임 상태와 누적 스토리 메모리를 기반으로 AI를 위한 요약 객체를 생성합니다."""
     
     # 마지막 GM 메시지 추출
     last_gm_message = "게임 시작."
@@ -207,27 +404,105 @@ def _create_story_summary(player_char, game_log_session):
             # HTML 태그 제거
             last_gm_message = msg.replace("<strong>GM:</strong>", "").strip()
             break
-            
-    # 해결되지 않은 위협 추론 (간단한 키워드 기반)
-    unresolved_threats = []
+
+    # N턴마다 백그라운드에서 갱신되는 구조화 요약 + 아직 요약에 반영되지 않은 최근 로그
+    memory = story_memory.get(sid)['summary']
+    recent_log = [strip_log_markup(entry) for entry in story_memory.pending_entries(sid, game_log_session)]
+
+    # 해결되지 않은 위협: 메모리에 없으면 간단한 키워드 기반으로 추론
+    unresolved_threats = list(memory['threats'])
     scenario_state_lower = player_char.get('current_scenario_state', '').lower()
-    if any(keyword in scenario_state_lower for keyword in ["추적", "위협", "전투", "다가오는"]):
+    if not unresolved_threats and any(keyword in scenario_state_lower for keyword in ["추적", "위협", "전투", "다가오는"]):
         unresolved_threats.append(player_char.get('current_scenario_state'))
 
     story_so_far = {
         "current_goal": player_char.get('current_scenario_state', '플레이어의 다음 행동을 기다리는 중'),
+        "campaign_goals": memory['goals'],
+        "key_events_so_far": memory['key_events'],
+        "recent_log": recent_log,
         "last_key_event": last_gm_message,
         "unresolved_threats": unresolved_threats if unresolved_threats else ["특별한 위협 없음."],
-        "open_questions": ["다가오는 위협의 정체는 무엇인가?", "이 통로는 어디로 이어지는가?"] # 예시
+        "npcs_met": memory['npcs_met'],
+        "items_gained": memory['items_gained'],
+        "open_questions": memory['open_questions']
     }
     return story_so_far
 
+def _summarize_log_entries(previous_summary, new_entries):
+    """스토리 메모리 갱신용 요약기. 백그라운드 스레드에서 호출됩니다."""
+    response = memory_llm_client.generate(build_summary_prompt(previous_summary, new_entries), safety_settings=safety_settings)
+    summary, _ = loads_tolerant(response.text)
+    return summary
+
+# 응답 캐시: 같은 (모델, 전체 프롬프트, 생성 설정)에 대한 응답을 재사용합니다. 0이면 끔.
+# 요청 본문에 "no_cache": true를 넣거나 Cache-Control: no-cache 헤더를 보내면 해당 요청만 캐시를 건너뜁니다.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '600'))
+RESPONSE_CACHE_DISK_PATH = os.getenv('RESPONSE_CACHE_DISK_PATH') # 설정하면 SQLite 디스크 계층 사용
+response_cache = None
+if RESPONSE_CACHE_MAX_ENTRIES > 0:
+    response_cache = ResponseCache(
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, disk_path=RESPONSE_CACHE_DISK_PATH
+    )
+
+# 턴 성능 지표: 단계별 소요 시간, 토큰 수, 세션 크기를 /metrics로 내보냅니다.
+# SLOW_TURN_LOG_SECONDS(초)보다 오래 걸린 턴은 단계별 내역과 함께 경고 로그로 남깁니다. 0이면 끔.
+SLOW_TURN_LOG_SECONDS = float(os.getenv('SLOW_TURN_LOG_SECONDS', '0'))
+turn_metrics = TurnMetrics(slow_turn_seconds=SLOW_TURN_LOG_SECONDS)
+turn_metrics.add_gauge('trpg_llm_queue_depth', 'Model calls waiting for a free slot', lambda: llm_client.queue_depth)
+turn_metrics.add_gauge('trpg_llm_in_flight', 'Model calls in progress', lambda: llm_client.stats()['in_flight'])
+for router_metric in model_router.metrics:
+    turn_metrics.add_metric(router_metric)
+if response_cache is not None:
+    turn_metrics.add_gauge('trpg_response_cache_hit_ratio', 'Response cache hit ratio', lambda: response_cache.stats()['hit_ratio'])
+
+# 스토리 메모리: MEMORY_UPDATE_EVERY_TURNS턴마다 새 로그만 요약해 구조화 요약을 갱신합니다.
+# 요약 호출은 턴 처리용 호출 슬롯을 차지하지 않도록 별도 클라이언트(동시 1개)를 사용합니다.
+MEMORY_UPDATE_EVERY_TURNS = int(os.getenv('MEMORY_UPDATE_EVERY_TURNS', '4'))
+MEMORY_MAX_ITEMS = int(os.getenv('MEMORY_MAX_ITEMS', '8'))
+memory_llm_client = LLMClient(
+    llm_client.model, name='memory', max_in_flight=1,
+    default_deadline=LLM_TURN_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES
+)
+# 요약은 세션 상태 LRU 대신 캠페인 보관 저장소에 두어 진행 중인 세션을 밀어내지 않게 합니다 (세션/방이 정리될 때 함께 지움).
+story_memory = StoryMemory(
+    campaign_archive, _summarize_log_entries,
+    update_every_turns=MEMORY_UPDATE_EVERY_TURNS, max_items=MEMORY_MAX_ITEMS
+)
 
-@app.route('/create-character', methods=['POST'])
-def create_character():
-    # 전역 변수 game_log 및 pending_action_for_roll은 session에서 관리되므로 global 선언 필요 없음
-    data = request.get_json()
-    
+# 판정 결과 추측 생성: SPECULATIVE_ROLLS=1 이면 행동 턴이 판정을 요구할 때 주사위를 서버에서 바로 확정하고,
+# 플레이어가 판정 버튼을 누르기 전에 판정 결과 서술을 미리 생성합니다. 쓰이지 않은 생성은 취소/집계됩니다.
+SPECULATIVE_ROLLS = os.getenv('SPECULATIVE_ROLLS', '0') == '1'
+SPECULATIVE_MAX_IN_FLIGHT = int(os.getenv('SPECULATIVE_MAX_IN_FLIGHT', '2'))
+roll_speculator = None
+if SPECULATIVE_ROLLS:
+    # 추측 생성이 실제 턴의 호출 슬롯을 차지하지 않도록 별도 클라이언트를 사용합니다.
+    speculation_llm_client = LLMClient(
+        llm_client.model, name='speculative', max_in_flight=SPECULATIVE_MAX_IN_FLIGHT,
+        default_deadline=LLM_TURN_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES
+    )
+    roll_speculator = RollSpeculator(speculation_llm_client, max_age_seconds=LLM_TURN_DEADLINE_SECONDS * 5)
+
+# 턴 지연 상한(SLO): 턴마다 TURN_SLO_SECONDS초 안에 응답합니다 (0이면 끄고 LLM_TURN_DEADLINE_SECONDS까지 기다림).
+# 모델 응답이 최근 지연의 TURN_HEDGE_QUANTILE 분위수(표본이 적으면 TURN_HEDGE_AFTER_SECONDS초)를 넘기면
+# TURN_HEDGE_TIER 계층으로 헤지 요청을 보내고, 마감 시각을 넘기면 로컬 대체 GM 응답으로 처리합니다.
+# 헤지 요청은 따로 과금되는 모델 호출이므로 기본값은 'none'(헤지하지 않고 마감만 지킴)이며, 'fast' 등으로 켭니다.
+# 대체 응답을 보낸 턴의 실제 응답은 /late-answer/<id>로 받을 수 있고, 다음 턴에 게임 로그에 보충됩니다.
+TURN_SLO_SECONDS = float(os.getenv('TURN_SLO_SECONDS', '25'))
+turn_hedger = None
+late_answers = None
+if TURN_SLO_SECONDS > 0:
+    turn_hedger = Hedger(
+        model_router, hedge_tier=os.getenv('TURN_HEDGE_TIER', 'none'),
+        quantile=float(os.getenv('TURN_HEDGE_QUANTILE', '0.9')),
+        default_after=float(os.getenv('TURN_HEDGE_AFTER_SECONDS', '8')),
+    )
+    late_answers = LateAnswers(parse_ai_response, ttl_seconds=LLM_TURN_DEADLINE_SECONDS * 10)
+    turn_metrics.add_metric(turn_hedger.outcomes_total)
+
+
+def _build_character(data, lorebook):
+    """요청 데이터(이름, 능력치, 인벤토리, 설명)와 로어북 시작 설정으로 새 캐릭터 dict와 시작 메시지를 만듭니다."""
     char_name = data.get('name', DEFAULT_PLAYER_CHARACTER['name'])
     char_stats = data.get('stats', DEFAULT_PLAYER_CHARACTER['stats'])
     char_inventory = data.get('inventory', DEFAULT_PLAYER_CHARACTER['inventory'])
@@ -239,12 +514,7 @@ def create_character():
     max_sp = resources['max_sp']
 
     # 로어북에서 시작 설정 가져오기
-    start_settings = LOREBOOK_DATA.get('시작 설정', {})
-    # --- 디버깅 로그 추가 ---
-    logger.info(f"--- /create-character DEBUG ---")
-    logger.info(f"전체 LOREBOOK_DATA: {LOREBOOK_DATA}")
-    logger.info(f"추출된 start_settings: {start_settings}")
-    # --- 디버깅 로그 끝 ---
+    start_settings = lorebook.start_settings if lorebook else {}
     start_location = start_settings.get('시작 위치', '알 수 없는 장소')
     start_state = start_settings.get('시작 상황', '알 수 없는 상황')
     start_message = start_settings.get('시작 메시지', f"{char_name}님, 새로운 여정을 시작합니다.")
@@ -253,8 +523,7 @@ def create_character():
     if not scene_id:
         scene_id = "UNKNOWN_SCENE"
 
-    # 세션에 캐릭터 데이터 저장
-    session['character_data'] = {
+    character_data = {
         'name': char_name,
         'stats': char_stats,
         'inventory': char_inventory,
@@ -267,291 +536,976 @@ def create_character():
         'description': char_description, # Add this line
         'scene_id': scene_id # Scene Lock을 위한 ID 추가
     }
-    # 게임 상태도 세션에서 관리
-    session['game_log'] = [f"<strong>GM:</strong> {start_message}"] # 로어북 기반 시작 메시지
-    session['pending_action_for_roll'] = None
-    session.modified = True # 세션이 확실히 저장되도록 보장
+    return character_data, start_message
+
+def _lorebook_for_request(lorebook_id):
+    """요청한 로어북을 반환합니다. 기본 로어북 파일이 없으면 None(로어북 없이 진행), 없는 로어북이면 KeyError."""
+    if lorebook_id in lorebook_registry:
+        return lorebook_registry.get(lorebook_id)
+    if lorebook_id == DEFAULT_LOREBOOK_ID:
+        return None
+    raise KeyError(lorebook_id)
 
-    logger.info(f"캐릭터 생성됨 (세션): {session['character_data']['name']}, 능력치: {session['character_data']['stats']}, 인벤토리: {session['character_data']['inventory']}, HP: {max_hp}, SP: {max_sp}")
+@app.route('/create-character', methods=['POST'])
+def create_character():
+    # 게임 로그(이벤트)와 pending_action_for_roll은 서버 측 세션 상태에서 관리되므로 global 선언 필요 없음
+    data = request.get_json()
+    seed = data.get('seed')
+    if seed is not None:
+        # 시드를 고르면 판정 눈을 미리 알 수 있으므로 클라이언트가 정한 시드는 TEST_MODE에서만 받음
+        if not TEST_MODE:
+            return jsonify({"status": "error", "message": "seed는 TEST_MODE에서만 지정할 수 있습니다."}), 400
+        if not isinstance(seed, (int, str)) or isinstance(seed, bool) or not str(seed).strip():
+            return jsonify({"status": "error", "message": "seed는 정수나 문자열이어야 합니다."}), 400
+    lorebook_id = data.get('lorebook') or DEFAULT_LOREBOOK_ID
+    try:
+        lorebook = _lorebook_for_request(lorebook_id)
+    except KeyError:
+        return jsonify({"status": "error", "message": f"로어북을 찾을 수 없습니다: {lorebook_id}"}), 400
+
+    # 로어북 본문은 로그에 그대로 남기지 않고 해시로 가리킵니다.
+    if logger.isEnabledFor(logging.DEBUG):  # 로어북 본문 해시는 DEBUG일 때만 계산
+        logger.debug("선택된 로어북: %s (%s)", lorebook_id, blob_ref(lorebook.content) if lorebook else None, extra={'category': 'lore'})
+    character_data, start_message = _build_character(data, lorebook)
+
+    # 새 게임마다 새 세션 ID를 발급하고, 서버 측 저장소에 캐릭터 데이터 저장
+    old_sid = session.get('sid')
+    old_state = session_store.load(old_sid) if old_sid else None
+    if old_state is not None:
+        # 이전 캠페인은 쿠키가 바뀌면 다시 쓸 수 없으므로 보관된 묶음과 함께 지움
+        _drop_session_data(old_sid, old_state)
+        session_store.delete(old_sid)
+    session.clear()
+    session['sid'] = new_session_id()
+    # 게임 상태도 서버 측 저장소에서 관리. 주사위 시드는 서버가 정하고, TEST_MODE(플레이테스트)에서만 지정할 수 있음
+    state = campaign_log.start(session['sid'], character_data, lorebook_id, start_message, seed=seed)
+    _save_game_state(state)
+
+    logger.info(f"캐릭터 생성됨 (세션): {character_data['name']}, 능력치: {character_data['stats']}, 인벤토리: {character_data['inventory']}, HP: {character_data['maxHp']}, SP: {character_data['maxSp']}")
     return jsonify({
-        "status": "success", 
+        "status": "success",
         "message": "캐릭터가 성공적으로 생성되었습니다.",
-        "character": session['character_data'],
-        "initial_message": f"<strong>GM:</strong> {start_message}"
+        "character": character_data,
+        "lorebook": {"id": lorebook_id, "title": lorebook.title if lorebook else None},
+        "initial_message": _log_view(state)[-1],
+        "version": state['event_seq']
     })
 
 
-def _create_story_summary(player_char, game_log_session):
-    """현재 게임 상태를 기반으로 AI를 위한 요약 객체를 생성합니다."""
-    
-    # 마지막 GM 메시지 추출
-    last_gm_message = "게임 시작."
-    for msg in reversed(game_log_session):
-        if msg.strip().startswith("<strong>GM:"):
-            # HTML 태그 제거
-            last_gm_message = msg.replace("<strong>GM:</strong>", "").strip()
-            break
-            
-    # 해결되지 않은 위협 추론 (간단한 키워드 기반)
-    unresolved_threats = []
-    scenario_state_lower = player_char.get('current_scenario_state', '').lower()
-    if any(keyword in scenario_state_lower for keyword in ["추적", "위협", "전투", "다가오는"]):
-        unresolved_threats.append(player_char.get('current_scenario_state'))
-
-    story_so_far = {
-        "current_goal": player_char.get('current_scenario_state', '플레이어의 다음 행동을 기다리는 중'),
-        "last_key_event": last_gm_message,
-        "unresolved_threats": unresolved_threats if unresolved_threats else ["특별한 위협 없음."],
-        "open_questions": ["다가오는 위협의 정체는 무엇인가?", "이 통로는 어디로 이어지는가?"] # 예시
+def _prompt_templates_for(lorebook):
+    return lorebook.templates if lorebook is not None else EMPTY_PROMPT_TEMPLATES
+
+def _retrieve_lore(lorebook, player_char, action_text):
+    """플레이어 행동, 현재 위치, 현재 상황과 관련된 로어북 조각을 토큰 예산 안에서 검색합니다."""
+    if lorebook is None or LORE_TOP_K <= 0:
+        return []
+    query = ' '.join(filter(None, [
+        action_text, player_char.get('location'), player_char.get('current_scenario_state')
+    ]))
+    chunks = lorebook.lore_index.search(query, k=LORE_TOP_K, token_budget=LORE_TOKEN_BUDGET)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("관련 로어북 조각: %s", [chunk.chunk_id for chunk in chunks], extra={'category': 'lore'})
+    return chunks
+
+def _build_action_prompt(lorebook, player_char, story_summary, player_action):
+    # 로어북에서 나오는 고정 부분(prefix)은 로어북을 읽을 때 미리 컴파일되어 있고, 여기서는 턴별 값만 채웁니다.
+    relevant_lore = _retrieve_lore(lorebook, player_char, player_action)
+    return _check_prompt_budget(_prompt_templates_for(lorebook).build_action_prompt(
+        player_char, story_summary, player_action, relevant_lore, budget=prompt_budget
+    ))
+
+def _build_roll_prompt(lorebook, player_char, story_summary, roll_info):
+    relevant_lore = _retrieve_lore(lorebook, player_char, roll_info['pending_action'])
+    return _check_prompt_budget(_prompt_templates_for(lorebook).build_roll_prompt(
+        player_char, story_summary, roll_info, relevant_lore, budget=prompt_budget
+    ))
+
+def _check_prompt_budget(prompt):
+    """프롬프트의 섹션별 토큰 내역을 로그로 남기고, 줄여도 예산을 넘으면 경고합니다."""
+    report = prompt.budget
+    if report is None:
+        return prompt
+    if report['over_budget']:
+        logger.warning(f"프롬프트가 토큰 예산을 넘었습니다: {report['total']}/{report['budget']} {json.dumps(report['sections'])}")
+    elif report['trimmed']:
+        logger.info(f"프롬프트를 예산에 맞춰 줄였습니다: {report['total']}/{report['budget']} trimmed={json.dumps(report['trimmed'])}",
+                    extra={'category': 'prompt'})
+    elif logger.isEnabledFor(logging.DEBUG):  # 섹션 내역 직렬화는 DEBUG일 때만
+        logger.debug("프롬프트 토큰: %s %s", report['total'], json.dumps(report['sections']), extra={'category': 'prompt'})
+    return prompt
+
+def _route_turn(turn_type, lorebook, player_action=None):
+    """이번 턴에 사용할 모델 계층('fast' 또는 'pro')을 고릅니다. 로어북의 `## 모델 라우팅` 설정을 따릅니다."""
+    policy = model_router.policy_for(lorebook.routing_settings if lorebook is not None else None)
+    tier, reason = model_router.route(turn_type, player_action, policy)
+    logger.debug("모델 계층: %s (%s)", tier, reason, extra={'category': 'turn'})
+    return tier
+
+def _model_call_args(prompt, tier='pro'):
+    """프롬프트 prefix가 캐시 컨텍스트로 등록되어 있으면 (동적 부분만, 캐시 모델)을, 아니면 (전체 프롬프트, None)을 반환합니다."""
+    context_cache = prefix_context_caches.get(tier)
+    if context_cache is not None:
+        cached_model = context_cache.get_model(prompt)
+        if cached_model is not None:
+            return prompt.suffix, cached_model
+    return prompt.text, None
+
+def _call_model(prompt, tier='pro', generation_config=None):
+    contents, cached_model = _model_call_args(prompt, tier)
+    with model_router.track(tier, prompt.text) as call:
+        response = model_router.tier(tier).client.generate(
+            contents, model=cached_model, safety_settings=safety_settings,
+            generation_config=generation_config or turn_generation_config
+        )
+        call.response_text = response.text
+    return response
+
+def _submit_model(prompt, tier):
+    """턴 프롬프트를 `tier` 계층에 비동기로 보내고 Future를 반환합니다. 턴 마감 시각이 지나도 호출은 계속되어 늦은 응답을 보관할 수 있습니다."""
+    contents, cached_model = _model_call_args(prompt, tier)
+    future = model_router.tier(tier).client.submit(
+        contents, model=cached_model, safety_settings=safety_settings, generation_config=turn_generation_config
+    )
+    model_router.track_future(tier, prompt.text, future)
+    return future
+
+def _start_model_stream(prompt, tier):
+    contents, cached_model = _model_call_args(prompt, tier)
+    handle = model_router.tier(tier).client.start_stream(
+        contents, model=cached_model, safety_settings=safety_settings, generation_config=turn_generation_config
+    )
+    model_router.track_future(tier, prompt.text, handle.future)
+    return handle
+
+def _turn_deadline_at():
+    """이번 턴의 마감 시각(time.monotonic 기준). 턴 지연 상한을 쓰지 않으면 None."""
+    return g.get('turn_deadline_at') if turn_hedger is not None else None
+
+def _call_turn_model(prompt, tier):
+    """턴 마감 시각이 있으면 헤지 요청을 섞어 마감 시각 안에 응답을 받습니다. 넘기면 TurnDeadlineExceeded."""
+    deadline_at = _turn_deadline_at()
+    if deadline_at is None:
+        return _call_model(prompt, tier)
+    return turn_hedger.call(tier, lambda t: _submit_model(prompt, t), deadline_at)
+
+def _response_cache_key(prompt, use_cache, tier='pro'):
+    """응답 캐시를 쓸 수 있으면 (모델, 전체 프롬프트, 생성 설정)의 해시 키를, 아니면 None을 반환합니다."""
+    if response_cache is None or not use_cache:
+        return None
+    settings = sorted((str(category), str(threshold)) for category, threshold in safety_settings.items())
+    return make_cache_key(model_router.tier(tier).model_name, prompt.text, [settings, STRUCTURED_OUTPUT])
+
+def _is_cacheable(ai_json):
+    # 파싱에 실패하거나 복구한 응답은 캐시하지 않아야 재시도 때 다시 모델을 호출합니다.
+    return isinstance(ai_json, dict) and not ai_json.get('parse_error') and not ai_json.get('parse_repaired')
+
+def _record_turn_tokens(prompt, response_text, cache_hit=False):
+    trace = _turn_trace()
+    if trace is not None:
+        if prompt.budget is not None:
+            trace.sizes['prompt_tokens'] = prompt.budget['total']
+            trace.prompt_sections = prompt.budget['sections']
+            trace.prompt_trimmed = list(prompt.budget['trimmed'])
+        else:
+            trace.sizes['prompt_tokens'] = estimate_tokens(prompt.text)
+        trace.sizes['response_tokens'] = estimate_tokens(response_text)
+        trace.cache_hit = cache_hit
+
+def _generate_turn_json(prompt, use_cache=True, tier='pro'):
+    """프롬프트에 대한 AI 응답 JSON을 반환합니다. 같은 프롬프트의 캐시된 응답이 있으면 모델을 호출하지 않습니다."""
+    cache_key = _response_cache_key(prompt, use_cache, tier)
+    if cache_key:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            logger.debug("응답 캐시 적중: %s", cache_key[:12], extra={'category': 'turn'})
+            _record_turn_tokens(prompt, cached_text, cache_hit=True)
+            with _turn_span('parse'):
+                return parse_ai_response(cached_text)
+
+    with _turn_span('model_call'):
+        response_text = _speculative_response_text(prompt)
+        if response_text is None:
+            response_text = _call_turn_model(prompt, tier).text
+    _record_turn_tokens(prompt, response_text)
+    with _turn_span('parse'):
+        ai_json = parse_ai_response(response_text)
+    if cache_key and _is_cacheable(ai_json):
+        response_cache.put(cache_key, response_text)
+    return ai_json
+
+def _stream_model(prompt, use_cache=True, tier='pro'):
+    """응답 텍스트 조각을 yield 합니다. 캐시 적중 시에는 캐시된 전체 응답을 한 번에 yield 합니다."""
+    cache_key = _response_cache_key(prompt, use_cache, tier)
+    if cache_key:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            _record_turn_tokens(prompt, cached_text, cache_hit=True)
+            yield cached_text
+            return
+
+    trace = _turn_trace()
+    started = time.perf_counter()
+    speculative_text = _speculative_response_text(prompt)
+    if speculative_text is not None:
+        if trace is not None:
+            trace.record('model_call', time.perf_counter() - started)
+        _record_turn_tokens(prompt, speculative_text)
+        if cache_key and _is_cacheable(parse_ai_response(speculative_text)):
+            response_cache.put(cache_key, speculative_text)
+        yield speculative_text
+        return
+
+    deadline_at = _turn_deadline_at()
+    if deadline_at is not None:
+        stream = turn_hedger.stream(
+            tier, lambda t: _start_model_stream(prompt, t), lambda t: _submit_model(prompt, t), deadline_at
+        )
+    else:
+        contents, cached_model = _model_call_args(prompt, tier)
+        stream = model_router.tier(tier).client.stream(
+            contents, model=cached_model, safety_settings=safety_settings, generation_config=turn_generation_config
+        )
+    chunks = []
+    with model_router.track(tier, prompt.text) if deadline_at is None else nullcontext() as call:
+        for text in stream:
+            if not chunks and trace is not None:
+                trace.record('model_first_token', time.perf_counter() - started)
+            chunks.append(text)
+            yield text
+        if call is not None:
+            call.response_text = ''.join(chunks)
+    if trace is not None:
+        trace.record('model_call', time.perf_counter() - started)
+
+    response_text = ''.join(chunks)
+    _record_turn_tokens(prompt, response_text)
+    if cache_key and _is_cacheable(parse_ai_response(response_text)):
+        response_cache.put(cache_key, response_text)
+
+def _speculative_response_text(prompt):
+    """이 프롬프트에 대해 미리 생성해 둔 응답이 있으면 (생성이 끝날 때까지 기다려) 텍스트를 반환합니다."""
+    if roll_speculator is None:
+        return None
+    future = roll_speculator.take(session.get('sid'), speculation_key(prompt))
+    if future is None:
+        return None
+    deadline_at = _turn_deadline_at()
+    timeout = max(0.0, deadline_at - time.monotonic()) if deadline_at is not None else LLM_TURN_DEADLINE_SECONDS
+    try:
+        return future.result(timeout=timeout).text
+    except FutureTimeoutError:
+        if deadline_at is None:
+            logger.info("미리 생성한 판정 결과가 마감 시간 안에 끝나지 않아 다시 생성합니다.")
+            return None
+        raise TurnDeadlineExceeded("미리 생성한 판정 결과를 턴 마감 시각까지 받지 못했습니다.", [future])
+    except Exception as e:
+        logger.info(f"미리 생성한 판정 결과를 사용할 수 없어 다시 생성합니다: {e}")
+        return None
+
+def _maybe_speculate_roll(sid, state):
+    """확정된 주사위가 있으면 판정 결과 서술을 백그라운드에서 미리 생성하기 시작합니다."""
+    committed_roll = state.get('committed_roll')
+    if roll_speculator is None or not committed_roll:
+        return
+    try:
+        # 여기서 만드는 프롬프트는 이번 턴의 처리 시간에 포함되지 않도록 단계 기록을 끕니다.
+        trace, g.turn_trace = g.get('turn_trace'), None
+        try:
+            prompt, roll_info = _prepare_roll_turn({'modifier_stat': committed_roll['stat']}, state)
+        finally:
+            g.turn_trace = trace
+        tier = roll_info['tier']
+        cache_key = _response_cache_key(prompt, True, tier)
+        if cache_key and response_cache.get(cache_key) is not None:
+            return  # 이미 캐시된 응답이 있으면 미리 생성할 필요 없음
+        contents, cached_model = _model_call_args(prompt, tier)
+        future = speculation_llm_client.submit(
+            contents, model=cached_model or model_router.tier(tier).client.model,
+            safety_settings=safety_settings, generation_config=turn_generation_config
+        )
+        model_router.track_future(tier, prompt.text, future)
+        roll_speculator.start(sid, speculation_key(prompt), future)
+    except Exception as e:
+        logger.warning(f"판정 결과 추측 생성을 시작하지 못했습니다: {e}")
+
+def _schedule_after_turn(sid, state):
+    """턴 상태를 저장한 뒤 실행할 백그라운드 작업을 예약합니다."""
+    if state.get('committed_roll'):
+        # 판정이 끝날 때까지 스토리 메모리 갱신을 미뤄야 판정 프롬프트가 바뀌지 않아 미리 생성한 응답을 쓸 수 있습니다.
+        _maybe_speculate_roll(sid, state)
+    else:
+        story_memory.maybe_schedule(sid, _log_view(state, sid))
+
+def _cache_bypassed(data):
+    """요청 본문의 no_cache 플래그 또는 Cache-Control: no-cache 헤더로 응답 캐시를 건너뜁니다."""
+    return bool(data.get('no_cache')) or 'no-cache' in request.headers.get('Cache-Control', '')
+
+# --- 턴 처리 단계 ---
+# 각 턴은 (1) 프롬프트 준비 → (2) AI 호출 → (3) 결과 반영의 세 단계로 나뉩니다.
+# 일반 응답(/game-turn)과 스트리밍 응답(/game-turn-stream)이 (1)과 (3)을 공유합니다.
+
+def _prepare_action_turn(data, state):
+    """행동 턴의 프롬프트와 결과 반영에 필요한 컨텍스트를 준비합니다."""
+    player_char = state['character_data']
+    player_action = data.get('player_action', '아무것도 하지 않는다.')
+    if roll_speculator is not None:
+        # 판정 대신 새 행동을 했으므로 미리 생성하던 판정 결과는 쓰이지 않음
+        roll_speculator.discard(session.get('sid'))
+
+    with _turn_span('story_summary'):
+        story_summary = _create_story_summary(player_char, _log_view(state), session.get('sid'))
+    lorebook = _get_session_lorebook(state)
+    with _turn_span('prompt_build'):
+        prompt = _build_action_prompt(lorebook, player_char, story_summary, player_action)
+    return prompt, {
+        'player_action': player_action, 'tier': _route_turn('action', lorebook, player_action), 'prompt_budget': prompt.budget
     }
-    return story_so_far
-
-def _build_action_prompt(player_char, story_summary, player_action):
-    # --- 프롬프트에 사용될 값들을 미리 변수로 추출 ---
-    player_action_str = player_action
-    current_scenario_state_str = player_char.get('current_scenario_state', 'Unknown')
-    current_scene_id = player_char.get('scene_id', 'UNKNOWN_SCENE')
-    story_summary_json = json.dumps(story_summary, ensure_ascii=False, indent=2)
 
-    # 로어북 GM 지침
-    lorebook_gm_directives = LOREBOOK_DATA.get('GM 지침', 'Proceed with the story according to the player\'s actions.')
-    
-    # 현재 게임 상태 (참고용)
-    player_name = player_char['name']
-    player_description = player_char.get('description', 'Not set')
-    player_hp, player_max_hp = player_char['hp'], player_char['maxHp']
-    player_sp, player_max_sp = player_char['sp'], player_char['maxSp']
-    player_inventory = player_char['inventory']
-    player_location = player_char.get('location', 'Unknown')
-
-    # 부록 섹션에서 '세계관 개요' 내용 추출
-    appendix_full_content = LOREBOOK_DATA.get('부록: 전체 세계관 정보 (Appendix: World Info)', '')
-    world_overview_content = "포스트 아포칼립스 대한민국." # Default fallback
-
-    # 정규식을 사용하여 "### A. 세계관 개요 (World Overview)" 아래의 내용을 추출
-    # '### B. 주요 인물 (Key NPCs)' 또는 문자열 끝까지를 내용으로 간주
-    match = re.search(r'### A\. 세계관 개요 \(World Overview\)\s*\n(.*?)(?=\n### B\. 주요 인물 \(Key NPCs\)|\Z)', appendix_full_content, re.DOTALL)
-    if match:
-        world_overview_content = match.group(1).strip()
-
-    return f"""
-# [TRPG GM ROLE]
-# You are the Game Master for a TTRPG set in a post-apocalyptic Korea.
-# Your style must be **dark, atmospheric, and sparse**. Use Korean only.
-# - Always describe the scene based on the current context and the player's action.
-# - Your response must always end with a question or a clear consequence that drives the story forward.
-# - If the player's action requires a check, you **MUST** set "require_roll": true and "roll_stat" to one of: "strength", "agility", "intelligence", "senses", "willpower".
-# - The story's tone must reflect the following world overview:
-
-# [WORLD OVERVIEW - TONE AND SETTING PRIORITY]
-{world_overview_content}
-
-# [CONTEXT SUMMARY - PRIMARY DIRECTIVE]
-# You must base your response on the following structured summary of the current situation. This is your primary source of truth.
-{story_summary_json}
-
-# [SCENE LOCK - CRITICAL RULE]
-# You are currently in Scene ID: "{current_scene_id}". Do not change the scene unless the player's action directly causes it.
-
-# [NARRATIVE ANCHOR - ABSOLUTE PRIORITY]
-# Your immediate task is to respond to the player's very last action based on the context above.
-# 1. Player's Last Action: "{player_action_str}"
-# 2. Based on the "current_goal" from the summary, decide if this action requires a dice roll.
-# All your narrative output for the 'story' field in the JSON response MUST be in Korean.
-
-# --- GM's Directives (for context) ---
-# GM 지침: {lorebook_gm_directives}
-
-# --- Current Game State (for reference only) ---
-# Player: '{player_name}' ({player_description})
-# HP: {player_hp}/{player_max_hp}, SP: {player_sp}/{player_max_sp}
-# Inventory: {player_inventory}
-# Current Location: {player_location}
-
-# --- GM's Judgment Rules ---
-# 1. **CRITICAL:** If you set "require_roll" to `true`, your "story" text MUST end with a clear call for a roll. (e.g., "...감각 판정이 필요합니다.")
-# 2. The 'roll_stat' must be one of: "strength", "agility", "intelligence", "senses", "willpower".
-# 3. If the "current_goal" from the summary is resolved or significantly changed by the action, reflect this in the "new_scenario_state".
-
-```json
-{{
-    "story": "[ 여기에 다음 상황 묘사나 판정 요구를 작성합니다. ]",
-    "require_roll": false,
-    "roll_stat": null,
-    "hp_change": 0,
-    "sp_change": 0,
-    "add_inventory": [],
-    "remove_inventory": [],
-    "new_location": null,
-    "new_scenario_state": "[ 여기에 새로운 상황 요약을 작성합니다. ]",
-    "new_scene_id": null
-}}
-```
-"""
-
-def _build_roll_prompt(player_char, story_summary, roll_info):
-    # --- 프롬프트에 사용될 값들을 미리 변수로 추출 ---
-    pending_action_str = roll_info['pending_action']
-    roll_outcome = roll_info['outcome']
-    story_summary_json = json.dumps(story_summary, ensure_ascii=False, indent=2)
-
-    return f"""
-# [CONTEXT SUMMARY - PRIMARY DIRECTIVE]
-# You must base your response on the following structured summary of the current situation.
-{story_summary_json}
-
-# [ROLL CONTINUITY RULE - ABSOLUTE PRIORITY]
-# Your response must be a direct description of the result of the following **specific action**.
-# **Action Being Resolved:** "{pending_action_str}"
-# **Dice Roll Result:** "{roll_outcome}"
-#
-# ❌ Do NOT reference past events from the log. ONLY resolve the action above.
-# Only describe "how this action ended".
-# All your narrative output for the 'story' field in the JSON response MUST be in Korean.
-
-# --- GM's Story Generation Rules ---
-# 1. Describe the story in a way that fits the "{roll_outcome}".
-# 2. Clearly state how the **Action Being Resolved** led to the "{roll_outcome}".
-# 3. After describing the story, ask a question to guide the player's next action.
-
-# --- Detailed Dice Roll Breakdown (for reference only) ---
-# Total {roll_info['total']} (Dice 1: {roll_info['dice1']}, Dice 2: {roll_info['dice2']}, Stat: {roll_info['stat_name_ko']}, Modifier: {roll_info['modifier']})
-
-```json
-{{
-    "story": "[ 여기에 주사위 굴림 결과에 따른 상세한 상황 묘사와 다음 질문을 작성합니다. ]",
-    "require_roll": false,
-    "roll_stat": null,
-    "hp_change": 0,
-    "sp_change": 0,
-    "add_inventory": [],
-    "remove_inventory": [],
-    "new_location": null,
-    "new_scenario_state": "[ 여기에 새로운 상황 요약을 작성합니다. ]",
-    "new_scene_id": null
-}}
-```
-"""
-
-def _handle_action_turn(data, player_char, game_log_session):
-    player_action = data.get('player_action', '아무것도 하지 않는다.')
-    logger.debug(f"Live AI Mode - Action: {player_action}")
-    
-    story_summary = _create_story_summary(player_char, game_log_session)
-    prompt = _build_action_prompt(player_char, story_summary, player_action)
-    
-    response = model.generate_content(prompt, safety_settings=safety_settings)
-    ai_json = parse_ai_response(response.text)
-
-    # AI 응답에 따라 세션 상태 업데이트
-    if ai_json.get('new_location'):
-        player_char['location'] = ai_json['new_location']
-    if ai_json.get('new_scenario_state'):
-        player_char['current_scenario_state'] = ai_json['new_scenario_state']
-    if ai_json.get('new_scene_id'):
-        player_char['scene_id'] = ai_json['new_scene_id']
-    
-    player_char = apply_state_changes(player_char, ai_json)
-    session['character_data'] = player_char
-    
-    game_log_session.append(f"플레이어: {player_action}")
-    game_log_session.append(f"<strong>GM:</strong> {ai_json['story']}")
-    if ai_json.get('require_roll'):
-        session['pending_action_for_roll'] = player_action
-    
-    session['game_log'] = game_log_session
-    session.modified = True
-    
-    # 프론트엔드로 보낼 최종 응답 구성
-    final_response = ai_json.copy()
-    final_response['character'] = player_char
-    if final_response.get('require_roll') and final_response.get('roll_stat'):
-        STAT_MAPPING_KO = {'strength': '근력', 'agility': '민첩', 'intelligence': '지능', 'senses': '감각', 'willpower': '정신력'}
-        final_response['roll_stat_ko'] = STAT_MAPPING_KO.get(final_response['roll_stat'], final_response['roll_stat'])
+def _state_update(state, character_before):
+    """턴 응답에 넣을 상태 버전과 캐릭터 변경분. 클라이언트가 보낸 base_version이 이 턴 직전 버전과 다르면 전체 캐릭터도 보냅니다."""
+    update = {'version': state['event_seq'], 'delta': character_delta(character_before, state['character_data'])}
+    if not g.get('client_in_sync'):
+        update['character'] = state['character_data']
+    return update
+
+def _finish_action_turn(state, turn_ctx, ai_json):
+    """AI 응답을 게임 상태에 반영하고 프론트엔드로 보낼 응답 dict를 만듭니다."""
+    player_action = turn_ctx['player_action']
+    character_before = copy.deepcopy(state['character_data'])
+
+    # AI 응답을 이벤트로 기록하면 상태 변화(위치, 상황, HP/SP, 인벤토리, 판정 대기)가 함께 적용됨
+    with _turn_span('apply_state'):
+        _record_event(state, new_event('action', text=player_action))
+        _record_event(state, new_event(
+            'gm', story=ai_json['story'], delta=state_delta(ai_json), require_roll=ai_json.get('require_roll'),
+            roll_stat=ai_json.get('roll_stat'), pending_action=player_action if ai_json.get('require_roll') else None,
+            degraded=ai_json.get('degraded')
+        ))
+    state.pop('committed_roll', None)
+    if ai_json.get('require_roll') and roll_speculator is not None:
+        # 주사위는 세션 시드와 판정 순번으로 이미 정해져 있으므로 판정 프롬프트도 확정되어 미리 생성할 수 있습니다.
+        state['committed_roll'] = {'stat': ai_json['roll_stat']}
     
-    return jsonify(final_response)
+    # 프론트엔드로 보낼 최종 응답 구성 (상태는 변경분만). 모델 응답의 키를 그대로 옮기지 않고 필드별로 채움
+    final_response = {
+        "story": ai_json['story'],
+        "prompt_budget": turn_ctx.get('prompt_budget') # 섹션별 프롬프트 토큰 내역
+    }
+    final_response.update(_state_update(state, character_before))
+    _add_roll_request(final_response, state, ai_json)
+    return final_response
 
-def _handle_roll_turn(data, player_char, game_log_session, pending_action):
+def _add_roll_request(final_response, state, ai_json):
+    """턴 응답에 다음 판정 요구(능력치, 확률)와 대체 응답/응답 해석 표시를 채웁니다."""
+    final_response.update({
+        'require_roll': ai_json.get('require_roll', False),
+        'roll_stat': ai_json.get('roll_stat', None)
+    })
+    if final_response['require_roll'] and final_response['roll_stat']:
+        final_response['roll_stat_ko'] = STAT_MAPPING_KO.get(final_response['roll_stat'], final_response['roll_stat'])
+        final_response['roll_odds'] = stat_odds(state['character_data']['stats'], final_response['roll_stat'])
+    if ai_json.get('degraded'):
+        final_response.update({'degraded': True, 'late_answer_id': ai_json.get('late_answer_id')})
+    for flag in ('parse_error', 'parse_repaired'):
+        if ai_json.get(flag):
+            final_response[flag] = True
+
+def _prepare_roll_turn(data, state):
+    """주사위를 굴리고 판정 결과 서술용 프롬프트를 준비합니다."""
+    player_char = state['character_data']
+    pending_action = state['pending_action_for_roll']
     modifier_stat_name = data.get('modifier_stat')
     stat_value = player_char['stats'].get(modifier_stat_name, 0)
     modifier = get_modifier(stat_value)
     
-    dice1, dice2 = random.randint(1, 6), random.randint(1, 6)
+    # 주사위는 세션 시드와 판정 순번으로 정해지므로 같은 시드로 캠페인을 재생하면 같은 눈이 나옴
+    dice1, dice2 = roll_dice(state['rng_seed'], state['rolls'])
     total = dice1 + dice2 + modifier
+    outcome = roll_outcome(total)
     
-    if total >= 10: roll_outcome = "완전한 성공"
-    elif total >= 7: roll_outcome = "대가를 치르는 성공"
-    else: roll_outcome = "실패"
-    
-    STAT_MAPPING_KO = {'strength': '근력', 'agility': '민첩', 'intelligence': '지능', 'senses': '감각', 'willpower': '정신력'}
     stat_name_ko = STAT_MAPPING_KO.get(modifier_stat_name, modifier_stat_name)
 
     roll_info = {
-        'pending_action': pending_action, 'outcome': roll_outcome, 'total': total,
-        'dice1': dice1, 'dice2': dice2, 'stat_name_ko': stat_name_ko, 'modifier': modifier
+        'pending_action': pending_action, 'outcome': outcome, 'total': total,
+        'dice1': dice1, 'dice2': dice2, 'stat_name_ko': stat_name_ko, 'modifier': modifier,
+        'odds': outcome_odds(modifier),  # 판정 프롬프트에 넣는 이 판정의 결과별 확률
+        'event': new_event('roll', stat=modifier_stat_name, dice1=dice1, dice2=dice2, modifier=modifier,
+                           total=total, outcome=outcome, index=state['rolls'])
     }
+    roll_info['roll_summary'] = render_html(roll_info['event'])
     
-    story_summary = _create_story_summary(player_char, game_log_session)
-    prompt = _build_roll_prompt(player_char, story_summary, roll_info)
-
-    response = model.generate_content(prompt, safety_settings=safety_settings)
-    ai_json = parse_ai_response(response.text)
-
-    # AI 응답에 따라 세션 상태 업데이트
-    if ai_json.get('new_location'):
-        player_char['location'] = ai_json['new_location']
-    if ai_json.get('new_scenario_state'):
-        player_char['current_scenario_state'] = ai_json['new_scenario_state']
-    
-    player_char = apply_state_changes(player_char, ai_json)
-    session['character_data'] = player_char
-    
-    roll_summary = f"GM (판정): {stat_name_ko} 판정 (주사위: {dice1}+{dice2}, 수정치: {modifier}, 총합: {total}) 결과 - {roll_outcome}"
-    game_log_session.append(roll_summary)
-    game_log_session.append(f"<strong>GM:</strong> {ai_json['story']}")
-    session['game_log'] = game_log_session
-    session['pending_action_for_roll'] = None
-    session.modified = True
+    with _turn_span('story_summary'):
+        story_summary = _create_story_summary(player_char, _log_view(state), session.get('sid'))
+    lorebook = _get_session_lorebook(state)
+    with _turn_span('prompt_build'):
+        prompt = _build_roll_prompt(lorebook, player_char, story_summary, roll_info)
+    roll_info['tier'] = _route_turn('roll', lorebook)
+    roll_info['prompt_budget'] = prompt.budget
+    return prompt, roll_info
+
+def _finish_roll_turn(state, roll_info, ai_json):
+    """판정 결과에 대한 AI 응답을 게임 상태에 반영하고 응답 dict를 만듭니다."""
+    character_before = copy.deepcopy(state['character_data'])
+    with _turn_span('apply_state'):
+        _record_event(state, copy.deepcopy(roll_info['event']))
+        _record_event(state, new_event(
+            'gm', story=ai_json['story'], delta=state_delta(ai_json), require_roll=ai_json.get('require_roll'),
+            roll_stat=ai_json.get('roll_stat'), degraded=ai_json.get('degraded')
+        ))
+    state.pop('committed_roll', None)
     
     final_response = { 
-        "dice1": dice1, "dice2": dice2, "total": total, "modifier": modifier, "roll_outcome": roll_outcome, 
-        "story": f"{roll_summary}\n{ai_json['story']}",
-        "character": player_char
+        "dice1": roll_info['dice1'], "dice2": roll_info['dice2'], "total": roll_info['total'],
+        "modifier": roll_info['modifier'], "roll_outcome": roll_info['outcome'],
+        "roll_summary": roll_info['roll_summary'],
+        "story": ai_json['story'],
+        "prompt_budget": roll_info.get('prompt_budget')
     }
-    final_response.update({
-        'require_roll': ai_json.get('require_roll', False),
-        'roll_stat': ai_json.get('roll_stat', None)
-    })
+    final_response.update(_state_update(state, character_before))
+    _add_roll_request(final_response, state, ai_json)
+    return final_response
+
+_TURN_PHASES = {
+    'action': (_prepare_action_turn, _finish_action_turn),
+    'roll': (_prepare_roll_turn, _finish_roll_turn),
+}
 
-    return jsonify(final_response)
+def _degraded_turn_json(turn_type, state, turn_ctx, error):
+    """턴 마감 시각을 넘겼을 때의 로컬 대체 GM 응답. 진행 중이던 모델 호출은 늦은 응답으로 보관합니다."""
+    player_char_name = state['character_data'].get('name', '탐험가')
+    if turn_type == 'action':
+        ai_json = get_fallback_response('action', player_action=turn_ctx['player_action'], player_char_name=player_char_name)
+    else:
+        ai_json = get_fallback_response('roll', player_char_name=player_char_name, roll_outcome=turn_ctx['outcome'])
+    ai_json['late_answer_id'] = late_answers.track(_ensure_session_id(), error.pending)
+    return ai_json
+
+def _merge_late_answers(state):
+    """대체 응답으로 처리한 턴의 실제 응답이 그 뒤에 도착했으면 게임 로그에 보충합니다. 상태 변화는 반영하지 않습니다."""
+    if late_answers is None or not session.get('sid'):
+        return
+    for answer in late_answers.take_ready(session['sid']):
+        _record_event(state, new_event('note', label='늦게 도착한 서술', story=answer['story']))
+
+def _handle_action_turn(data, state):
+    prompt, turn_ctx = _prepare_action_turn(data, state)
+    try:
+        ai_json = _generate_turn_json(prompt, use_cache=not _cache_bypassed(data), tier=turn_ctx['tier'])
+    except TurnDeadlineExceeded as e:
+        ai_json = _degraded_turn_json('action', state, turn_ctx, e)
+    return _finish_action_turn(state, turn_ctx, ai_json)
+
+def _handle_roll_turn(data, state):
+    prompt, roll_info = _prepare_roll_turn(data, state)
+    try:
+        ai_json = _generate_turn_json(prompt, use_cache=not _cache_bypassed(data), tier=roll_info['tier'])
+    except TurnDeadlineExceeded as e:
+        ai_json = _degraded_turn_json('roll', state, roll_info, e)
+    return _finish_roll_turn(state, roll_info, ai_json)
+
+# --- 입장 제어: 턴 요청이 모델 호출로 이어지기 전에 속도/동시 처리 수를 제한 ---
+# 세션마다 분당 ADMISSION_SESSION_RATE개(순간 최대 ADMISSION_SESSION_BURST개)까지 턴을 받고, 전체로는
+# ADMISSION_MAX_CONCURRENT개를 동시에 처리하며 ADMISSION_RPM(0이면 끔)으로 분당 요청 수를 제한합니다.
+# 자리가 없으면 최대 ADMISSION_MAX_QUEUE개까지 ADMISSION_MAX_WAIT_SECONDS초 동안 클라이언트별로 번갈아 기다리고,
+# 그래도 받을 수 없으면 429 + Retry-After로 응답합니다. 같은 세션의 같은 턴 요청(버튼 연타)은 한 번만 처리합니다.
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', '1') == '1'
+admission_controller = None
+if ADMISSION_CONTROL:
+    admission_controller = AdmissionController(
+        session_rate_per_minute=float(os.getenv('ADMISSION_SESSION_RATE', '20')),
+        session_burst=int(os.getenv('ADMISSION_SESSION_BURST', '5')),
+        max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', str(LLM_MAX_IN_FLIGHT))),
+        rpm=int(os.getenv('ADMISSION_RPM', '0')),
+        max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '32')),
+        max_wait_seconds=float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '20')),
+    )
+    turn_metrics.add_metric(admission_controller.rejections)
+    turn_metrics.add_gauge('trpg_admission_queue_depth', 'Turn requests waiting for admission',
+                           lambda: admission_controller.queue_depth)
+    turn_metrics.add_gauge('trpg_admission_running', 'Admitted turn requests in progress',
+                           lambda: admission_controller.running)
+
+def _client_key():
+    """공정 대기열에서 요청을 구분할 클라이언트 키 (프록시 뒤라면 X-Forwarded-For의 첫 주소)."""
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    return forwarded.split(',')[0].strip() or request.remote_addr or 'unknown'
+
+def _admit_turn(turn_type, data):
+    """턴 처리 권한을 얻습니다. 입장 제어가 꺼져 있으면 None. 받을 수 없으면 AdmissionRejected가 발생합니다."""
+    if admission_controller is None:
+        return None
+    fingerprint = json.dumps([turn_type, data], sort_keys=True, ensure_ascii=False)
+    return admission_controller.admit(_ensure_session_id(), _client_key(), fingerprint)
+
+def _finish_admission(ticket, payload, status, started):
+    """처리 결과를 중복 요청들에 전달하고 자리를 반환합니다."""
+    if ticket is None:
+        return
+    ticket.publish(payload, status)
+    ticket.release()
+    admission_controller.observe_turn_seconds(time.perf_counter() - started)
+
+def _busy_payload(message, retry_after, reason):
+    return {"story": f"GM: {message}. {retry_after}초 후 다시 시도해주세요.", "message": f"{message} ({retry_after}초 후 재시도)",
+            "require_roll": False, "roll_stat": None, "error": reason, "retry_after": retry_after}
+
+def _turn_response(payload, status):
+    """턴 응답 JSON. 재시도 시점을 알려줄 수 있으면 Retry-After 헤더를 붙입니다."""
+    response = jsonify(payload)
+    response.status_code = status
+    if payload.get('retry_after'):
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response
+
+def _rejected_response(e):
+    return _turn_response(_busy_payload(str(e), e.retry_after, e.reason), 429)
+
+def _follow_turn(ticket):
+    """같은 턴이 이미 처리 중인 중복 요청: 먼저 들어온 요청의 결과를 그대로 돌려줍니다."""
+    result = ticket.wait_result(timeout=LLM_TURN_DEADLINE_SECONDS + admission_controller.max_wait_seconds)
+    if result is None or result[0] is None:
+        return _busy_payload("같은 턴을 처리하지 못했습니다", 1, 'duplicate'), 429
+    return result
+
+def _turn_error_payload(e):
+    """턴 처리 중 발생한 예외를 (응답, 상태 코드)로 바꿉니다. 일시적인 모델 오류는 503 + Retry-After로 알립니다."""
+    if isinstance(e, LLMTimeoutError):
+        logger.warning(f"Game turn timed out: {e}")
+        return {"story": "GM: 응답이 너무 오래 걸리고 있습니다. 잠시 후 다시 시도해주세요.", "require_roll": False, "roll_stat": None}, 504
+    if is_transient_error(e):
+        logger.warning(f"Game turn failed with a transient model error: {e}")
+        return _busy_payload("AI 모델이 일시적으로 응답하지 못했습니다", 5, 'model_unavailable'), 503
+    logger.error(f"An error occurred during game turn: {e}", exc_info=True)
+    return {"story": f"GM: 게임 진행 중 심각한 오류가 발생했습니다: {e}", "require_roll": False, "roll_stat": None}, 500
 
 @app.route('/game-turn', methods=['POST'])
 def handle_game_turn():
-    player_char = session.get('character_data', DEFAULT_PLAYER_CHARACTER)
-    game_log_session = session.get('game_log', [])
-    pending_action_for_roll = session.get('pending_action_for_roll', None)
     data = request.get_json()
     turn_type = data.get('type', 'action')
+    if turn_type not in _TURN_PHASES:
+        return jsonify({"error": "Invalid turn type"}), 400
+
+    try:
+        ticket = _admit_turn(turn_type, data)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    if ticket is not None and not ticket.leader:
+        return _turn_response(*_follow_turn(ticket))
+
+    g.turn_trace = TurnTrace(turn_type, 'sync')
+    started = time.perf_counter()
+    payload, status = None, 500
+    try:
+        # 상태는 입장한 뒤에 불러옴 (대기하는 동안 같은 세션의 이전 턴이 저장될 수 있으므로).
+        # 불러오기/늦은 응답 병합이 실패해도 finally에서 자리를 반환하도록 try 안에서 처리
+        state = _load_game_state()
+        g.client_in_sync = data.get('base_version') == state['event_seq']  # 아니면 응답에 전체 캐릭터 포함
+        _merge_late_answers(state)
+        g.turn_deadline_at = time.monotonic() + TURN_SLO_SECONDS
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Turn start: %s, Character: %s, payload keys: %s", turn_type, state['character_data'].get('name'), sorted(data),
+                         extra={'category': 'turn'})
+        if turn_type == 'action':
+            payload = _handle_action_turn(data, state)
+        else:
+            payload = _handle_roll_turn(data, state)
+        _save_game_state(state)
+        _schedule_after_turn(session.get('sid'), state)
+        status = 200
+    except Exception as e:
+        payload, status = _turn_error_payload(e)
+    finally:
+        turn_metrics.observe_turn(g.turn_trace, status)
+        _finish_admission(ticket, payload, status, started)
+    return _turn_response(payload, status)
+
 
-    logger.debug(f"\n--- Backend Turn Start ---")
-    logger.debug(f"Turn type: {turn_type}, Character: {player_char.get('name')}")
-    logger.debug(f"Incoming data: {data}")
+def _sse_event(event, payload):
+    """Server-Sent Events 형식의 메시지 한 건을 만듭니다."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-    if TEST_MODE:
-        # 테스트 모드 로직은 간소화를 위해 이 리팩토링에서 제외하고 기존 로직을 유지합니다.
-        # 필요하다면 별도로 리팩토링할 수 있습니다.
-        pass # 기존 테스트 모드 코드가 여기에 위치한다고 가정
+@app.route('/game-turn-stream', methods=['POST'])
+def handle_game_turn_stream():
+    """/game-turn의 스트리밍 버전. GM의 story를 생성되는 대로 SSE로 전송합니다.
 
+    이벤트 순서: (판정 턴이면) roll → story(여러 번, delta) → done(최종 응답 전체) 또는 error
+    상태 변경(hp_change, add_inventory, new_scene_id 등)은 JSON이 완성된 뒤 한 번에 적용됩니다.
+    """
+    data = request.get_json()
+    turn_type = data.get('type', 'action')
+    if turn_type not in _TURN_PHASES:
+        return jsonify({"error": "Invalid turn type"}), 400
+    prepare, finish = _TURN_PHASES[turn_type]
+    use_cache = not _cache_bypassed(data)
+
+    # 응답 헤더가 먼저 전송되므로, 쿠키(세션 ID)는 스트림 시작 전에 확정해야 합니다.
+    sid = _ensure_session_id()
     try:
-        if turn_type == 'action':
-            return _handle_action_turn(data, player_char, game_log_session)
-        elif turn_type == 'roll':
-            return _handle_roll_turn(data, player_char, game_log_session, pending_action_for_roll)
+        ticket = _admit_turn(turn_type, data)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    if ticket is not None and not ticket.leader:
+        # 중복 요청: 먼저 들어온 요청이 끝나면 최종 응답만 한 번에 보냄
+        def follow():
+            payload, status = _follow_turn(ticket)
+            yield _sse_event('done' if status == 200 else 'error', payload)
+        return Response(stream_with_context(follow()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    g.turn_trace = TurnTrace(turn_type, 'stream')
+    started = time.perf_counter()
+
+    try:
+        # 상태 불러오기/늦은 응답 병합이 실패해도 아래에서 자리를 반환하도록 try 안에서 처리
+        state = _load_game_state()
+        g.client_in_sync = data.get('base_version') == state['event_seq']  # 아니면 응답에 전체 캐릭터 포함
+        _merge_late_answers(state)
+        g.turn_deadline_at = time.monotonic() + TURN_SLO_SECONDS
+        logger.debug("Stream turn start: %s, Character: %s", turn_type, state['character_data'].get('name'), extra={'category': 'turn'})
+        prompt, turn_ctx = prepare(data, state)
     except Exception as e:
-        logger.error(f"An error occurred during game turn: {e}", exc_info=True)
-        return jsonify({"story": f"GM: 게임 진행 중 심각한 오류가 발생했습니다: {e}", "require_roll": False, "roll_stat": None}), 500
+        logger.error(f"An error occurred while preparing stream turn: {e}", exc_info=True)
+        turn_metrics.observe_turn(g.turn_trace, 500)
+        payload = {"story": f"GM: 게임 진행 중 심각한 오류가 발생했습니다: {e}", "require_roll": False, "roll_stat": None}
+        _finish_admission(ticket, payload, 500, started)
+        return jsonify(payload), 500
+
+    def generate():
+        payload, status = None, 500
+        try:
+            if turn_type == 'roll':
+                yield _sse_event('roll', {k: turn_ctx[k] for k in ('dice1', 'dice2', 'total', 'modifier', 'outcome', 'roll_summary')})
+
+            buffer, sent = '', 0
+            try:
+                for text in _stream_model(prompt, use_cache, turn_ctx['tier']):
+                    buffer += text
+                    story, _ = extract_partial_string_field(buffer, 'story')
+                    if story and len(story) > sent:
+                        yield _sse_event('story', {'delta': story[sent:]})
+                        sent = len(story)
+                with _turn_span('parse'):
+                    ai_json = parse_ai_response(buffer)
+            except TurnDeadlineExceeded as e:
+                # 이미 보낸 story 조각은 done 이벤트의 최종 응답(대체 응답)으로 바뀝니다.
+                ai_json = _degraded_turn_json(turn_type, state, turn_ctx, e)
+            final_response = finish(state, turn_ctx, ai_json)
+            _save_game_state(state)
+            _schedule_after_turn(sid, state)
+            payload, status = final_response, 200
+            yield _sse_event('done', final_response)
+        except Exception as e:
+            payload, status = _turn_error_payload(e)
+            yield _sse_event('error', payload)
+        finally:
+            turn_metrics.observe_turn(g.turn_trace, status)
+            _finish_admission(ticket, payload, status, started)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if ticket is not None:
+        # 스트림을 시작하기 전에 연결이 끊겨 generate()가 실행되지 않아도 자리는 반환
+        response.call_on_close(ticket.release)
+    return response
+
+# --- 방(room) 모드: 여러 플레이어가 한 장면을 공유하고, 한 라운드의 행동을 한 번의 GM 호출로 처리 ---
+def _generate_room_round(room, actions):
+    """방의 현재 상태와 이번 라운드 행동들로 GM 결과를 생성합니다. 판정 주사위는 서버에서 미리 굴려 프롬프트에 넣습니다."""
+    with room.lock:
+        scene = dict(room.scene)
+        party = [(player_id, copy.deepcopy(character), actions.get(player_id))
+                 for player_id, character in room.players.items()]
+        game_log = room.game_log.copy()  # 보관 중인 최근 줄만 복사
+    lorebook = lorebook_registry.get_or_default(room.lorebook_id)
+    round_dice = {player_id: (random.randint(1, 6), random.randint(1, 6)) for player_id, _, _ in party}
+    story_summary = _create_story_summary(scene, game_log, room.memory_key)
+    relevant_lore = _retrieve_lore(lorebook, scene, ' '.join(actions.values()))
+    prompt = _check_prompt_budget(_prompt_templates_for(lorebook).build_room_prompt(
+        scene, party, story_summary, round_dice, relevant_lore, budget=prompt_budget
+    ))
+
+    response = _call_model(prompt, _route_turn('room', lorebook),
+                           generation_config=ROOM_GENERATION_CONFIG if STRUCTURED_OUTPUT else None)
+    data, _ = loads_tolerant(response.text)
+    result = normalize_room_response(data, [player_id for player_id, _, _ in party])
+    if result is None:
+        # JSON을 얻지 못하면 응답 문장 전체를 공통 서술로 사용 (상태 변화 없음)
+        result = normalize_room_response({'story': response.text.strip() or "GM: 응답을 해석할 수 없습니다."},
+                                         [player_id for player_id, _, _ in party])
+    result['dice'] = round_dice
+    return result
+
+def _apply_room_round(room, actions, result):
+    """라운드 결과를 방 상태(장면, 캐릭터, 게임 로그)에 반영하고 구독자에게 보낼 내용을 반환합니다. 방 락 안에서 호출됩니다."""
+    if result.get('new_location'):
+        room.scene['location'] = result['new_location']
+    if result.get('new_scenario_state'):
+        room.scene['current_scenario_state'] = result['new_scenario_state']
+    if result.get('new_scene_id'):
+        room.scene['scene_id'] = result['new_scene_id']
+
+    players = {}
+    for player_id, character in room.players.items():
+        changes = result['players'].get(player_id, {})
+        apply_state_changes(character, changes)
+        # 다음 라운드 프롬프트의 장면 정보와 맞춰 둠
+        character.update({k: room.scene[k] for k in ('location', 'current_scenario_state', 'scene_id') if k in room.scene})
+        if player_id in actions:
+            room.game_log.append(f"<strong>{character['name']}:</strong> {actions[player_id]}")
+        players[player_id] = {
+            'name': character['name'],
+            'action': actions.get(player_id),
+            'dice': result['dice'].get(player_id),
+            'story': changes.get('story', ''),
+            'character': copy.deepcopy(character),
+        }
+
+    player_stories = [f"{p['name']}: {p['story']}" for p in players.values() if p['story']]
+    room.game_log.append(f"<strong>GM:</strong> {result['story']}" + ''.join(f"<br>{line}" for line in player_stories))
+    story_memory.maybe_schedule(room.memory_key, room.game_log)
+    return {'story': result['story'], 'players': players, 'scene': dict(room.scene)}
+
+# 방 라운드 시간(초): 첫 행동이 들어온 뒤 이 시간 안에 모인 행동을 함께 처리합니다. 모두 행동하면 바로 처리.
+ROOM_ROUND_WINDOW_SECONDS = float(os.getenv('ROOM_ROUND_WINDOW_SECONDS', '20'))
+ROOM_MAX_PLAYERS = int(os.getenv('ROOM_MAX_PLAYERS', '6'))
+# 방마다 보관하는 게임 로그 줄 수. 더 오래된 줄은 스토리 메모리 요약으로만 남습니다.
+ROOM_LOG_MAX_LINES = int(os.getenv('ROOM_LOG_MAX_LINES', '100'))
+room_manager = RoomManager(
+    _generate_room_round, _apply_room_round,
+    round_window_seconds=ROOM_ROUND_WINDOW_SECONDS, max_players=ROOM_MAX_PLAYERS,
+    max_log_lines=ROOM_LOG_MAX_LINES, on_expire=lambda room: story_memory.delete(room.memory_key)
+)
 
-    return jsonify({"error": "Invalid turn type or test mode issue"}), 400
+@app.errorhandler(RoomError)
+def handle_room_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+def _room_player_id(room_id):
+    """요청한 클라이언트의 이 방 player_id. player_id는 방 상태/이벤트로 모두에게 공개되므로 요청 본문이 아니라 세션에서만 가져옵니다."""
+    return session.get('room_players', {}).get(room_id)
+
+@app.route('/rooms', methods=['POST'])
+def create_room():
+    """새 방을 만듭니다. 장면은 로어북의 시작 설정에서 가져옵니다."""
+    data = request.get_json(silent=True) or {}
+    lorebook_id = data.get('lorebook') or DEFAULT_LOREBOOK_ID
+    try:
+        lorebook = _lorebook_for_request(lorebook_id)
+    except KeyError:
+        return jsonify({"error": f"로어북을 찾을 수 없습니다: {lorebook_id}"}), 400
+    scene_source, start_message = _build_character({'name': '모험가 일행'}, lorebook)
+    scene = {k: scene_source[k] for k in ('location', 'current_scenario_state', 'scene_id')}
+    room = room_manager.create(lorebook_id, scene, start_message)
+    return jsonify({"room": room.snapshot()})
+
+@app.route('/rooms/<room_id>', methods=['GET'])
+def get_room(room_id):
+    return jsonify({"room": room_manager.get(room_id).snapshot()})
+
+@app.route('/rooms/<room_id>/join', methods=['POST'])
+def join_room(room_id):
+    """캐릭터를 만들어 방에 참가합니다. 요청 본문은 /create-character와 같습니다 (lorebook 제외)."""
+    data = request.get_json(silent=True) or {}
+    room = room_manager.get(room_id)
+    character, _ = _build_character(data, lorebook_registry.get_or_default(room.lorebook_id))
+    character.update(room.scene)
+    player_id = room_manager.join(room_id, character)
+    session['room_players'] = {**session.get('room_players', {}), room_id: player_id}
+    logger.info(f"방 {room_id}에 참가: {character['name']} ({player_id})")
+    return jsonify({"player_id": player_id, "character": character, "room": room.snapshot()})
+
+@app.route('/rooms/<room_id>/action', methods=['POST'])
+def room_action(room_id):
+    """이번 라운드의 행동을 제출합니다. 결과는 /rooms/<id>/events의 round 이벤트로 전달됩니다."""
+    data = request.get_json(silent=True) or {}
+    player_action = (data.get('player_action') or '').strip()
+    if not player_action:
+        return jsonify({"error": "행동을 입력해주세요."}), 400
+    result = room_manager.submit(room_id, _room_player_id(room_id), player_action)
+    return jsonify(result), 202
+
+@app.route('/rooms/<room_id>/events', methods=['GET'])
+def room_events(room_id):
+    """방 이벤트 스트림 (SSE). 연결 직후 state(방 상태)를 보내고, 이후 member/action/round/error 이벤트를 전달합니다."""
+    room, subscriber = room_manager.subscribe(room_id)
+
+    def generate():
+        try:
+            yield _sse_event('state', room.snapshot())
+            while True:
+                try:
+                    event, payload = subscriber.get(timeout=15)
+                except queue.Empty:
+                    if subscriber not in room.subscribers:
+                        break  # 읽기가 밀려 구독이 끊긴 경우
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse_event(event, payload)
+        finally:
+            room_manager.unsubscribe(room, subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/late-answer/<answer_id>', methods=['GET'])
+def get_late_answer(answer_id):
+    """대체 응답으로 처리한 턴의 실제 모델 응답. status는 pending | ready | failed 입니다."""
+    entry = late_answers.get(answer_id, session.get('sid')) if late_answers is not None else None
+    if entry is None:
+        return jsonify({"error": "Unknown answer id"}), 404
+    return jsonify({"status": entry['status'], "story": (entry['answer'] or {}).get('story')})
+
+# /game-log 한 페이지의 최대 이벤트 수
+GAME_LOG_PAGE_MAX = int(os.getenv('GAME_LOG_PAGE_MAX', '200'))
+
+def _pending_roll(sid, state):
+    """판정을 기다리는 중이면 마지막 GM 서술이 요구한 능력치 (영문, 한글)."""
+    if not state.get('pending_action_for_roll'):
+        return None
+    for event in campaign_log.reversed_events(sid, state):
+        if event['type'] == 'gm':
+            stat = event.get('roll_stat')
+            if not stat:
+                return None
+            return {'roll_stat': stat, 'roll_stat_ko': STAT_MAPPING_KO.get(stat, stat),
+                    'roll_odds': stat_odds(state['character_data']['stats'], stat)}
+    return None
+
+@app.route('/game-log', methods=['GET'])
+def get_game_log():
+    """게임 로그를 seq 순서로 나눠 받습니다. since 다음 이벤트부터 최대 limit개를 반환하고, next를 다음 요청의 since로 씁니다.
+
+    마지막 페이지(has_more=false)에는 그 시점의 캐릭터와 판정 대기 정보가 함께 오므로, 새로고침한 클라이언트는
+    since=0부터 페이지를 이어 받아 화면을 복원하고, 이후에는 턴 응답의 version/delta로 따라갈 수 있습니다.
+    """
+    try:
+        since = max(0, int(request.args.get('since', 0)))
+        limit = min(GAME_LOG_PAGE_MAX, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    sid = session.get('sid')
+    state = session_store.load(sid) if sid else None
+    if state is None:
+        return jsonify({"error": "No campaign in this session"}), 404
+    state = campaign_log.upgrade(sid, state)
+    missing = []
+    events = campaign_log.events(sid, state, since, since + limit, missing=missing)
+    next_seq = min(since + limit, state['event_seq'])  # 보관된 묶음이 사라졌어도 다음 페이지로 넘어감
+    page = {
+        'entries': [{'seq': event['seq'], 'type': event['type'], 'html': render_html(event)} for event in events],
+        'next': next_seq, 'has_more': next_seq < state['event_seq'], 'version': state['event_seq'],
+    }
+    if missing:
+        # 빠진 구간을 클라이언트가 알 수 있도록 (seq 범위) 목록을 함께 보냄
+        page['missing'] = [campaign_log.chunk_range(index) for index in missing]
+    if not page['has_more']:
+        page.update({'character': state['character_data'], 'pending_roll': _pending_roll(sid, state)})
+    return jsonify(page)
+
+@app.route('/roll-odds', methods=['GET'])
+def get_roll_odds():
+    """현재 캐릭터의 능력치별 판정 확률표 (variant: normal | advantage | penalty)."""
+    variant = request.args.get('variant', 'normal')
+    if variant not in ROLL_VARIANTS:
+        return jsonify({"error": f"Unknown variant: {variant}", "variants": list(ROLL_VARIANTS)}), 400
+    sid = session.get('sid')
+    state = session_store.load(sid) if sid else None
+    character = state['character_data'] if state else DEFAULT_PLAYER_CHARACTER
+    return jsonify({"variant": variant, "stats": stat_odds_table(character['stats'], variant)})
+
+@app.route('/campaign/export', methods=['GET'])
+def export_campaign():
+    """현재 세션의 캠페인 기록(이벤트, 묶음별 스냅샷, 현재 상태)을 내려받습니다. replay.py로 재생할 수 있습니다."""
+    sid = session.get('sid')
+    state = session_store.load(sid) if sid else None
+    if state is None:
+        return jsonify({"error": "No campaign in this session"}), 404
+    return jsonify(campaign_log.export(sid, campaign_log.upgrade(sid, state)))
+
+@app.route('/lorebooks', methods=['GET'])
+def list_lorebooks():
+    """선택 가능한 로어북 목록을 반환합니다."""
+    return jsonify({"lorebooks": lorebook_registry.list(), "default": DEFAULT_LOREBOOK_ID})
+
+@app.route('/llm-status', methods=['GET'])
+def llm_status():
+    """LLM 호출 계층의 대기열 길이와 진행 중 호출 수, 응답 캐시 적중률, 추측 생성/방 라운드/모델 계층별/입장 제어/헤지 통계를 반환합니다."""
+    status = llm_client.stats()
+    status['response_cache'] = response_cache.stats() if response_cache is not None else None
+    status['speculative_rolls'] = roll_speculator.stats() if roll_speculator is not None else None
+    status['rooms'] = room_manager.stats()
+    status['model_routing'] = model_router.stats()
+    status['prompt_budget'] = {'max_tokens': PROMPT_TOKEN_BUDGET or None, **token_counter.stats()}
+    status['admission'] = admission_controller.stats() if admission_controller is not None else None
+    status['hedging'] = {**turn_hedger.stats(), 'slo_seconds': TURN_SLO_SECONDS,
+                         'late_answers': late_answers.stats()} if turn_hedger is not None else None
+    return jsonify(status)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """턴 단계별 지연/토큰 수/세션 크기 히스토그램과 카운터를 Prometheus 텍스트 형식으로 반환합니다."""
+    return Response(turn_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- 시작 / 미리 데우기 ---
+# STARTUP_WARMUP=background (기본): 서버가 뜬 직후 백그라운드에서 로어북 색인과 모델 클라이언트 생성을 수행
+#                lazy: 첫 턴(또는 /warmup 요청)에서 수행, eager: import 시점에 수행 (시작은 느리지만 첫 턴이 빠름)
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'background')
+_warmup_lock = threading.Lock()
+
+def _is_warm():
+    return lorebook_registry.loaded and all(
+        getattr(tier.client.model, 'loaded', True) for tier in model_router.tiers.values()
+    )
+
+def warm_up():
+    """첫 턴에 필요한 초기화(로어북 색인, 모델 SDK import/클라이언트 생성)를 미리 수행합니다. 이미 끝났으면 바로 반환합니다."""
+    with _warmup_lock:
+        if _is_warm():
+            return
+        with startup_profile.phase('warmup'):
+            with startup_profile.phase('warmup.lorebooks'):
+                lorebook_registry.refresh()
+            for tier in model_router.tiers.values():
+                load = getattr(tier.client.model, 'load', None) # LazyModel일 때만
+                if load is not None:
+                    load()
+        logger.info(f"미리 데우기 완료: 로어북 {[lb['id'] for lb in lorebook_registry.list()]}")
+        if STARTUP_PROFILE:
+            logger.info(f"시작 프로파일: {json.dumps(startup_profile.report(), ensure_ascii=False)}")
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """생존 확인. 외부 호출이나 초기화 없이 바로 응답합니다. verbose=1이면 시작 단계별 소요 시간도 포함합니다."""
+    status = {"status": "ok", "warm": _is_warm()}
+    if request.args.get('verbose') == '1':
+        status['startup'] = startup_profile.report()
+    return jsonify(status)
+
+@app.route('/warmup', methods=['GET', 'POST'])
+def warmup():
+    """로어북 색인과 모델 클라이언트 생성을 끝낸 뒤 응답합니다. 트래픽을 받기 전에 플랫폼이 호출하도록 설정합니다."""
+    started = time.perf_counter()
+    try:
+        warm_up()
+    except Exception as e:
+        logger.error(f"미리 데우기 실패: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify({"status": "ok", "warm": _is_warm(), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "startup": startup_profile.report()})
+
+startup_profile.ready()
+if STARTUP_PROFILE:
+    logger.info(f"서버 import 완료: {startup_profile.ready_ms}ms {json.dumps(startup_profile.report()['phases_ms'])}")
+if STARTUP_WARMUP == 'eager':
+    warm_up()
+elif STARTUP_WARMUP == 'background':
+    def _warm_up_in_background():
+        try:
+            warm_up()
+        except Exception as e:
+            # 실패해도 첫 턴에서 다시 시도되므로 경고만 남김
+            logger.warning(f"백그라운드 미리 데우기 실패: {e}")
+    threading.Thread(target=_warm_up_in_background, name='startup-warmup', daemon=True).start()
 
 
 if __name__ == '__main__':
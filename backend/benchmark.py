@@ -0,0 +1,206 @@
+"""/create-character + 여러 턴의 /game-turn 세션으로 서버 처리량과 지연을 측정하는 벤치마크.
+
+기본은 앱을 같은 프로세스에서 TEST_MODE(로컬 대체 모델)로 띄워 API 호출 비용 없이 측정합니다.
+--url을 주면 이미 실행 중인 서버에 HTTP로 요청합니다 (세션 크기/메모리 증가는 측정하지 않음).
+
+사용 예 (backend 폴더에서):
+    python benchmark.py --concurrency 1,4,16 --sessions 32 --turns 10 --latency-ms 800
+    python benchmark.py --url http://localhost:5000 --concurrency 4 --sessions 8
+
+보고 항목: 요청/초, p50/p95/p99 지연(ms), 오류 수, 턴당 세션 상태 크기(bytes), 메모리(RSS) 증가량
+"""
+import argparse
+import json
+import math
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CHARACTER = {
+    'name': '벤치',
+    'stats': {'strength': 2, 'agility': 2, 'intelligence': 1, 'senses': 2, 'willpower': 1},
+}
+# get_mock_response는 '살펴'가 들어간 행동에 판정을 요구하므로 행동/판정 턴이 번갈아 실행됩니다.
+DEFAULT_ACTIONS = ('주변을 살펴본다', '문을 열어 본다', '앞으로 조심스럽게 걸어간다')
+
+
+def percentile(sorted_values, pct):
+    """정렬된 값 목록의 nearest-rank 백분위수."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def current_rss_bytes():
+    """현재 프로세스의 RSS. /proc가 없으면 최대 RSS로 대신합니다."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class InProcessClient:
+    """Flask test client로 앱을 직접 호출합니다. 세션 상태 크기를 저장소에서 바로 읽습니다."""
+
+    def __init__(self, app_module):
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+
+    def post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        return response.status_code, response.get_json(silent=True) or {}, len(response.data)
+
+    def session_bytes(self):
+        with self.client.session_transaction() as sess:
+            sid = sess.get('sid')
+        state = self.app_module.session_store.load(sid) if sid else None
+        return len(json.dumps(state, ensure_ascii=False).encode('utf-8')) if state else 0
+
+
+class HttpClient:
+    """실행 중인 서버에 HTTP로 요청합니다. 세션 쿠키는 직접 주고받습니다 (Secure 쿠키도 http로 전달)."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookie = None
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path, data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json', **({'Cookie': self.cookie} if self.cookie else {})},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, body, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, body, headers = e.code, e.read(), e.headers
+        set_cookie = headers.get('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = {}
+        return status, data, len(body)
+
+    def session_bytes(self):
+        return None
+
+
+def run_session(make_client, turns, actions, no_cache):
+    """세션 하나: 캐릭터 생성 후 `turns`번의 /game-turn 요청. 요청별 (종류, 지연, 상태 코드) 목록을 반환합니다."""
+    client = make_client()
+    samples = []
+    session_sizes = []
+
+    started = time.perf_counter()
+    status, _, _ = client.post('/create-character', DEFAULT_CHARACTER)
+    samples.append(('create', time.perf_counter() - started, status))
+
+    require_roll, roll_stat = False, 'senses'
+    for turn in range(turns):
+        if require_roll:
+            payload = {'type': 'roll', 'modifier_stat': roll_stat}
+        else:
+            payload = {'type': 'action', 'player_action': actions[turn % len(actions)]}
+        if no_cache:
+            payload['no_cache'] = True
+        started = time.perf_counter()
+        status, data, _ = client.post('/game-turn', payload)
+        samples.append((payload['type'], time.perf_counter() - started, status))
+        require_roll = status == 200 and payload['type'] == 'action' and bool(data.get('require_roll'))
+        roll_stat = data.get('roll_stat') or roll_stat
+        size = client.session_bytes()
+        if size is not None:
+            session_sizes.append(size)
+    return samples, session_sizes
+
+
+def run_level(make_client, concurrency, sessions, turns, actions, no_cache):
+    rss_before = current_rss_bytes()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: run_session(make_client, turns, actions, no_cache), range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for session_samples, _ in results for sample in session_samples]
+    turn_latencies = sorted(latency for kind, latency, _ in samples if kind != 'create')
+    session_sizes = [sizes for _, sizes in results if sizes]
+    per_turn_bytes = [size / (index + 1) for sizes in session_sizes for index, size in enumerate(sizes)]
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status in samples if status != 200),
+        'elapsed_s': round(elapsed, 3),
+        'req_per_s': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'turn_p50_ms': round(percentile(turn_latencies, 50) * 1000, 1),
+        'turn_p95_ms': round(percentile(turn_latencies, 95) * 1000, 1),
+        'turn_p99_ms': round(percentile(turn_latencies, 99) * 1000, 1),
+        'session_bytes_final_avg': round(sum(sizes[-1] for sizes in session_sizes) / len(session_sizes)) if session_sizes else None,
+        'session_bytes_per_turn_avg': round(sum(per_turn_bytes) / len(per_turn_bytes)) if per_turn_bytes else None,
+        'rss_growth_kb': round((current_rss_bytes() - rss_before) / 1024) if make_client.in_process else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='동시 세션 수 목록 (쉼표로 구분)')
+    parser.add_argument('--sessions', type=int, default=16, help='동시성 단계마다 실행할 세션 수')
+    parser.add_argument('--turns', type=int, default=10, help='세션당 /game-turn 요청 수')
+    parser.add_argument('--no-cache', action='store_true', help='응답 캐시를 건너뛰고 매 턴 모델을 호출')
+    parser.add_argument('--url', help='실행 중인 서버 주소 (생략하면 같은 프로세스에서 TEST_MODE로 실행)')
+    parser.add_argument('--timeout', type=float, default=120, help='--url 사용 시 요청 타임아웃(초)')
+    parser.add_argument('--latency-ms', type=float, default=800, help='대체 모델 평균 지연')
+    parser.add_argument('--latency-dist', default='lognormal', choices=('fixed', 'uniform', 'lognormal'))
+    parser.add_argument('--error-rate', type=float, default=0.0, help='대체 모델의 일시적 오류 확률')
+    parser.add_argument('--story-chars', type=int, default=0, help='대체 모델 story 길이 (0이면 기본 문장)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='결과를 JSON 줄로 출력')
+    args = parser.parse_args()
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url, args.timeout)
+        make_client.in_process = False
+    else:
+        # 앱을 import하기 전에 대체 모델 설정을 환경 변수로 넘깁니다.
+        os.environ.update({
+            'TEST_MODE': '1',
+            'FAKE_MODEL_LATENCY_MS': str(args.latency_ms),
+            'FAKE_MODEL_LATENCY_DIST': args.latency_dist,
+            'FAKE_MODEL_ERROR_RATE': str(args.error_rate),
+            'FAKE_MODEL_STORY_CHARS': str(args.story_chars),
+        })
+        if args.seed is not None:
+            os.environ['FAKE_MODEL_SEED'] = str(args.seed)
+        # 세션마다 턴을 쉬지 않고 보내므로, 따로 지정하지 않으면 입장 제어(세션별 속도 제한)는 끄고 처리량만 측정
+        os.environ.setdefault('ADMISSION_CONTROL', '0')
+        import logging
+        import app as app_module
+        logging.getLogger('app').setLevel(logging.WARNING)
+
+        def make_client():
+            return InProcessClient(app_module)
+        make_client.in_process = True
+
+    columns = ('concurrency', 'requests', 'errors', 'req_per_s', 'turn_p50_ms', 'turn_p95_ms', 'turn_p99_ms',
+               'session_bytes_per_turn_avg', 'rss_growth_kb')
+    if not args.json:
+        print(' '.join(f"{name:>14}" for name in columns))
+    for concurrency in (int(level) for level in args.concurrency.split(',') if level.strip()):
+        result = run_level(make_client, concurrency, args.sessions, args.turns, DEFAULT_ACTIONS, args.no_cache)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(' '.join(f"{str(result[name]):>14}" for name in columns), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""이벤트 소싱 방식의 캠페인 로그.
+
+게임 상태를 제자리에서 바꾸고 HTML 문자열(`<strong>GM:</strong> ...`)을 game_log에 쌓으면
+요약할 때마다 문자열을 다시 읽어야 하고, 캠페인을 재생하거나 중간부터 이어갈 수 없습니다.
+CampaignLog는 턴을 작은 타입 이벤트로 기록합니다.
+
+- start: 캐릭터, 로어북, 시작 메시지, 주사위 난수 시드
+- action: 플레이어 행동
+- roll: 판정 (능력치, 주사위 두 개, 수정치, 총합, 결과, 판정 순번)
+- gm: GM 서술과 상태 변화(delta)
+- note: 보충 서술 (늦게 도착한 응답 등)
+
+게임 상태는 이벤트를 순서대로 적용(apply_event)한 결과이고, HTML은 로그를 보여줄 때(render_html)만 만듭니다.
+세션 상태에는 현재 상태와 최근 이벤트만 두고, 이벤트가 chunk_size개 쌓이면 그 시점의 스냅샷과 함께
+`<sid>:events:<n>` 키로 저장소에 옮깁니다. 그래서 세션 크기는 캠페인 길이와 관계없이 일정하고,
+어느 묶음 경계에서든 스냅샷부터 바로 재개/재생할 수 있습니다.
+"""
+import copy
+import logging
+import random
+import secrets
+
+from turn_schema import STAT_MAPPING_KO
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('start', 'action', 'roll', 'gm', 'note', 'line')
+# gm 이벤트의 delta에 기록하는 AI 응답 필드
+DELTA_FIELDS = ('hp_change', 'sp_change', 'add_inventory', 'remove_inventory',
+                'new_location', 'new_scenario_state', 'new_scene_id')
+# 스냅샷에 담는 상태 (이벤트로 다시 만들 수 있는 값)
+SNAPSHOT_FIELDS = ('character_data', 'pending_action_for_roll', 'lorebook_id', 'rng_seed', 'rolls', 'event_seq')
+
+
+def apply_state_changes(character, changes):
+    """AI 응답에 따라 캐릭터의 상태(HP, SP, 인벤토리)를 변경합니다."""
+    # HP 변경
+    hp_change = changes.get('hp_change', 0)
+    if hp_change != 0:
+        character['hp'] = max(0, min(character['maxHp'], character['hp'] + hp_change))
+
+    # SP 변경
+    sp_change = changes.get('sp_change', 0)
+    if sp_change != 0:
+        character['sp'] = max(0, min(character['maxSp'], character['sp'] + sp_change))
+
+    # 인벤토리 추가
+    items_to_add = changes.get('add_inventory', [])
+    if items_to_add:
+        character['inventory'].extend(items_to_add)
+        # 중복 제거 (선택 사항)
+        character['inventory'] = sorted(list(set(character['inventory'])))
+
+    # 인벤토리 제거
+    items_to_remove = changes.get('remove_inventory', [])
+    if items_to_remove:
+        for item in items_to_remove:
+            if item in character['inventory']:
+                character['inventory'].remove(item)
+
+    logger.debug("캐릭터 상태 변경 적용됨: HP %s/%s, SP %s/%s, 인벤토리 %s개", character['hp'], character['maxHp'],
+                 character['sp'], character['maxSp'], len(character['inventory']), extra={'category': 'state'})
+    return character
+
+
+def _is_empty(value):
+    return value is None or value is False or (isinstance(value, (str, list, dict)) and not value)
+
+
+def new_event(kind, **fields):
+    """이벤트 dict를 만듭니다. 빈 값(None, False, '', [], {})은 기록하지 않습니다."""
+    return {'type': kind, **{name: value for name, value in fields.items() if not _is_empty(value)}}
+
+
+def state_delta(ai_json):
+    """AI 응답에서 상태를 바꾸는 필드만 골라냅니다."""
+    return {field: ai_json[field] for field in DELTA_FIELDS if not _is_empty(ai_json.get(field))}
+
+
+def roll_dice(seed, index):
+    """세션 시드와 판정 순번으로 2d6을 굴립니다. 같은 시드와 순번이면 항상 같은 눈이 나옵니다."""
+    rng = random.Random(f"{seed}:{index}")
+    return rng.randint(1, 6), rng.randint(1, 6)
+
+
+def new_seed():
+    # 관찰한 주사위로 시드를 역산해 다음 눈을 예측할 수 없도록 충분히 긴 무작위 값을 씀
+    return secrets.token_hex(16)
+
+
+def apply_event(state, event):
+    """이벤트 하나를 게임 상태에 적용합니다 (라이브 턴과 재생이 같은 함수를 씁니다)."""
+    kind = event['type']
+    if kind == 'start':
+        state.update({
+            'character_data': copy.deepcopy(event['character']), 'lorebook_id': event.get('lorebook_id'),
+            'pending_action_for_roll': None, 'rng_seed': event.get('seed'), 'rolls': 0,
+        })
+    elif kind == 'roll':
+        state['rolls'] = state.get('rolls', 0) + 1
+        state['pending_action_for_roll'] = None
+    elif kind == 'gm':
+        character = state['character_data']
+        delta = event.get('delta', {})
+        if delta.get('new_location'):
+            character['location'] = delta['new_location']
+        if delta.get('new_scenario_state'):
+            character['current_scenario_state'] = delta['new_scenario_state']
+        if delta.get('new_scene_id'):
+            character['scene_id'] = delta['new_scene_id']
+        apply_state_changes(character, delta)
+        state['pending_action_for_roll'] = event.get('pending_action')
+    state['event_seq'] = event['seq']
+    return state
+
+
+def roll_summary(event):
+    stat_name_ko = STAT_MAPPING_KO.get(event['stat'], event['stat'])
+    return (f"GM (판정): {stat_name_ko} 판정 (주사위: {event['dice1']}+{event['dice2']}, "
+            f"수정치: {event.get('modifier', 0)}, 총합: {event['total']}) 결과 - {event['outcome']}")
+
+
+def render_html(event):
+    """이벤트를 게임 로그 한 줄(HTML)로 그립니다."""
+    kind = event['type']
+    if kind in ('start', 'gm'):
+        return f"<strong>GM:</strong> {event['story']}"
+    if kind == 'action':
+        return f"플레이어: {event['text']}"
+    if kind == 'roll':
+        return roll_summary(event)
+    if kind == 'note':
+        return f"<strong>GM ({event.get('label', '보충')}):</strong> {event['story']}"
+    return event.get('html', '')  # line: 이벤트 로그 이전 형식의 세션에서 옮겨 온 줄
+
+
+def character_delta(before, after):
+    """턴 응답에 보낼 캐릭터 변화: 바뀐 값(hp, sp, 위치, 상황, 장면)과 인벤토리 추가/제거 목록만 담습니다."""
+    delta = {field: after.get(field) for field in ('hp', 'maxHp', 'sp', 'maxSp', 'location', 'current_scenario_state', 'scene_id')
+             if before.get(field) != after.get(field)}
+    added = [item for item in after.get('inventory', []) if item not in before.get('inventory', [])]
+    removed = [item for item in before.get('inventory', []) if item not in after.get('inventory', [])]
+    if added:
+        delta['inventory_add'] = added
+    if removed:
+        delta['inventory_remove'] = removed
+    return delta
+
+
+def snapshot(state):
+    return {field: copy.deepcopy(state.get(field)) for field in SNAPSHOT_FIELDS}
+
+
+def _without_seed(record):
+    return {name: value for name, value in record.items() if name not in ('seed', 'rng_seed')}
+
+
+class CampaignLog:
+    """세션별 이벤트 로그. 최근 이벤트는 세션 상태에, 오래된 이벤트는 chunk_size개씩 묶어 `store`에 보관합니다.
+
+    `store`는 세션 상태와 다른 저장소(앱의 campaign_archive)를 씁니다. 같은 LRU에 두면 진행 중인 캠페인들이
+    서로의 묶음을 밀어내 로그에 빈 구간이 생깁니다.
+    """
+
+    def __init__(self, store, chunk_size=50):
+        self.store = store
+        self.chunk_size = max(1, chunk_size)
+
+    @staticmethod
+    def _chunk_key(sid, index):
+        return f"{sid}:events:{index}"
+
+    def new_state(self, character, lorebook_id):
+        """이벤트가 없는 빈 게임 상태 (캐릭터를 만들기 전의 세션)."""
+        return {
+            'character_data': copy.deepcopy(character), 'lorebook_id': lorebook_id, 'pending_action_for_roll': None,
+            'rng_seed': new_seed(), 'rolls': 0, 'event_seq': 0, 'event_chunks': 0, 'recent_events': [],
+        }
+
+    def start(self, sid, character, lorebook_id, opening_message, seed=None):
+        """새 캠페인을 시작하는 start 이벤트를 기록한 상태를 반환합니다."""
+        state = self.new_state(character, lorebook_id)
+        self.append(sid, state, new_event(
+            'start', character=character, lorebook_id=lorebook_id, story=opening_message,
+            seed=seed if seed is not None else state['rng_seed']
+        ))
+        return state
+
+    def upgrade(self, sid, state):
+        """game_log(HTML 줄 목록)로 저장된 이전 형식의 세션을 이벤트 로그로 옮깁니다.
+
+        줄마다 append를 거치므로 긴 로그도 chunk_size개씩 묶여 보관됩니다 (묶음 번호로 seq 범위를 계산하므로).
+        """
+        if 'event_seq' in state:
+            return state
+        lines = state.pop('game_log', [])
+        state.update({'rng_seed': new_seed(), 'rolls': 0, 'event_seq': 0, 'event_chunks': 0, 'recent_events': []})
+        for line in lines:
+            self.append(sid, state, new_event('line', html=line))
+        return state
+
+    def _push(self, state, event):
+        event['seq'] = state['event_seq'] + 1
+        apply_event(state, event)
+        state['recent_events'].append(event)
+        return event
+
+    def append(self, sid, state, event):
+        """이벤트를 기록하고 상태에 적용합니다. 최근 이벤트가 chunk_size개가 되면 스냅샷과 함께 저장소로 옮깁니다."""
+        self._push(state, event)
+        if sid and len(state['recent_events']) >= self.chunk_size:
+            index = state['event_chunks']
+            self.store.save(self._chunk_key(sid, index), {'events': state['recent_events'], 'snapshot': snapshot(state)})
+            state['event_chunks'] = index + 1
+            state['recent_events'] = []
+        return event
+
+    # --- 읽기 ---
+    def _chunk(self, sid, index):
+        chunk = self.store.load(self._chunk_key(sid, index)) if sid else None
+        if chunk is None:
+            logger.warning(f"보관된 이벤트 묶음을 찾을 수 없습니다: sid={str(sid)[:6]}…, {index}번", extra={'category': 'state'})
+        return chunk
+
+    def chunk_range(self, index):
+        """index번 묶음에 담긴 이벤트의 seq 범위 [처음, 끝]."""
+        return [index * self.chunk_size + 1, (index + 1) * self.chunk_size]
+
+    def events(self, sid, state, start=0, stop=None, missing=None):
+        """index(= seq - 1)가 [start, stop)인 이벤트들을 순서대로 반환합니다. 필요한 묶음만 불러옵니다.
+
+        `missing` 목록을 주면 저장소에서 찾지 못한 묶음 번호를 채웁니다 (빠진 구간을 호출자가 알릴 수 있도록).
+        """
+        stop = state['event_seq'] if stop is None else min(stop, state['event_seq'])
+        archived = state['event_chunks'] * self.chunk_size
+        result = []
+        for index in range(start // self.chunk_size, min(state['event_chunks'], -(-stop // self.chunk_size))):
+            chunk = self._chunk(sid, index)
+            if chunk is not None:
+                result.extend(event for event in chunk['events'] if start < event['seq'] <= stop)
+            elif missing is not None:
+                missing.append(index)
+        if stop > archived:
+            result.extend(event for event in state['recent_events'] if start < event['seq'] <= stop)
+        return result
+
+    def reversed_events(self, sid, state):
+        """최신 이벤트부터 거꾸로 반환합니다. 앞쪽 묶음은 필요할 때만 불러옵니다."""
+        yield from reversed(state['recent_events'])
+        for index in range(state['event_chunks'] - 1, -1, -1):
+            chunk = self._chunk(sid, index)
+            if chunk is not None:
+                yield from reversed(chunk['events'])
+
+    def state_at(self, sid, state, seq):
+        """seq번 이벤트까지 적용한 상태를 만듭니다. 가장 가까운 앞쪽 스냅샷부터 재생하므로 묶음 하나 크기만큼만 적용합니다."""
+        chunk_index = min(seq // self.chunk_size, state['event_chunks'])
+        base = {}
+        if chunk_index > 0:
+            chunk = self._chunk(sid, chunk_index - 1)
+            base = copy.deepcopy(chunk['snapshot']) if chunk is not None else {}
+        for event in self.events(sid, state, base.get('event_seq') or 0, seq):
+            apply_event(base, copy.deepcopy(event))
+        return base
+
+    def export(self, sid, state):
+        """재생 도구(replay.py)용 캠페인 기록: 전체 이벤트, 묶음별 스냅샷, 현재 상태.
+
+        주사위 시드를 알면 다음 판정의 눈을 미리 알 수 있으므로 start 이벤트와 스냅샷에서 시드를 빼고 내보냅니다.
+        재생은 roll 이벤트에 기록된 눈을 그대로 씁니다.
+        """
+        snapshots, missing = [], []
+        for index in range(state['event_chunks']):
+            chunk = self._chunk(sid, index)
+            if chunk is not None:
+                snapshots.append(_without_seed(chunk['snapshot']))
+        events = [_without_seed(event) if event['type'] == 'start' else event for event in self.events(sid, state, missing=missing)]
+        record = {'format': 1, 'events': events, 'snapshots': snapshots, 'head': _without_seed(snapshot(state))}
+        if missing:
+            record['missing'] = [self.chunk_range(index) for index in missing]
+        return record
+
+    def delete(self, sid, state):
+        for index in range(state.get('event_chunks', 0)):
+            self.store.delete(self._chunk_key(sid, index))
+
+
+class LogView:
+    """게임 로그(HTML 줄 목록)처럼 읽을 수 있는 이벤트 로그 보기.
+
+    StoryMemory와 스토리 요약은 len()/슬라이스/역순 순회만 쓰므로, 필요한 이벤트 묶음만 불러와 그 자리에서 그립니다.
+    """
+
+    def __init__(self, campaign, sid, state):
+        self.campaign = campaign
+        self.sid = sid
+        self.state = state
+
+    def __len__(self):
+        return self.state['event_seq']
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [render_html(event) for event in self.campaign.events(self.sid, self.state, start, stop)][::step]
+        if index < 0:
+            index += len(self)
+        events = self.campaign.events(self.sid, self.state, index, index + 1)
+        if not events:
+            raise IndexError(index)
+        return render_html(events[0])
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __reversed__(self):
+        return (render_html(event) for event in self.campaign.reversed_events(self.sid, self.state))
@@ -0,0 +1,181 @@
+"""2d6 판정 규칙과 결과 확률표.
+
+판정은 2d6 + 수정치(능력치로 결정)의 총합이 10 이상이면 완전한 성공, 7 이상이면 대가를 치르는 성공, 그 밖에는 실패입니다.
+판정 결과를 정하는 코드와 확률을 계산하는 코드가 같은 규칙(이 모듈)을 쓰도록 모았습니다.
+
+- outcome_odds(): 주사위 조합을 모두 세어 구한 정확한 결과 확률 (규칙/수정치별로 캐시)
+- stat_odds_table(): 캐릭터 능력치별 성공 확률 (UI의 "성공 58%" 표시, 판정 프롬프트에 사용)
+- simulate(): 배치 Monte Carlo. NumPy가 있으면 벡터화해 초당 수백만 번을 굴리고, 없으면 순수 Python으로 굴립니다.
+  정확한 표로 계산하기 어려운 규칙을 추가할 때 표와 비교하는 균형 점검용입니다.
+
+변형 규칙(ROLL_VARIANTS): normal(2d6), advantage(3d6 중 높은 2개), penalty(3d6 중 낮은 2개).
+
+사용 예 (backend 폴더에서):
+    python dice_odds.py                                 # 수정치별 정확한 확률표
+    python dice_odds.py --simulate 5000000 --variant advantage
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from functools import lru_cache
+
+from turn_schema import STAT_MAPPING_KO
+
+FULL_SUCCESS = "완전한 성공"
+PARTIAL_SUCCESS = "대가를 치르는 성공"
+FAILURE = "실패"
+OUTCOMES = (FULL_SUCCESS, PARTIAL_SUCCESS, FAILURE)
+FULL_SUCCESS_AT = 10
+PARTIAL_SUCCESS_AT = 7
+
+# 변형 규칙: (굴리는 주사위 수, 남기는 쪽). 남기는 쪽이 None이면 모두 더함
+ROLL_VARIANTS = {
+    'normal': (2, None),
+    'advantage': (3, 'high'),
+    'penalty': (3, 'low'),
+}
+MODIFIERS = (-1, 0, 1)  # get_modifier가 줄 수 있는 수정치
+
+
+def get_modifier(stat_value):
+    if stat_value >= 3: return 1
+    elif stat_value >= 2: return 0
+    else: return -1 # 1일 때 -1
+
+
+def roll_outcome(total):
+    """총합(주사위 + 수정치)에 따른 판정 결과."""
+    if total >= FULL_SUCCESS_AT:
+        return FULL_SUCCESS
+    if total >= PARTIAL_SUCCESS_AT:
+        return PARTIAL_SUCCESS
+    return FAILURE
+
+
+def _kept_sum(dice, keep):
+    if keep is None:
+        return sum(dice)
+    ordered = sorted(dice)
+    return sum(ordered[-2:] if keep == 'high' else ordered[:2])
+
+
+@lru_cache(maxsize=None)
+def sum_distribution(variant='normal'):
+    """주사위 합(수정치 제외)별 경우의 수와 전체 경우의 수."""
+    count, keep = ROLL_VARIANTS[variant]
+    sums = Counter(_kept_sum(dice, keep) for dice in itertools.product(range(1, 7), repeat=count))
+    return dict(sums), 6 ** count
+
+
+@lru_cache(maxsize=None)
+def _outcome_odds(modifier, variant):
+    sums, total = sum_distribution(variant)
+    odds = dict.fromkeys(OUTCOMES, 0.0)
+    for dice_sum, ways in sums.items():
+        odds[roll_outcome(dice_sum + modifier)] += ways / total
+    return odds
+
+
+def outcome_odds(modifier, variant='normal'):
+    """수정치와 규칙에 따른 결과별 정확한 확률 {결과: 확률}과 성공(완전한 성공 + 대가를 치르는 성공) 확률."""
+    odds = dict(_outcome_odds(modifier, variant))
+    return {'odds': odds, 'success': odds[FULL_SUCCESS] + odds[PARTIAL_SUCCESS]}
+
+
+def stat_odds(stats, stat, variant='normal'):
+    """캐릭터 능력치 하나로 판정할 때의 수정치와 결과 확률."""
+    modifier = get_modifier(stats.get(stat, 0))
+    return {'stat': stat, 'stat_ko': STAT_MAPPING_KO.get(stat, stat), 'modifier': modifier,
+            **outcome_odds(modifier, variant)}
+
+
+def stat_odds_table(stats, variant='normal'):
+    """캐릭터의 모든 능력치에 대한 판정 확률표."""
+    return [stat_odds(stats, stat, variant) for stat in STAT_MAPPING_KO if stat in stats]
+
+
+def format_odds(odds):
+    """프롬프트용 한 줄 표기: '완전한 성공 28%, 대가를 치르는 성공 44%, 실패 28%'."""
+    return ', '.join(f"{outcome} {round(probability * 100)}%" for outcome, probability in odds['odds'].items())
+
+
+# --- Monte Carlo ---
+def _simulate_numpy(np, rng, n, count, keep, modifier):
+    dice = rng.integers(1, 7, size=(n, count), dtype=np.int8)
+    if keep is not None:
+        dice.sort(axis=1)
+        dice = dice[:, -2:] if keep == 'high' else dice[:, :2]
+    totals = dice.sum(axis=1, dtype=np.int16) + modifier
+    full = int(np.count_nonzero(totals >= FULL_SUCCESS_AT))
+    partial = int(np.count_nonzero(totals >= PARTIAL_SUCCESS_AT)) - full
+    return {FULL_SUCCESS: full, PARTIAL_SUCCESS: partial, FAILURE: n - full - partial}
+
+
+def _simulate_python(rng, n, count, keep, modifier):
+    counts = dict.fromkeys(OUTCOMES, 0)
+    randint = rng.randint
+    for _ in range(n):
+        counts[roll_outcome(_kept_sum([randint(1, 6) for _ in range(count)], keep) + modifier)] += 1
+    return counts
+
+
+def simulate(modifier, rolls=1_000_000, variant='normal', seed=None, batch_size=1_000_000, use_numpy=True):
+    """판정을 rolls번 굴려 결과 빈도를 셉니다. 메모리를 일정하게 쓰도록 batch_size개씩 나눠 굴립니다."""
+    count, keep = ROLL_VARIANTS[variant]
+    np = None
+    if use_numpy:
+        try:
+            import numpy as np
+        except ImportError:  # NumPy가 없는 환경에서는 순수 Python으로 (느리지만 같은 결과)
+            np = None
+    rng = np.random.default_rng(seed) if np is not None else random.Random(seed)
+    counts = dict.fromkeys(OUTCOMES, 0)
+    started = time.perf_counter()
+    remaining = rolls
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        batch = (_simulate_numpy(np, rng, n, count, keep, modifier) if np is not None
+                 else _simulate_python(rng, n, count, keep, modifier))
+        for outcome, hits in batch.items():
+            counts[outcome] += hits
+        remaining -= n
+    seconds = time.perf_counter() - started
+    odds = {outcome: hits / rolls for outcome, hits in counts.items()} if rolls else dict.fromkeys(OUTCOMES, 0.0)
+    return {
+        'variant': variant, 'modifier': modifier, 'rolls': rolls, 'engine': 'numpy' if np is not None else 'python',
+        'odds': odds, 'success': odds[FULL_SUCCESS] + odds[PARTIAL_SUCCESS],
+        'seconds': round(seconds, 3), 'rolls_per_second': round(rolls / seconds) if seconds > 0 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variant', default='normal', choices=tuple(ROLL_VARIANTS))
+    parser.add_argument('--simulate', type=int, default=0, help='수정치마다 Monte Carlo로 굴릴 횟수 (0이면 정확한 표만)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--no-numpy', action='store_true', help='NumPy가 있어도 순수 Python으로 굴림')
+    parser.add_argument('--json', action='store_true', help='결과를 JSON 줄로 출력')
+    args = parser.parse_args()
+
+    for modifier in MODIFIERS:
+        exact = outcome_odds(modifier, args.variant)
+        result = {'variant': args.variant, 'modifier': modifier, 'exact': exact}
+        if args.simulate:
+            result['simulated'] = simulate(modifier, args.simulate, args.variant, args.seed, use_numpy=not args.no_numpy)
+            result['max_error'] = max(abs(result['simulated']['odds'][outcome] - exact['odds'][outcome]) for outcome in OUTCOMES)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+            continue
+        line = f"{args.variant:>9} {modifier:+d}: {format_odds(exact)} (성공 {exact['success'] * 100:.1f}%)"
+        if args.simulate:
+            simulated = result['simulated']
+            line += (f" | {simulated['engine']} {simulated['rolls']}회 성공 {simulated['success'] * 100:.2f}%, "
+                     f"최대 오차 {result['max_error'] * 100:.3f}%p, {simulated['rolls_per_second']:,}회/초")
+        print(line, flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""로컬 대체 모델 (fake Gemini).
+
+실제 Gemini를 호출하지 않고 서버의 처리량/지연을 측정하거나 개발할 수 있도록,
+`genai.GenerativeModel.generate_content`와 같은 모양의 인터페이스를 제공합니다.
+
+- 지연 분포: fixed / uniform / lognormal (평균 latency_ms 기준)
+- 오류율: error_rate 확률로 일시적 오류(FakeModelError, transient=True)를 발생시켜 재시도 경로를 검증
+- 출력 크기: story_chars를 지정하면 story 텍스트를 그 길이까지 늘림
+- 스트리밍: stream=True면 응답 텍스트를 여러 조각으로 나눠 지연을 나누어 yield
+- request_options의 timeout을 넘는 지연은 TimeoutError로 끝남 (실제 API의 DeadlineExceeded 대응)
+
+응답 내용은 `responder(prompt_text)`가 반환하는 dict를 parse_ai_response 형식(```json 블록)으로 감싼 것입니다.
+"""
+import json
+import math
+import random
+import threading
+import time
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+STREAM_CHUNK_CHARS = 40
+FIRST_CHUNK_LATENCY_RATIO = 0.3  # 전체 지연 중 첫 조각까지 걸리는 비율
+
+
+class FakeModelError(Exception):
+    """대체 모델이 일부러 발생시키는 일시적 오류 (429/503에 해당)."""
+    transient = True
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def _default_responder(prompt_text):
+    return {"story": "[테스트 모드] 별다른 일은 일어나지 않았습니다.", "require_roll": False, "roll_stat": None}
+
+
+class FakeGenerativeModel:
+    def __init__(self, responder=None, latency_ms=800.0, latency_distribution='lognormal', latency_sigma=0.5,
+                 error_rate=0.0, story_chars=0, seed=None):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution} (choose from {LATENCY_DISTRIBUTIONS})")
+        self.responder = responder or _default_responder
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.story_chars = story_chars
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()  # random.Random 인스턴스는 스레드 간 공유되므로 보호
+
+    def sample_latency(self):
+        """이번 호출의 지연(초)을 뽑습니다."""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0 or self.latency_distribution == 'fixed':
+            return max(0.0, mean)
+        with self._lock:
+            if self.latency_distribution == 'uniform':
+                return self._random.uniform(0, 2 * mean)
+            # 평균이 mean이 되도록 mu를 맞춘 로그정규 분포 (긴 꼬리를 가진 실제 API 지연에 가까움)
+            mu = math.log(mean) - self.latency_sigma ** 2 / 2
+            return self._random.lognormvariate(mu, self.latency_sigma)
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _render(self, contents):
+        prompt_text = contents if isinstance(contents, str) else ''.join(str(part) for part in contents)
+        reply = dict(self.responder(prompt_text))
+        if self.story_chars and len(reply.get('story', '')) < self.story_chars:
+            story = reply.get('story', '')
+            filler = ' 어둠 속에서 무언가가 움직입니다.'
+            reply['story'] = (story + filler * (self.story_chars // len(filler) + 1))[:self.story_chars]
+        return '```json\n' + json.dumps(reply, ensure_ascii=False) + '\n```'
+
+    def _sleep(self, seconds, timeout):
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake model: {seconds:.2f}s latency exceeded request timeout {timeout:.2f}s")
+        time.sleep(seconds)
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        timeout = (request_options or {}).get('timeout')
+        latency = self.sample_latency()
+        if self._should_fail():
+            # 실제 API처럼 오류도 약간의 지연 뒤에 돌아옴
+            self._sleep(latency * FIRST_CHUNK_LATENCY_RATIO, timeout)
+            raise FakeModelError("fake model: injected transient error")
+        text = self._render(contents)
+        if not stream:
+            self._sleep(latency, timeout)
+            return _FakeResponse(text)
+        return self._stream(text, latency, timeout)
+
+    def _stream(self, text, latency, timeout):
+        started = time.monotonic()
+        self._sleep(latency * FIRST_CHUNK_LATENCY_RATIO, timeout)
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        per_piece = latency * (1 - FIRST_CHUNK_LATENCY_RATIO) / max(1, len(pieces) - 1)
+        for index, piece in enumerate(pieces):
+            if index:
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                self._sleep(per_piece, remaining)
+            yield _FakeResponse(piece)
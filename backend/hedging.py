@@ -0,0 +1,255 @@
+"""턴 지연 상한: 헤지(hedged) 요청과 마감 시각 초과 시의 대체 응답.
+
+Gemini Pro의 느린 꼬리 지연 때문에 턴 하나가 수십 초씩 걸리지 않도록 턴마다 마감 시각(SLO)을 정합니다.
+
+- 기본 호출이 최근 지연의 분위수(예: p90)만큼 기다려도 끝나지 않으면, 같은 프롬프트를 다른 계층(기본: fast)으로
+  한 번 더 보내 먼저 도착한 응답을 씁니다 (hedged request).
+- 마감 시각까지 어느 쪽도 응답하지 않으면 TurnDeadlineExceeded를 발생시켜 로컬 대체 GM 응답으로 턴을 처리하게 합니다.
+  진행 중이던 호출은 끝까지 두었다가 LateAnswers에 보관해, 나중에 실제 응답으로 보충(reconcile)할 수 있게 합니다.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+
+from llm_client import LLMTimeoutError, is_transient_error
+from turn_metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+_POLL_SECONDS = 0.05  # 스트리밍 중 헤지 요청의 완료를 확인하는 간격
+
+
+class TurnDeadlineExceeded(LLMTimeoutError):
+    """턴 마감 시각까지 모델 응답을 받지 못했습니다. `pending`은 나중에라도 응답이 올 수 있는 Future 목록입니다."""
+
+    def __init__(self, message, pending=()):
+        super().__init__(message)
+        self.pending = [future for future in pending if future is not None and not future.cancelled()]
+
+
+class Hedger:
+    """턴 마감 시각 안에서 기본 호출과 헤지 호출 중 먼저 끝난 응답을 돌려줍니다.
+
+    헤지 시점은 기본 계층의 최근 지연 분위수(`quantile`)이며, 표본이 부족하면 `default_after`초를 씁니다.
+    `hedge_tier`가 None이면 헤지하지 않고 마감 시각만 지킵니다. 헤지 요청도 과금되는 모델 호출이므로,
+    기본 호출이 이미 헤지 계층으로 라우팅된 턴은 지연을 줄일 수 없어 헤지하지 않습니다.
+    """
+
+    def __init__(self, router, hedge_tier='fast', quantile=0.9, min_samples=20, default_after=8.0,
+                 min_after=1.0, prefix='trpg'):
+        self.router = router
+        self.hedge_tier = hedge_tier if hedge_tier in router.tiers else None
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_after = default_after
+        self.min_after = min_after
+        self._lock = threading.Lock()
+        self._outcomes = {'primary': 0, 'primary_after_hedge': 0, 'hedge': 0, 'deadline': 0}
+        self.outcomes_total = Counter(f'{prefix}_turn_call_outcomes_total',
+                                      'Turn model calls by which call answered (or deadline)', ('outcome',))
+
+    def hedge_after(self, tier):
+        """이 계층의 기본 호출을 몇 초 기다린 뒤 헤지할지."""
+        observed = self.router.latency_quantile(tier, self.quantile, self.min_samples)
+        return max(self.min_after, observed if observed is not None else self.default_after)
+
+    def _hedge_tier_for(self, tier):
+        """기본 계층이 `tier`인 호출의 헤지 계층 (같은 계층이면 None)."""
+        return self.hedge_tier if self.hedge_tier != tier else None
+
+    def _record(self, outcome):
+        self.outcomes_total.inc(outcome=outcome)
+        with self._lock:
+            self._outcomes[outcome] += 1
+
+    def _cancel(self, tier, future):
+        if future is not None and not future.done():
+            self.router.tier(tier).client.cancel(future)
+
+    def _deadline(self, tier, pending):
+        self._record('deadline')
+        logger.warning(f"[{tier}] 턴 마감 시각까지 모델 응답이 없어 대체 응답을 사용합니다.", extra={'category': 'turn'})
+        return TurnDeadlineExceeded(f"[{tier}] 턴 마감 시각을 넘겼습니다.", pending)
+
+    # --- 일반 호출 ---
+    def call(self, tier, submit, deadline_at):
+        """`submit(계층)`은 응답 객체로 끝나는 Future를 반환해야 합니다. 먼저 성공한 응답 객체를 반환합니다."""
+        hedge_tier = self._hedge_tier_for(tier)
+        primary = submit(tier)
+        tiers = {primary: tier}
+        hedge_at = time.monotonic() + self.hedge_after(tier)
+        hedged = False
+        pending = {primary}
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline_at:
+                raise self._deadline(tier, pending)
+            wake = deadline_at if hedged or hedge_tier is None else min(deadline_at, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        self._cancel(tiers[other], other)
+                    self._record('hedge' if future is not primary else 'primary_after_hedge' if hedged else 'primary')
+                    return future.result()
+                error = future.exception()
+            # 기본 호출이 일시적 오류로 실패했거나 헤지 시점이 되면 다른 계층으로 한 번 더 보냄
+            failed_transient = error is not None and not pending and is_transient_error(error)
+            if not hedged and hedge_tier is not None and (failed_transient or time.monotonic() >= hedge_at):
+                hedged = True
+                hedge = submit(hedge_tier)
+                tiers[hedge] = hedge_tier
+                pending.add(hedge)
+                logger.info(f"[{tier}] 응답이 늦어 {hedge_tier} 계층으로 헤지 요청을 보냅니다.", extra={'category': 'turn'})
+        raise error
+
+    # --- 스트리밍 호출 ---
+    def stream(self, tier, start_stream, submit, deadline_at):
+        """`start_stream(계층)`은 StreamHandle을 반환해야 합니다. 텍스트 조각을 yield 합니다.
+
+        첫 조각이 헤지 시점까지 오지 않으면 `submit(헤지 계층)`으로 전체 응답을 요청하고, 그쪽이 먼저 끝나면
+        응답 전체를 한 번에 yield 합니다. 첫 조각이 먼저 오면 헤지 요청은 취소합니다.
+        """
+        hedge_tier = self._hedge_tier_for(tier)
+        handle = start_stream(tier)
+        hedge_at = time.monotonic() + self.hedge_after(tier)
+        hedge, hedged, received = None, False, False
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    raise self._deadline(tier, [handle.detach(), hedge])
+                if not hedged and not received and hedge_tier is not None and now >= hedge_at:
+                    hedged = True
+                    hedge = submit(hedge_tier)
+                    logger.info(f"[{tier}] 첫 응답이 늦어 {hedge_tier} 계층으로 헤지 요청을 보냅니다.", extra={'category': 'turn'})
+                if hedge is not None and hedge.done():
+                    if hedge.exception() is None:
+                        handle.cancel()
+                        self._record('hedge')
+                        yield hedge.result().text
+                        return
+                    hedge = None  # 헤지 요청이 실패하면 기본 스트림만 기다림
+
+                timeout = deadline_at - now
+                if hedge is not None:
+                    timeout = min(timeout, _POLL_SECONDS)
+                elif not hedged and not received and hedge_tier is not None:
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+                try:
+                    text = handle.next_chunk(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    continue
+                except Exception:
+                    if hedge is None or received:
+                        raise
+                    # 기본 스트림이 조각을 보내기 전에 실패하면 헤지 요청의 결과를 기다림
+                    try:
+                        response = hedge.result(timeout=max(0.0, deadline_at - time.monotonic()))
+                    except FutureTimeoutError:
+                        raise self._deadline(tier, [hedge])
+                    self._record('hedge')
+                    yield response.text
+                    return
+                if text is None:
+                    if not received:
+                        self._record('primary_after_hedge' if hedged else 'primary')
+                    return
+                if not received:
+                    received = True
+                    self._record('primary_after_hedge' if hedged else 'primary')
+                    if hedge is not None:
+                        self._cancel(hedge_tier, hedge)
+                        hedge = None
+                yield text
+        finally:
+            handle.cancel()
+
+    def stats(self):
+        with self._lock:
+            outcomes = dict(self._outcomes)
+        return {
+            'hedge_tier': self.hedge_tier,
+            'quantile': self.quantile,
+            'hedge_after_seconds': {name: round(self.hedge_after(name), 3) for name in self.router.tiers},
+            'outcomes': outcomes,
+        }
+
+
+class LateAnswers:
+    """마감 시각을 넘겨 대체 응답으로 처리한 턴의 실제 모델 응답을 보관합니다.
+
+    응답이 도착하면 `parse(text)`로 읽어 두고, 클라이언트는 get()으로, 다음 턴은 take_ready()로 가져갑니다.
+    """
+
+    def __init__(self, parse, max_entries=256, ttl_seconds=600):
+        self.parse = parse
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # answer_id -> dict
+        self._lock = threading.Lock()
+        self._counters = {'tracked': 0, 'ready': 0, 'failed': 0}
+
+    def track(self, owner, pending):
+        """대체 응답으로 처리한 턴의 진행 중인 호출들을 등록하고 answer_id를 반환합니다. 기다릴 호출이 없으면 None."""
+        if not pending:
+            return None
+        answer_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._expire()
+            self._entries[answer_id] = {'owner': owner, 'status': 'pending', 'answer': None,
+                                        'created': time.monotonic(), 'waiting': len(pending)}
+            self._counters['tracked'] += 1
+        for future in pending:
+            future.add_done_callback(lambda done, answer_id=answer_id: self._resolve(answer_id, done))
+        return answer_id
+
+    def _resolve(self, answer_id, future):
+        ok = not future.cancelled() and future.exception() is None
+        answer = self.parse(future.result().text) if ok else None
+        with self._lock:
+            entry = self._entries.get(answer_id)
+            if entry is None or entry['status'] != 'pending':
+                return
+            entry['waiting'] -= 1
+            if ok:
+                entry.update(status='ready', answer=answer)
+                self._counters['ready'] += 1
+            elif entry['waiting'] <= 0:
+                entry['status'] = 'failed'
+                self._counters['failed'] += 1
+
+    def get(self, answer_id, owner):
+        """(상태, 응답) 또는 다른 세션의 것이거나 없으면 None."""
+        with self._lock:
+            entry = self._entries.get(answer_id)
+            if entry is None or entry['owner'] != owner:
+                return None
+            return {'status': 'ready' if entry['status'] == 'merged' else entry['status'], 'answer': entry['answer']}
+
+    def take_ready(self, owner):
+        """이 세션에서 도착했지만 아직 게임 로그에 반영하지 않은 응답들을 반환합니다 (한 번만)."""
+        with self._lock:
+            ready = []
+            for entry in self._entries.values():
+                if entry['owner'] == owner and entry['status'] == 'ready':
+                    entry['status'] = 'merged'
+                    ready.append(entry['answer'])
+            return ready
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._entries:
+            answer_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry['created'] < self.ttl_seconds:
+                break
+            del self._entries[answer_id]
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'entries': len(self._entries)}
@@ -0,0 +1,168 @@
+"""스트리밍 중인(아직 닫히지 않은) JSON 텍스트를 다루는 도구.
+
+Gemini 스트리밍 응답은 ```json ... ``` 블록이 조금씩 도착하므로, 전체 JSON이 완성되기 전에
+`story` 문자열 필드만 먼저 꺼내 클라이언트에 흘려보낼 때 사용합니다.
+응답이 끝난 뒤에는 loads_tolerant로 잘리거나 약간 깨진 JSON도 복구해 읽습니다.
+"""
+import json
+import re
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def extract_partial_string_field(buffer, field):
+    """`buffer`에서 문자열 필드 `field`의 값을 지금까지 도착한 만큼 디코딩해 반환합니다.
+
+    반환값은 (값, 완료 여부) 튜플입니다. 필드가 아직 나타나지 않았다면 (None, False)를 반환합니다.
+    끝이 잘린 이스케이프 시퀀스(예: `\\u12`)는 다음 청크가 도착할 때까지 결과에 포함하지 않습니다.
+    """
+    match = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', buffer)
+    if not match:
+        return None, False
+
+    out = []
+    i = match.end()
+    length = len(buffer)
+    while i < length:
+        ch = buffer[i]
+        if ch == '"':
+            return ''.join(out), True
+        if ch != '\\':
+            out.append(ch)
+            i += 1
+            continue
+        # 이스케이프 시퀀스 처리
+        if i + 1 >= length:
+            break
+        esc = buffer[i + 1]
+        if esc == 'u':
+            hex_digits = buffer[i + 2:i + 6]
+            if len(hex_digits) < 4:
+                break
+            try:
+                code = int(hex_digits, 16)
+            except ValueError:
+                out.append(hex_digits)
+                i += 6
+                continue
+            # 서로게이트 쌍(이모지 등)은 두 번째 절반이 도착해야 디코딩 가능
+            if 0xD800 <= code <= 0xDBFF:
+                low = buffer[i + 6:i + 12]
+                if len(low) < 6:
+                    break
+                if low.startswith('\\u'):
+                    try:
+                        low_code = int(low[2:], 16)
+                        out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low_code - 0xDC00)))
+                        i += 12
+                        continue
+                    except ValueError:
+                        pass
+            out.append(chr(code))
+            i += 6
+        else:
+            out.append(_SIMPLE_ESCAPES.get(esc, esc))
+            i += 2
+    return ''.join(out), False
+
+
+_PARTIAL_LITERAL_PATTERN = re.compile(r'(?<![\w"])(t|tr|tru|f|fa|fal|fals|n|nu|nul)$')
+_LITERAL_COMPLETIONS = {'t': 'true', 'f': 'false', 'n': 'null'}
+_MAX_REPAIR_ATTEMPTS = 8
+_MAX_START_ATTEMPTS = 8  # 객체 시작으로 시도해 볼 `{` 위치 수
+
+
+def _close_truncated(text, closers):
+    """끝이 잘린 JSON 조각 `text`를 닫는 괄호로 마무리합니다. 값이 빠진 키/끝의 쉼표는 정리합니다."""
+    text = text.rstrip()
+    if text.endswith(','):
+        text = text[:-1].rstrip()
+    if text.endswith(':'):
+        text += ' null'
+    literal = _PARTIAL_LITERAL_PATTERN.search(text)
+    if literal:
+        text = text[:literal.start()] + _LITERAL_COMPLETIONS[literal.group(1)[0]]
+    return text + ''.join(reversed(closers))
+
+
+def loads_tolerant(text):
+    """텍스트에서 첫 번째 JSON 객체를 읽습니다. 반환값은 (객체 또는 None, 복구 여부) 튜플입니다.
+
+    코드 펜스나 앞뒤 설명 문장은 건너뛰고, 한 번의 스캔으로 다음을 복구합니다.
+    - 닫는 괄호 앞의 불필요한 쉼표
+    - 문자열 안의 줄바꿈 같은 제어 문자
+    - 출력이 중간에 잘린 경우: 열린 문자열/배열/객체를 닫고, 그래도 읽을 수 없으면 마지막 쉼표 지점까지 되돌림
+
+    앞의 설명 문장에 중괄호가 있으면(`Sure! {note} {"story": ...}`) 그 다음 `{`부터 다시 시도합니다 (최대 _MAX_START_ATTEMPTS곳).
+    """
+    start = text.find('{')
+    for _ in range(_MAX_START_ATTEMPTS):
+        if start < 0:
+            break
+        result, repaired = _loads_from(text, start)
+        if result is not None:
+            return result, repaired
+        start = text.find('{', start + 1)
+    return None, False
+
+
+def _loads_from(text, start):
+    """text[start]의 `{`부터 JSON 객체 하나를 읽습니다 (loads_tolerant의 한 번의 시도)."""
+    out = []
+    stack = []        # 아직 닫히지 않은 괄호에 대응하는 닫는 괄호
+    cut_points = []   # (out 길이, 그 시점의 stack) - 쉼표 직전, 잘린 응답을 되돌릴 수 있는 지점
+    in_string = escape = repaired = False
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            # 닫는 괄호 앞의 쉼표 제거 ({"a": 1,} → {"a": 1})
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+                repaired = True
+            if not stack:
+                break
+            if stack[-1] != ch:
+                repaired = True
+            out.append(stack.pop())
+            if not stack:
+                break
+            continue
+        elif ch == ',':
+            cut_points.append((len(out), list(stack)))
+        out.append(ch)
+
+    body = ''.join(out)
+    if not stack:
+        try:
+            return json.loads(body, strict=False), repaired
+        except ValueError:
+            return None, False
+
+    # 출력이 잘림: 열린 문자열을 닫고 괄호를 채운 뒤, 실패하면 쉼표 지점으로 한 단계씩 되돌아가며 시도
+    if in_string:
+        candidate = body[:-1] if escape else body
+        candidates = [_close_truncated(candidate + '"', stack)]
+    else:
+        candidates = [_close_truncated(body, stack)]
+    for length, closers in reversed(cut_points[-_MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(_close_truncated(body[:length], closers))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate, strict=False), True
+        except ValueError:
+            continue
+    return None, False
@@ -0,0 +1,299 @@
+"""Gemini 호출 전용 실행 계층.
+
+웹 요청 스레드가 `model.generate_content`를 직접 호출하면 Gemini 응답을 기다리는 동안
+워커가 통째로 묶입니다. LLMClient는 모델 호출을 전용 스레드 풀에서 실행하고 다음을 제공합니다.
+
+- 동시 호출 수 제한 (max_in_flight): 초과한 요청은 대기열에서 순서를 기다림
+- 턴별 마감 시간 (deadline): 넘기면 LLMTimeoutError
+- 일시적 오류(429, 5xx, 네트워크 오류)에 대한 지터(jitter) 백오프 재시도
+- 대기열 길이 / 진행 중 호출 수 통계 (stats)
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+_transient_exceptions = None
+
+
+def _google_transient_exceptions():
+    # google-api-core는 import가 무거우므로 처음 오류가 났을 때 불러옵니다 (서버 시작 시간 단축).
+    global _transient_exceptions
+    if _transient_exceptions is None:
+        try:
+            from google.api_core import exceptions as google_exceptions
+            _transient_exceptions = (
+                google_exceptions.TooManyRequests,
+                google_exceptions.ResourceExhausted,
+                google_exceptions.ServiceUnavailable,
+                google_exceptions.InternalServerError,
+                google_exceptions.GatewayTimeout,
+                google_exceptions.DeadlineExceeded,
+            )
+        except ImportError:  # google-api-core가 없는 환경 (로컬 대체 모델만 사용하는 경우)
+            _transient_exceptions = ()
+    return _transient_exceptions
+
+
+class LLMTimeoutError(Exception):
+    """턴 마감 시간 안에 모델 응답을 받지 못했을 때 발생합니다."""
+
+
+def is_transient_error(exc):
+    """재시도하면 성공할 가능성이 있는 오류인지 판단합니다."""
+    if getattr(exc, 'transient', False):
+        return True
+    return isinstance(exc, _google_transient_exceptions() + (ConnectionError, TimeoutError))
+
+
+class LazyModel:
+    """처음 필요할 때 `factory()`로 실제 모델을 만드는 래퍼.
+
+    SDK import와 모델 생성을 서버 시작 시점이 아니라 첫 호출(또는 미리 데우기) 시점으로 미룹니다.
+    `on_load(name, seconds)`가 있으면 생성에 걸린 시간을 알려줍니다.
+    """
+
+    def __init__(self, factory, name, on_load=None):
+        self.factory = factory
+        self.name = name
+        self.on_load = on_load
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = self.factory()
+                    if self.on_load is not None:
+                        self.on_load(self.name, time.perf_counter() - started)
+        return self._model
+
+    def generate_content(self, *args, **kwargs):
+        return self.load().generate_content(*args, **kwargs)
+
+    def count_tokens(self, *args, **kwargs):
+        return self.load().count_tokens(*args, **kwargs)
+
+
+class StreamResult:
+    """스트리밍 호출이 끝까지 받은 응답. generate()의 응답 객체처럼 `text`를 제공합니다."""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class StreamHandle:
+    """진행 중인 스트리밍 호출.
+
+    next_chunk()로 조각을 하나씩 받습니다. cancel()하면 다음 조각에서 호출을 멈추고,
+    detach()하면 더는 조각을 받지 않되 호출은 끝까지 진행해 `future`로 전체 응답(StreamResult)을 돌려줍니다.
+    """
+
+    def __init__(self, deadline_at):
+        self.deadline_at = deadline_at
+        self.parts = []
+        self.cancelled = threading.Event()
+        self.detached = False
+        self.future = None
+        self._chunks = queue.Queue()
+
+    def remaining(self):
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def _on_chunk(self, text):
+        if self.cancelled.is_set():
+            raise LLMTimeoutError("스트림이 취소되었습니다.")
+        self.parts.append(text)
+        if not self.detached:
+            self._chunks.put(('chunk', text))
+
+    def next_chunk(self, timeout):
+        """다음 텍스트 조각. 응답이 끝났으면 None, `timeout`초 안에 오지 않으면 queue.Empty가 발생합니다."""
+        kind, value = self._chunks.get(timeout=timeout)
+        if kind == 'error':
+            raise value
+        return value if kind == 'chunk' else None
+
+    def cancel(self):
+        if not self.detached:
+            self.cancelled.set()
+
+    def detach(self):
+        """조각 전달을 멈추고 전체 응답을 받을 Future를 반환합니다."""
+        self.detached = True
+        return self.future
+
+
+class LLMClient:
+    """모델 하나에 대한 동시성 제한/마감 시간/재시도 래퍼.
+
+    `model`은 `generate_content(prompt, stream=..., **kwargs)`를 제공하는 객체입니다.
+    """
+
+    def __init__(self, model, name='default', max_in_flight=4, default_deadline=60.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0):
+        self.model = model
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.default_deadline = default_deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f'llm-{name}')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._counters = {'completed': 0, 'failed': 0, 'retries': 0, 'timeouts': 0}
+
+    # --- 통계 ---
+    @property
+    def queue_depth(self):
+        """실행 슬롯을 기다리고 있는 호출 수."""
+        with self._lock:
+            return self._queued
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                **self._counters,
+            }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    # --- 호출 ---
+    def generate(self, prompt, deadline=None, model=None, **kwargs):
+        """모델 응답 객체를 반환합니다. 마감 시간을 넘기면 LLMTimeoutError가 발생합니다.
+
+        `model`을 주면 이번 호출만 기본 모델 대신 사용합니다 (예: 캐시 컨텍스트에 묶인 모델).
+        """
+        deadline_at = time.monotonic() + (deadline or self.default_deadline)
+        future = self.submit(prompt, deadline_at=deadline_at, model=model, **kwargs)
+        try:
+            return future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+        except FutureTimeoutError:
+            self.cancel(future)
+            self._count('timeouts')
+            raise LLMTimeoutError(f"[{self.name}] 모델 응답이 마감 시간({deadline or self.default_deadline}초)을 넘겼습니다.")
+
+    def submit(self, prompt, deadline_at=None, model=None, **kwargs):
+        """호출을 대기열에 넣고 Future를 반환합니다."""
+        if deadline_at is None:
+            deadline_at = time.monotonic() + self.default_deadline
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._run, prompt, deadline_at, None, model, kwargs)
+
+    def cancel(self, future):
+        """submit()으로 받은 호출을 취소합니다. 아직 대기열에 있을 때만 취소되며, 그렇다면 True를 반환합니다."""
+        if future.cancel():
+            # 실행되기 전에 취소되었으면 대기열 카운트를 직접 정리
+            with self._lock:
+                self._queued -= 1
+            return True
+        return False
+
+    def stream(self, prompt, deadline=None, model=None, **kwargs):
+        """스트리밍 호출. 도착하는 텍스트 조각을 순서대로 yield 합니다.
+
+        재시도는 첫 조각이 도착하기 전까지만 수행합니다. 이미 일부를 클라이언트에 보낸 뒤에는
+        중복 출력이 생기므로 오류를 그대로 전달합니다.
+        """
+        handle = self.start_stream(prompt, deadline=deadline, model=model, **kwargs)
+        try:
+            while True:
+                try:
+                    text = handle.next_chunk(timeout=handle.remaining())
+                except queue.Empty:
+                    self._count('timeouts')
+                    raise LLMTimeoutError(f"[{self.name}] 스트리밍 응답이 마감 시간을 넘겼습니다.")
+                if text is None:
+                    return
+                yield text
+        finally:
+            handle.cancel()
+
+    def start_stream(self, prompt, deadline=None, model=None, **kwargs):
+        """스트리밍 호출을 시작하고 StreamHandle을 반환합니다. 조각을 기다리는 시간을 호출하는 쪽이 정할 때 사용합니다."""
+        handle = StreamHandle(time.monotonic() + (deadline or self.default_deadline))
+
+        def worker():
+            if handle.cancelled.is_set():
+                with self._lock:
+                    self._queued -= 1
+                raise LLMTimeoutError("스트림이 시작되기 전에 취소되었습니다.")
+            try:
+                self._run(prompt, handle.deadline_at, handle._on_chunk, model, kwargs)
+            except BaseException as e:  # 오류도 소비자 스레드로 전달
+                handle._chunks.put(('error', e))
+                raise
+            handle._chunks.put(('end', None))
+            return StreamResult(''.join(handle.parts))
+
+        with self._lock:
+            self._queued += 1
+        handle.future = self._executor.submit(worker)
+        return handle
+
+    # --- 실행 (풀 스레드) ---
+    def _run(self, prompt, deadline_at, on_chunk, model, kwargs):
+        model = model or self.model
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"[{self.name}] 대기열에서 마감 시간을 넘겼습니다.")
+                emitted = False
+                try:
+                    call_kwargs = dict(kwargs)
+                    call_kwargs.setdefault('request_options', {'timeout': remaining})
+                    if on_chunk is None:
+                        response = model.generate_content(prompt, **call_kwargs)
+                        self._count('completed')
+                        return response
+                    for chunk in model.generate_content(prompt, stream=True, **call_kwargs):
+                        emitted = True
+                        on_chunk(chunk.text)
+                    self._count('completed')
+                    return None
+                except LLMTimeoutError:
+                    raise
+                except Exception as e:
+                    backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                    backoff = random.uniform(0, backoff)  # full jitter
+                    can_retry = (
+                        not emitted
+                        and attempt < self.max_retries
+                        and is_transient_error(e)
+                        and time.monotonic() + backoff < deadline_at
+                    )
+                    if not can_retry:
+                        self._count('failed')
+                        raise
+                    attempt += 1
+                    self._count('retries')
+                    logger.warning(f"[{self.name}] 일시적 오류로 재시도합니다 ({attempt}/{self.max_retries}, {backoff:.2f}초 후): {e}")
+                    time.sleep(backoff)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
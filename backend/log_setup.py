@@ -0,0 +1,143 @@
+"""요청 처리 경로 밖에서 동작하는 로깅 파이프라인.
+
+요청 스레드는 로그 레코드를 큐에 넣기만 하고, 파일/콘솔 기록과 JSON 직렬화는
+별도 스레드의 QueueListener가 담당합니다. 큐에 넣기 전에 카테고리별 샘플링/초당 개수 제한을 적용해
+부하가 걸렸을 때 같은 종류의 로그가 쏟아지는 것을 막습니다. (WARNING 이상은 항상 기록)
+
+카테고리는 `logger.debug(..., extra={'category': 'turn'})`처럼 지정하며, 없으면 로거 이름을 씁니다.
+extra로 넘긴 다른 값들은 JSON 레코드의 필드로 함께 기록됩니다.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# LogRecord 기본 속성 (이 외의 속성은 extra로 넘어온 구조화 필드로 취급)
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def blob_ref(text):
+    """큰 텍스트(로어북, 프롬프트 등)를 로그에 그대로 남기지 않고 해시와 길이로 가리킵니다."""
+    if text is None:
+        return None
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, sort_keys=True, default=str)
+    return f"sha256:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]} ({len(text)} chars)"
+
+
+def parse_category_map(spec):
+    """'turn=0.1,lore=0.5' 형식의 설정 문자열을 {카테고리: 값} dict로 바꿉니다."""
+    result = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            try:
+                result[name.strip()] = float(value)
+            except ValueError:
+                # 설정 오타 하나로 앱이 뜨지 않는 일이 없도록 그 항목만 건너뜀 (로깅 설정 전이라 stderr로 출력됨)
+                logging.getLogger(__name__).warning(f"로그 설정 값을 숫자로 읽을 수 없어 건너뜁니다: {item.strip()!r}")
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    """로그 레코드를 JSON 한 줄로 직렬화합니다."""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'category': getattr(record, 'category', record.name),
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS and key not in payload:
+                payload[key] = value
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """카테고리별 샘플링 비율과 초당 최대 개수를 적용합니다. WARNING 이상은 걸러내지 않습니다."""
+
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self._windows = {}  # 카테고리 -> [현재 1초 구간 시작, 구간 안에서 통과한 개수]
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        category = getattr(record, 'category', record.name)
+        rate = self.sample_rates.get(category)
+        if rate is not None and random.random() >= rate:
+            self.dropped += 1
+            return False
+        limit = self.rate_limits.get(category)
+        if limit is not None:
+            now = time.monotonic()
+            with self._lock:
+                window = self._windows.setdefault(category, [now, 0])
+                if now - window[0] >= 1.0:
+                    window[0], window[1] = now, 0
+                if window[1] >= limit:
+                    self.dropped += 1
+                    return False
+                window[1] += 1
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """메시지 문자열만 만들어 큐에 넣습니다. JSON 직렬화/파일 기록은 리스너 스레드에서 수행됩니다."""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # 기록 스레드가 밀려 있으면 요청을 기다리게 하지 않고 버림
+
+
+def configure_logging(log_file='debug.log', level='INFO', console_level='INFO', json_format=True,
+                      sample_rates=None, rate_limits=None, max_queue=10000):
+    """루트 로거에 큐 기반 로깅을 설정하고 QueueListener를 반환합니다. 프로세스 종료 시 남은 로그를 기록합니다."""
+    file_handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024 * 5, backupCount=5, encoding='utf-8') # 5MB, 5개 파일 순환
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=max_queue)
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates, rate_limits))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,141 @@
+"""로어북 검색 색인 (BM25).
+
+로어북을 `###` 제목 / 최상위 글머리표(`*`, `-`) 단위의 작은 조각(chunk)으로 나누고,
+로어북을 읽을 때 한 번 역색인(inverted index)을 만들어 둡니다.
+턴마다 플레이어 행동, 현재 위치, 현재 상황으로 검색해 관련 있는 조각만 토큰 예산 안에서
+프롬프트에 넣습니다. 각 색인어의 BM25 가중치를 미리 계산해 두므로 검색은 덧셈만으로 끝납니다.
+
+한국어는 조사가 붙어 형태가 바뀌므로("신림역으로", "신림역의") 단어 대신 글자 2-gram을 색인어로 씁니다.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+
+_WORD_PATTERN = re.compile(r'[0-9a-zA-Z]+|[가-힣]+')
+_HEADING_PATTERN = re.compile(r'^(#{2,6})\s+(.*)$')
+_TOP_BULLET_PATTERN = re.compile(r'^[*-]\s+')
+
+# 프롬프트 prefix에 이미 들어가는 섹션이나 게임 설정용 섹션은 검색 대상에서 제외
+DEFAULT_SKIP_HEADINGS = ('시작 설정', '세계관 개요', '모델 라우팅')
+
+LoreChunk = namedtuple('LoreChunk', ['chunk_id', 'heading', 'text', 'tokens'])
+
+
+def estimate_tokens(text):
+    """모델 토큰 수를 대략 추정합니다. (한글 약 1.5자당 1토큰, 영문/기호 약 4자당 1토큰)"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_count = len(text) - non_ascii
+    return int(math.ceil(non_ascii / 1.5 + ascii_count / 4))
+
+
+def tokenize(text):
+    """색인어 목록을 반환합니다. 한글 단어는 2-gram으로, 영문/숫자 단어는 소문자 단어로 나눕니다."""
+    terms = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if word[0] >= '가':
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif len(word) > 1:
+            terms.append(word)
+    return terms
+
+
+def chunk_lorebook(content, skip_headings=DEFAULT_SKIP_HEADINGS):
+    """로어북 마크다운을 (제목 경로, 본문) 조각 목록으로 나눕니다.
+
+    `###` 이하 제목마다, 그리고 최상위 글머리표마다 새 조각을 시작하며,
+    들여쓴 하위 글머리표는 바로 위 조각에 붙입니다.
+    """
+    chunks = []
+    headings = {}  # 제목 레벨 -> 제목
+    current = []
+
+    def heading_path():
+        return ' > '.join(headings[level] for level in sorted(headings))
+
+    def flush():
+        text = '\n'.join(current).strip()
+        current.clear()
+        path = heading_path()
+        if text and not any(skip in path for skip in skip_headings):
+            chunks.append((path, text))
+
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped == '---':
+            continue
+        heading = _HEADING_PATTERN.match(stripped)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            for deeper in [lvl for lvl in headings if lvl >= level]:
+                del headings[deeper]
+            headings[level] = heading.group(2).strip()
+            continue
+        if stripped.startswith('# '):  # H1 문서 제목은 색인하지 않음
+            continue
+        if _TOP_BULLET_PATTERN.match(line):
+            flush()
+        current.append(line.rstrip())
+    flush()
+    return chunks
+
+
+class LoreIndex:
+    """로어북 조각에 대한 BM25 역색인."""
+
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.chunks = []
+        self._postings = defaultdict(list)  # 색인어 -> [(chunk_id, BM25 가중치)]
+
+        term_counts = []
+        for heading, text in chunks:
+            body = f"[{heading}]\n{text}" if heading else text
+            chunk_id = len(self.chunks)
+            self.chunks.append(LoreChunk(chunk_id, heading, body, estimate_tokens(body)))
+            term_counts.append(Counter(tokenize(body)))
+
+        doc_count = len(self.chunks)
+        if not doc_count:
+            return
+        avg_len = sum(sum(counts.values()) for counts in term_counts) / doc_count
+        doc_freq = Counter(term for counts in term_counts for term in counts)
+
+        for chunk_id, counts in enumerate(term_counts):
+            length_norm = k1 * (1 - b + b * sum(counts.values()) / (avg_len or 1))
+            for term, tf in counts.items():
+                df = doc_freq[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                self._postings[term].append((chunk_id, idf * tf * (k1 + 1) / (tf + length_norm)))
+
+    @classmethod
+    def from_markdown(cls, content, skip_headings=DEFAULT_SKIP_HEADINGS):
+        return cls(chunk_lorebook(content, skip_headings=skip_headings))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=5, token_budget=None):
+        """`query`와 관련된 조각을 점수 순으로 최대 k개, 토큰 예산 안에서 반환합니다."""
+        scores = {}
+        get_score = scores.get
+        for term in set(tokenize(query)):
+            for chunk_id, weight in self._postings.get(term, ()):
+                scores[chunk_id] = get_score(chunk_id, 0.0) + weight
+        if not scores:
+            return []
+
+        results = []
+        used_tokens = 0
+        for chunk_id, _ in heapq.nlargest(k * 2, scores.items(), key=lambda item: item[1]):
+            chunk = self.chunks[chunk_id]
+            if token_budget is not None and used_tokens + chunk.tokens > token_budget:
+                continue  # 더 작은 다음 후보는 예산에 들어갈 수 있음
+            results.append(chunk)
+            used_tokens += chunk.tokens
+            if len(results) >= k:
+                break
+        return results
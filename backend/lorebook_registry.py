@@ -0,0 +1,198 @@
+"""로어북 레지스트리.
+
+디렉터리 안의 모든 로어북(`lorebook*.md`)을 파싱해 메모리에 색인해 두고,
+파일의 수정 시각(mtime)이 바뀐 로어북만 다시 파싱합니다.
+덕분에 서버를 재시작하지 않고도 로어북을 고치거나 추가할 수 있고,
+세션마다 다른 로어북(캠페인)을 골라 하나의 프로세스에서 함께 진행할 수 있습니다.
+"""
+import glob
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from log_setup import blob_ref
+from lore_index import LoreIndex
+from prompt_templates import compile_prompt_templates, PromptTemplates
+
+logger = logging.getLogger(__name__)
+
+# 포맷: - 키: 값  또는  - **키**: 값
+# (?=\s*-\s*|\Z)는 다음 항목 시작 또는 문자열 끝까지를 값으로 봄
+_SETTINGS_PATTERN = re.compile(r'^\s*-\s*(?:\*\*)?(.*?)(?:\*\*)?:\s*(.*?)(?=\s*-\s*|\Z)', re.DOTALL | re.MULTILINE)
+
+# '- 키: 값' 목록으로 읽는 섹션
+_SETTINGS_SECTIONS = ('시작 설정', '모델 라우팅')
+
+
+def parse_lorebook(content):
+    """Parses the lorebook markdown content into a dictionary."""
+    sections = {}
+    # H2 (##)를 기준으로 섹션 분리
+    parts = content.split('\n## ')
+    for part in parts:
+        if not part.strip():
+            continue
+
+        lines = part.strip().splitlines()
+        # 제목에서 '##' 와 앞뒤 공백을 모두 제거
+        section_title = lines[0].strip().lstrip('#').strip()
+        section_content = '\n'.join(lines[1:]).strip()
+
+        if section_title in _SETTINGS_SECTIONS:
+            settings = {}
+            matches = _SETTINGS_PATTERN.findall(section_content)
+            for key, value in matches: # _는 lookahead 그룹 무시
+                settings[key.strip()] = value.strip()
+            sections[section_title] = settings
+        elif section_title:
+            sections[section_title] = section_content
+
+    return sections
+
+
+def _extract_title(content, lorebook_id):
+    """첫 줄의 `# [게임 설정: ...]` 제목을 로어북 표시 이름으로 사용합니다. 없으면 파일 이름을 씁니다."""
+    first_line = content.lstrip().split('\n', 1)[0].strip()
+    match = re.match(r'^#\s*\[(?:게임 설정:\s*)?(.+?)\]\s*$', first_line)
+    if match:
+        return match.group(1).strip()
+    # 'lorebook경성뎐.md' -> '경성뎐'
+    short_name = lorebook_id[len('lorebook'):].lstrip('_-') if lorebook_id.startswith('lorebook') else ''
+    return short_name or lorebook_id
+
+
+@dataclass(frozen=True)
+class Lorebook:
+    """파싱과 프롬프트 컴파일이 끝난 로어북 한 권."""
+    lorebook_id: str
+    path: str
+    mtime: float
+    title: str
+    content: str
+    data: dict = field(repr=False)
+    templates: PromptTemplates = field(repr=False)
+    lore_index: LoreIndex = field(repr=False)
+
+    @property
+    def start_settings(self):
+        return self.data.get('시작 설정', {})
+
+    @property
+    def routing_settings(self):
+        return self.data.get('모델 라우팅', {})
+
+
+class LorebookRegistry:
+    """디렉터리의 로어북들을 mtime 기반으로 다시 읽어 들이는 레지스트리.
+
+    디렉터리 검사는 `check_interval`초에 한 번만 수행하므로, 매 요청마다 get()을 호출해도
+    평소에는 dict 조회 비용만 듭니다. `*_template.md` 파일은 목록에서 제외합니다.
+    `lazy=True`면 생성 시 읽지 않고 처음 조회할 때(또는 refresh() 호출 시) 읽습니다.
+    """
+
+    def __init__(self, directory, pattern='lorebook*.md', default_id='lorebook', check_interval=2.0, lazy=False):
+        self.directory = directory
+        self.pattern = pattern
+        self.default_id = default_id
+        self.check_interval = check_interval
+        self._lorebooks = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        if not lazy:
+            self.refresh(force=True)
+
+    @property
+    def loaded(self):
+        return self._loaded.is_set()
+
+    def get(self, lorebook_id=None):
+        """로어북을 반환합니다. 없는 ID면 KeyError가 발생합니다."""
+        self._maybe_refresh()
+        return self._lorebooks[lorebook_id or self.default_id]
+
+    def get_or_default(self, lorebook_id=None):
+        """로어북을 반환하되, 찾을 수 없으면 기본 로어북(그것도 없으면 None)을 반환합니다."""
+        self._maybe_refresh()
+        return self._lorebooks.get(lorebook_id or self.default_id) or self._lorebooks.get(self.default_id)
+
+    def list(self):
+        self._maybe_refresh()
+        return [
+            {
+                'id': lorebook.lorebook_id,
+                'title': lorebook.title,
+                'start_location': lorebook.start_settings.get('시작 위치'),
+                'default': lorebook.lorebook_id == self.default_id,
+            }
+            for lorebook in sorted(self._lorebooks.values(), key=lambda lb: (lb.lorebook_id != self.default_id, lb.lorebook_id))
+        ]
+
+    def __contains__(self, lorebook_id):
+        self._maybe_refresh()
+        return lorebook_id in self._lorebooks
+
+    def _maybe_refresh(self):
+        # 처음 읽는 중이면 refresh()의 잠금에서 기다렸다가 읽은 결과를 씁니다.
+        if not self._loaded.is_set() or time.monotonic() - self._last_scan >= self.check_interval:
+            self.refresh()
+
+    def refresh(self, force=False):
+        """디렉터리를 검사해 새로 생기거나 mtime이 바뀐 로어북만 다시 파싱합니다."""
+        with self._lock:
+            if not force and time.monotonic() - self._last_scan < self.check_interval:
+                return
+            self._last_scan = time.monotonic()
+
+            seen = set()
+            updated = dict(self._lorebooks)
+            for path in glob.glob(os.path.join(self.directory, self.pattern)):
+                if path.endswith('_template.md'):
+                    continue
+                lorebook_id = os.path.splitext(os.path.basename(path))[0]
+                seen.add(lorebook_id)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                current = updated.get(lorebook_id)
+                if current is not None and current.mtime == mtime:
+                    continue
+                try:
+                    lorebook = updated[lorebook_id] = self._load(lorebook_id, path, mtime)
+                    logger.info(
+                        f"Lorebook loaded: {lorebook_id} ({'reloaded' if current else 'new'}), "
+                        f"{len(lorebook.data)} sections, {len(lorebook.lore_index)} chunks, {blob_ref(lorebook.content)}"
+                    )
+                except Exception as e:
+                    # 파싱에 실패하면 이전 버전을 계속 사용
+                    logger.error(f"Error parsing lorebook {path}: {e}")
+
+            for lorebook_id in set(updated) - seen:
+                logger.info(f"Lorebook removed: {lorebook_id}")
+                del updated[lorebook_id]
+
+            had_default = self.default_id in self._lorebooks
+            # 통째로 교체하므로 읽는 쪽은 잠금 없이 항상 일관된 dict를 봅니다.
+            self._lorebooks = updated
+            if self.default_id not in updated and (force or had_default or not self._loaded.is_set()):
+                logger.warning(f"기본 로어북 '{self.default_id}'을(를) {self.directory}에서 찾을 수 없습니다. AI will operate without lorebook context.")
+            self._loaded.set()
+
+    def _load(self, lorebook_id, path, mtime):
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        data = parse_lorebook(content)
+        return Lorebook(
+            lorebook_id=lorebook_id,
+            path=path,
+            mtime=mtime,
+            title=_extract_title(content, lorebook_id),
+            content=content,
+            data=data,
+            templates=compile_prompt_templates(data),
+            lore_index=LoreIndex.from_markdown(content),
+        )
@@ -0,0 +1,218 @@
+"""턴별 모델 계층(tier) 선택.
+
+모든 턴을 Pro 모델로 처리하면 "판정이 필요한가, 어떤 능력치인가"만 정하면 되는 짧은 행동에도
+가장 비싸고 느린 모델을 씁니다. ModelRouter는 행동 문장을 키워드로 분류해
+
+- 판정 여부/능력치만 정하면 되는 행동, 짧고 단순한 행동 → 빠른 모델 (fast)
+- 대화/설득 등 서술이 중요한 행동, 긴 행동, 판정 결과 서술 → Pro 모델 (pro)
+
+로 보냅니다. 정책은 로어북마다 `## 모델 라우팅` 섹션으로 바꿀 수 있고, 계층별 호출 수/지연/토큰/추정 비용을 집계합니다.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from lore_index import estimate_tokens
+from turn_metrics import Counter, Histogram, LATENCY_BUCKETS
+
+TIERS = ('fast', 'pro')
+ROUTING_MODES = ('auto',) + TIERS
+
+# 판정이 필요할 가능성이 큰 행동의 키워드 (get_mock_response의 '살펴'/'조사' → 감각, '문을 연다' → 근력과 같은 방식)
+_CHECK_KEYWORDS = {
+    'strength': ('부순', '부수', '밀어', '들어 올', '당긴', '끌어', '던진', '공격', '때린', '내리친', '힘으로'),
+    'agility': ('피한', '피하', '뛰어', '달린', '점프', '숨는', '숨어', '몰래', '훔친', '기어', '잠입', '매달'),
+    'intelligence': ('해독', '분석', '계산', '해킹', '수리', '조작', '추리', '판독'),
+    'senses': ('살펴', '조사', '둘러', '찾는', '찾아', '엿듣', '귀를 기울', '냄새', '관찰', '수색'),
+    'willpower': ('버틴', '버티', '견딘', '견디', '저항', '집중', '참는', '참아'),
+}
+# 서술의 질이 중요한 행동 (대화, 설득, 감정 표현 등)
+_NARRATIVE_KEYWORDS = ('말한', '말을', '말해', '대화', '묻는', '물어', '설득', '협상', '부탁', '이야기', '회상', '고백', '위로', '"', '“')
+
+
+def classify_action(player_action, extra_narrative_keywords=()):
+    """행동 문장을 키워드로 분류합니다. ('narrative' | 'check' | 'simple', 예상 판정 능력치 또는 None)을 반환합니다."""
+    text = (player_action or '').strip()
+    if any(keyword in text for keyword in _NARRATIVE_KEYWORDS + tuple(extra_narrative_keywords)):
+        return 'narrative', None
+    for stat, keywords in _CHECK_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return 'check', stat
+    return 'simple', None
+
+
+@dataclass(frozen=True)
+class RoutingPolicy:
+    """턴 종류별로 사용할 모델 계층. action_mode가 'auto'면 행동 문장을 분류해 고릅니다."""
+    action_mode: str = 'auto'
+    roll_tier: str = 'pro'
+    max_fast_action_chars: int = 40
+    narrative_keywords: tuple = ()
+
+    @classmethod
+    def from_settings(cls, settings, default):
+        """로어북 `## 모델 라우팅` 섹션의 설정으로 default 정책의 값을 덮어씁니다. 잘못된 값은 무시합니다."""
+        if not settings:
+            return default
+        action_mode = settings.get('행동 턴', default.action_mode)
+        roll_tier = settings.get('판정 턴', default.roll_tier)
+        try:
+            max_chars = int(settings.get('짧은 행동 글자 수', default.max_fast_action_chars))
+        except ValueError:
+            max_chars = default.max_fast_action_chars
+        keywords = tuple(k.strip() for k in settings.get('서술 키워드', '').split(',') if k.strip())
+        return cls(
+            action_mode=action_mode if action_mode in ROUTING_MODES else default.action_mode,
+            roll_tier=roll_tier if roll_tier in TIERS else default.roll_tier,
+            max_fast_action_chars=max_chars,
+            narrative_keywords=default.narrative_keywords + keywords,
+        )
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """모델 계층 하나. 비용은 100만 토큰당 달러 (입력, 출력) 기준의 추정치입니다."""
+    name: str
+    client: object  # LLMClient
+    model_name: str
+    input_cost_per_mtok: float = 0.0
+    output_cost_per_mtok: float = 0.0
+
+
+class _TrackedCall:
+    __slots__ = ('response_text',)
+
+    def __init__(self):
+        self.response_text = ''
+
+
+class ModelRouter:
+    def __init__(self, tiers, default_policy=None, prefix='trpg', latency_window=200):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.default_policy = default_policy or RoutingPolicy()
+        self._lock = threading.Lock()
+        self._stats = {name: {'calls': 0, 'errors': 0, 'seconds': 0.0, 'prompt_tokens': 0,
+                              'response_tokens': 0, 'cost_usd': 0.0} for name in self.tiers}
+        self._routes = {}  # (tier, reason) -> 횟수
+        self._latencies = {name: deque(maxlen=latency_window) for name in self.tiers}  # 최근 성공한 호출의 지연(초)
+        self.routes_total = Counter(f'{prefix}_model_routes_total', 'Turns routed to each model tier', ('tier', 'reason'))
+        self.call_seconds = Histogram(f'{prefix}_model_call_seconds', 'Model call latency per tier',
+                                      LATENCY_BUCKETS, ('tier', 'status'))
+        self.tokens_total = Counter(f'{prefix}_model_tokens_total', 'Estimated tokens per tier', ('tier', 'kind'))
+        self.cost_total = Counter(f'{prefix}_model_cost_usd_total', 'Estimated model cost per tier (USD)', ('tier',))
+
+    @property
+    def metrics(self):
+        """TurnMetrics.add_metric()에 등록할 지표들."""
+        return (self.routes_total, self.call_seconds, self.tokens_total, self.cost_total)
+
+    def tier(self, name):
+        return self.tiers[name]
+
+    def policy_for(self, settings):
+        return RoutingPolicy.from_settings(settings, self.default_policy)
+
+    # --- 선택 ---
+    def route(self, turn_type, player_action=None, policy=None):
+        """(계층 이름, 이유)를 반환합니다."""
+        policy = policy or self.default_policy
+        if turn_type == 'roll':
+            tier, reason = policy.roll_tier, 'roll'
+        elif turn_type != 'action':
+            tier, reason = 'pro', turn_type  # 방 라운드 등 여러 행동을 함께 서술하는 호출
+        elif policy.action_mode != 'auto':
+            tier, reason = policy.action_mode, 'policy'
+        else:
+            kind, _ = classify_action(player_action, policy.narrative_keywords)
+            if kind == 'narrative':
+                tier, reason = 'pro', 'narrative'
+            elif len((player_action or '').strip()) > policy.max_fast_action_chars:
+                tier, reason = 'pro', 'long_action'
+            else:
+                tier, reason = 'fast', kind
+        if tier not in self.tiers:
+            tier = 'pro'
+        self.routes_total.inc(tier=tier, reason=reason)
+        with self._lock:
+            self._routes[(tier, reason)] = self._routes.get((tier, reason), 0) + 1
+        return tier, reason
+
+    # --- 집계 ---
+    @contextmanager
+    def track(self, tier, prompt_text):
+        """모델 호출 하나를 감싸 지연/토큰/비용을 집계합니다. 응답 텍스트는 yield된 객체의 response_text에 넣습니다."""
+        call = _TrackedCall()
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield call
+            ok = True
+        finally:
+            self.record(tier, time.perf_counter() - started, estimate_tokens(prompt_text),
+                        estimate_tokens(call.response_text or ''), ok)
+
+    def track_future(self, tier, prompt_text, future):
+        """submit()으로 받은 호출의 결과가 나오면 집계합니다. 취소된 호출은 집계하지 않습니다."""
+        started = time.perf_counter()
+
+        def on_done(done):
+            if done.cancelled():
+                return
+            ok = done.exception() is None
+            response_text = done.result().text if ok else ''
+            self.record(tier, time.perf_counter() - started, estimate_tokens(prompt_text), estimate_tokens(response_text), ok)
+
+        future.add_done_callback(on_done)
+
+    def record(self, tier, seconds, prompt_tokens, response_tokens, ok=True):
+        model_tier = self.tiers[tier]
+        cost = (prompt_tokens * model_tier.input_cost_per_mtok + response_tokens * model_tier.output_cost_per_mtok) / 1_000_000
+        self.call_seconds.observe(seconds, tier=tier, status='ok' if ok else 'error')
+        self.tokens_total.inc(prompt_tokens, tier=tier, kind='prompt')
+        self.tokens_total.inc(response_tokens, tier=tier, kind='response')
+        self.cost_total.inc(cost, tier=tier)
+        with self._lock:
+            stats = self._stats[tier]
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['seconds'] += seconds
+            stats['prompt_tokens'] += prompt_tokens
+            stats['response_tokens'] += response_tokens
+            stats['cost_usd'] += cost
+            if ok:
+                self._latencies[tier].append(seconds)
+
+    def latency_quantile(self, tier, quantile, min_samples=20):
+        """최근 성공한 호출 지연의 분위수(초). 표본이 min_samples보다 적으면 None."""
+        with self._lock:
+            samples = sorted(self._latencies[tier])
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+    def stats(self):
+        with self._lock:
+            tiers = {}
+            for name, stats in self._stats.items():
+                tiers[name] = {
+                    'model': self.tiers[name].model_name,
+                    **stats,
+                    'seconds': round(stats['seconds'], 3),
+                    'avg_seconds': round(stats['seconds'] / stats['calls'], 3) if stats['calls'] else None,
+                    'cost_usd': round(stats['cost_usd'], 6),
+                }
+            routes = {f'{tier}:{reason}': count for (tier, reason), count in sorted(self._routes.items())}
+        for name, tier in self.tiers.items():
+            tiers[name]['llm'] = tier.client.stats()
+        return {'policy': self.default_policy.action_mode, 'tiers': tiers, 'routes': routes}
+
+
+def parse_cost(spec, default):
+    """'1.25,10' 형식(100만 토큰당 입력, 출력 달러)의 설정을 (입력, 출력) 튜플로 바꿉니다."""
+    try:
+        input_cost, output_cost = (float(value) for value in (spec or default).split(','))
+    except ValueError:
+        input_cost, output_cost = (float(value) for value in default.split(','))
+    return input_cost, output_cost
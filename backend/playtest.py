@@ -0,0 +1,267 @@
+"""로어북/프롬프트 변경을 확인하는 헤드리스 플레이테스트 실행기.
+
+여러 캠페인(로어북 × 페르소나 × 반복)을 같은 턴 처리 경로(/create-character, /game-turn)로 병렬 실행하고
+로어북별로 결과를 집계합니다. 앱은 같은 프로세스에서 TEST_MODE로 띄우며, 모델 응답은
+
+- 기본: 로컬 대체 모델 (get_mock_response, --latency-ms로 지연 지정)
+- --fixture: 기록된 응답. /campaign/export 파일(gm 이벤트) 또는 응답 dict 목록을 돌아가며 사용
+
+중 하나입니다. --processes로 여러 프로세스에 캠페인을 나눠 실행하고, 프로세스마다 --threads개 캠페인을 동시에 진행합니다.
+
+사용 예 (backend 폴더에서):
+    python playtest.py --campaigns 200 --turns 20 --processes 4 --threads 8
+    python playtest.py --lorebooks lorebook경성뎐 --personas 탐색가,싸움꾼 --fixture campaign.json --json
+
+집계 항목 (로어북별): 응답 해석 실패/복구, 능력치별 판정 횟수와 결과, HP/SP 추이, 장면/위치 변경,
+프롬프트 토큰 증가, 턴/초
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmark import percentile
+
+# 페르소나: 능력치 배분(합 8, 1~3)과 행동 문장 후보. {location}은 현재 위치로 바뀝니다.
+PERSONAS = {
+    '탐색가': {
+        'stats': {'strength': 1, 'agility': 2, 'intelligence': 2, 'senses': 2, 'willpower': 1},
+        'actions': ('주변을 살펴본다', '{location} 구석구석을 조사한다', '발자국을 찾아 따라간다', '벽에 귀를 기울여 엿듣는다',
+                    '앞으로 조심스럽게 걸어간다'),
+    },
+    '싸움꾼': {
+        'stats': {'strength': 3, 'agility': 2, 'intelligence': 1, 'senses': 1, 'willpower': 1},
+        'actions': ('문을 힘으로 부순다', '앞을 막는 것을 공격한다', '무거운 상자를 밀어 길을 연다', '{location} 한가운데로 뛰어든다',
+                    '주먹을 쥐고 버틴다'),
+    },
+    '협상가': {
+        'stats': {'strength': 1, 'agility': 1, 'intelligence': 2, 'senses': 2, 'willpower': 2},
+        'actions': ('근처 사람에게 말을 건다', '"여기서 무슨 일이 있었죠?" 하고 묻는다', '상대를 설득해 본다',
+                    '{location}에 대해 이야기를 청한다', '조용히 상황을 관찰한다'),
+    },
+    '잠입자': {
+        'stats': {'strength': 1, 'agility': 3, 'intelligence': 2, 'senses': 1, 'willpower': 1},
+        'actions': ('그림자 속으로 몰래 숨어든다', '{location}을 가로질러 잠입한다', '잠긴 장치를 조작한다', '재빨리 뛰어 피한다',
+                    '숨을 죽이고 집중한다'),
+    },
+}
+
+
+def load_fixture(path):
+    """기록된 모델 응답 목록. /campaign/export 파일이면 gm 이벤트를 응답 형식으로 되돌립니다."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and 'events' in data:
+        from replay import _recorded_reply
+        return [_recorded_reply(event) for event in data['events'] if event['type'] == 'gm']
+    if not isinstance(data, list) or not data:
+        raise SystemExit(f"응답 fixture 형식을 알 수 없습니다: {path}")
+    return data
+
+
+def _import_app(options):
+    """앱을 import하기 전에 대체 모델과 실행 환경을 환경 변수로 넘깁니다 (따로 지정한 값은 유지)."""
+    os.environ.update({
+        'TEST_MODE': '1',
+        'FAKE_MODEL_LATENCY_MS': str(options['latency_ms']),
+        'FAKE_MODEL_LATENCY_DIST': options['latency_dist'],
+    })
+    # 턴을 쉬지 않고 보내고 캐시는 해석 실패를 가리므로, 따로 지정하지 않으면 입장 제어/턴 마감/응답 캐시를 끔
+    for name, value in (('ADMISSION_CONTROL', '0'), ('TURN_SLO_SECONDS', '0'), ('RESPONSE_CACHE_MAX_ENTRIES', '0')):
+        os.environ.setdefault(name, value)
+    import logging
+    import app as app_module
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    if options.get('fixture'):
+        replies = itertools.cycle(options['fixture'])
+        lock = threading.Lock()
+
+        def responder(prompt_text):
+            if '[TRPG CAMPAIGN MEMORY' in prompt_text:
+                return app_module._mock_model_reply(prompt_text)
+            with lock:
+                return next(replies)
+        app_module.model.responder = responder
+        app_module.fast_model.responder = responder
+    return app_module
+
+
+def run_campaign(app_module, spec, turns):
+    """캠페인 하나를 진행하고 턴별 기록을 반환합니다."""
+    persona = PERSONAS[spec['persona']]
+    rng = random.Random(spec['seed'])
+    client = app_module.app.test_client()
+    response = client.post('/create-character', json={
+        'name': f"{spec['persona']}{spec['index']}", 'stats': persona['stats'], 'lorebook': spec['lorebook'],
+        'seed': spec['seed'],
+    })
+    record = {**spec, 'create_status': response.status_code, 'turns': []}
+    if response.status_code != 200:
+        return record
+    character = response.get_json()['character']
+    pending_stat = None
+    for _ in range(turns):
+        if pending_stat:
+            payload = {'type': 'roll', 'modifier_stat': pending_stat}
+        else:
+            action = rng.choice(persona['actions']).format(location=character.get('location') or '이곳')
+            payload = {'type': 'action', 'player_action': action}
+        started = time.perf_counter()
+        response = client.post('/game-turn', json=payload)
+        elapsed = time.perf_counter() - started
+        data = response.get_json(silent=True) or {}
+        turn = {'type': payload['type'], 'status': response.status_code, 'seconds': elapsed}
+        if response.status_code == 200:
+            character = data.get('character', character)  # base_version을 보내지 않으므로 매번 전체 캐릭터가 옴
+            turn.update({
+                'hp': character['hp'], 'sp': character['sp'], 'location': character.get('location'),
+                'scene_id': character.get('scene_id'),
+                'prompt_tokens': (data.get('prompt_budget') or {}).get('total'),
+                'parse_error': bool(data.get('parse_error')), 'parse_repaired': bool(data.get('parse_repaired')),
+                'degraded': bool(data.get('degraded')),
+            })
+            if payload['type'] == 'roll':
+                turn.update({'stat': payload['modifier_stat'], 'outcome': data.get('roll_outcome')})
+            pending_stat = data.get('roll_stat') if data.get('require_roll') else None
+        record['turns'].append(turn)
+    return record
+
+
+def run_batch(specs, options):
+    """(프로세스 하나) 캠페인 목록을 스레드 풀에서 실행합니다."""
+    app_module = _import_app(options)
+    with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+        return list(pool.map(lambda spec: run_campaign(app_module, spec, options['turns']), specs))
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def summarize(lorebook, records, elapsed):
+    """로어북 하나의 캠페인 기록을 집계합니다."""
+    turns = [turn for record in records for turn in record['turns']]
+    ok_turns = [turn for turn in turns if turn['status'] == 200]
+    rolls = [turn for turn in ok_turns if turn['type'] == 'roll']
+    actions = [turn for turn in ok_turns if turn['type'] == 'action']
+    max_turns = max((len(record['turns']) for record in records), default=0)
+
+    def by_turn(field):
+        # 턴 순번별 평균 (캠페인마다 실패한 턴은 건너뜀)
+        return [_mean([record['turns'][i].get(field) for record in records if i < len(record['turns'])])
+                for i in range(max_turns)]
+
+    def changes(record, field):
+        values = [turn.get(field) for turn in record['turns'] if turn['status'] == 200]
+        return sum(1 for before, after in zip(values, values[1:]) if after != before)
+
+    prompt_tokens = by_turn('prompt_tokens')
+    known_tokens = [tokens for tokens in prompt_tokens if tokens is not None]
+    latencies = sorted(turn['seconds'] for turn in turns)
+    return {
+        'lorebook': lorebook,
+        'campaigns': len(records),
+        'create_errors': sum(1 for record in records if record['create_status'] != 200),
+        'turns': len(turns),
+        'errors': len(turns) - len(ok_turns),
+        'parse_failures': sum(1 for turn in ok_turns if turn['parse_error']),
+        'parse_repaired': sum(1 for turn in ok_turns if turn['parse_repaired']),
+        'degraded': sum(1 for turn in ok_turns if turn['degraded']),
+        'roll_rate': round(len(rolls) / len(actions), 3) if actions else 0.0,
+        'rolls_by_stat': dict(Counter(turn['stat'] for turn in rolls)),
+        'roll_outcomes': dict(Counter(turn['outcome'] for turn in rolls)),
+        'hp_by_turn': by_turn('hp'),
+        'sp_by_turn': by_turn('sp'),
+        'hp_zero_campaigns': sum(1 for record in records if any(turn.get('hp') == 0 for turn in record['turns'])),
+        'scene_changes_avg': _mean([changes(record, 'scene_id') for record in records]),
+        'location_changes_avg': _mean([changes(record, 'location') for record in records]),
+        'prompt_tokens_first': known_tokens[0] if known_tokens else None,
+        'prompt_tokens_last': known_tokens[-1] if known_tokens else None,
+        'prompt_tokens_growth_per_turn': (round((known_tokens[-1] - known_tokens[0]) / (len(known_tokens) - 1), 1)
+                                          if len(known_tokens) > 1 else None),
+        'turn_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'turn_p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'turns_per_s': round(len(turns) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def _lorebook_ids():
+    from lorebook_registry import LorebookRegistry
+    registry = LorebookRegistry(os.getenv('LOREBOOK_DIR', os.path.dirname(os.path.abspath(__file__))),
+                                default_id=os.getenv('DEFAULT_LOREBOOK', 'lorebook'))
+    return [lorebook['id'] for lorebook in registry.list()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lorebooks', default='all', help='로어북 ID 목록 (쉼표로 구분, all이면 전부)')
+    parser.add_argument('--personas', default=','.join(PERSONAS), help='페르소나 목록 (쉼표로 구분)')
+    parser.add_argument('--campaigns', type=int, default=40, help='로어북마다 실행할 캠페인 수 (페르소나를 번갈아 사용)')
+    parser.add_argument('--turns', type=int, default=20, help='캠페인당 /game-turn 요청 수')
+    parser.add_argument('--processes', type=int, default=1, help='캠페인을 나눠 실행할 프로세스 수')
+    parser.add_argument('--threads', type=int, default=8, help='프로세스마다 동시에 진행할 캠페인 수')
+    parser.add_argument('--fixture', help='기록된 모델 응답 (/campaign/export 파일 또는 응답 dict 목록)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='대체 모델 평균 지연')
+    parser.add_argument('--latency-dist', default='fixed', choices=('fixed', 'uniform', 'lognormal'))
+    parser.add_argument('--seed', type=int, default=0, help='캠페인별 주사위/행동 선택 시드의 기준값')
+    parser.add_argument('--json', action='store_true', help='로어북별 결과를 JSON 줄로 출력')
+    args = parser.parse_args()
+
+    lorebooks = _lorebook_ids() if args.lorebooks == 'all' else [name.strip() for name in args.lorebooks.split(',') if name.strip()]
+    personas = [name.strip() for name in args.personas.split(',') if name.strip()]
+    unknown = [name for name in personas if name not in PERSONAS]
+    if unknown:
+        raise SystemExit(f"알 수 없는 페르소나: {unknown} (선택: {list(PERSONAS)})")
+    options = {
+        'turns': args.turns, 'threads': args.threads, 'latency_ms': args.latency_ms, 'latency_dist': args.latency_dist,
+        'fixture': load_fixture(args.fixture) if args.fixture else None,
+    }
+    specs = [
+        {'index': index, 'lorebook': lorebook, 'persona': personas[index % len(personas)], 'seed': args.seed * 1_000_003 + index}
+        for lorebook in lorebooks for index in range(args.campaigns)
+    ]
+
+    started = time.perf_counter()
+    if args.processes <= 1:
+        records = run_batch(specs, options)
+    else:
+        # 캠페인을 번갈아 나눠 로어북마다 부하가 고르게 퍼지게 함. 각 프로세스가 앱을 따로 import함
+        batches = [specs[i::args.processes] for i in range(args.processes)]
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            records = [record for batch in pool.map(run_batch, batches, itertools.repeat(options)) for record in batch]
+    elapsed = time.perf_counter() - started
+
+    by_lorebook = defaultdict(list)
+    for record in records:
+        by_lorebook[record['lorebook']].append(record)
+    results = [summarize(lorebook, by_lorebook[lorebook], elapsed) for lorebook in lorebooks]
+    total_turns = sum(result['turns'] for result in results)
+    if args.json:
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+        print(json.dumps({'total_turns': total_turns, 'elapsed_s': round(elapsed, 2),
+                          'turns_per_s': round(total_turns / elapsed, 1) if elapsed else 0.0}))
+        return
+    for result in results:
+        print(f"== {result['lorebook']}: 캠페인 {result['campaigns']}개, 턴 {result['turns']}개 (오류 {result['errors']}, "
+              f"해석 실패 {result['parse_failures']}, 복구 {result['parse_repaired']}, 대체 응답 {result['degraded']})")
+        print(f"   판정 비율 {result['roll_rate']}, 능력치별 {result['rolls_by_stat']}, 결과 {result['roll_outcomes']}")
+        hp, sp = result['hp_by_turn'], result['sp_by_turn']
+        if hp:
+            print(f"   HP 평균 {hp[0]} → {hp[-1]} (최저 {min(v for v in hp if v is not None)}), SP 평균 {sp[0]} → {sp[-1]}, "
+                  f"HP 0이 된 캠페인 {result['hp_zero_campaigns']}개")
+        print(f"   장면 변경 {result['scene_changes_avg']}회/캠페인, 위치 변경 {result['location_changes_avg']}회/캠페인")
+        print(f"   프롬프트 토큰 {result['prompt_tokens_first']} → {result['prompt_tokens_last']} "
+              f"(턴당 {result['prompt_tokens_growth_per_turn']}), 턴 p50/p95 {result['turn_p50_ms']}/{result['turn_p95_ms']}ms")
+    print(f"합계: 턴 {total_turns}개, {elapsed:.1f}초, {total_turns / elapsed if elapsed else 0:.1f} 턴/초")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""프롬프트 토큰 예산 관리.
+
+프롬프트를 섹션(스토리 요약, 관련 로어북 조각, 캐릭터 상태, 규칙 등) 단위로 조립하면서
+섹션별 토큰 수를 세고, 전체가 예산(max_tokens)을 넘으면 우선순위가 낮은 섹션부터
+더 짧은 대체 텍스트(variant)로 바꿉니다. 결과와 함께 섹션별 토큰 내역을 돌려주므로
+로어북/인벤토리가 커지면서 프롬프트의 어느 부분이 늘어나는지 턴마다 확인할 수 있습니다.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from lore_index import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """텍스트의 토큰 수를 세고 결과를 캐시합니다.
+
+    `count_fn`(예: Gemini count_tokens)이 없거나 실패하면 로컬 추정치(estimate_tokens)를 씁니다.
+    로어북 prefix처럼 매 턴 같은 텍스트는 한 번만 셉니다.
+    """
+
+    def __init__(self, count_fn=None, name='estimate', max_entries=2048):
+        self.count_fn = count_fn
+        self.name = name
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'fallbacks': 0}
+
+    def count(self, text):
+        if not text:
+            return 0
+        with self._lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                self._counters['hits'] += 1
+                return tokens
+            self._counters['misses'] += 1
+        tokens = None
+        if self.count_fn is not None:
+            try:
+                tokens = int(self.count_fn(text))
+            except Exception as e:
+                logger.debug(f"토큰 수 API 호출 실패, 추정치를 사용합니다: {e}")
+                with self._lock:
+                    self._counters['fallbacks'] += 1
+        if tokens is None:
+            tokens = estimate_tokens(text)
+        with self._lock:
+            self._cache[text] = tokens
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def stats(self):
+        with self._lock:
+            return {'counter': self.name, 'entries': len(self._cache), **self._counters}
+
+
+class PromptSection:
+    """프롬프트 섹션 하나.
+
+    `variants`는 전체 텍스트부터 점점 짧아지는 대체 텍스트 목록입니다 (마지막이 ''이면 섹션을 뺄 수 있음).
+    `priority`가 클수록 예산을 넘었을 때 먼저 줄이며, 0이면 줄이지 않습니다.
+    """
+    __slots__ = ('name', 'variants', 'priority')
+
+    def __init__(self, name, variants, priority=0):
+        self.name = name
+        self.variants = list(variants) if isinstance(variants, (list, tuple)) else [variants]
+        self.priority = priority
+
+
+class PromptBudget:
+    def __init__(self, max_tokens, counter):
+        self.max_tokens = max_tokens  # 0 또는 None이면 줄이지 않고 크기만 셈
+        self.counter = counter
+
+    def assemble(self, sections, fixed=()):
+        """섹션들을 예산에 맞춰 이어 붙인 텍스트와 토큰 내역을 반환합니다.
+
+        `fixed`는 줄이지 않고 크기만 세는 (이름, 텍스트) 목록입니다 (로어북 prefix 등).
+        """
+        fixed_tokens = {name: self.counter.count(text) for name, text in fixed}
+        levels = [0] * len(sections)
+        tokens = [self.counter.count(section.variants[0]) for section in sections]
+        total = sum(fixed_tokens.values()) + sum(tokens)
+
+        while self.max_tokens and total > self.max_tokens:
+            candidates = [i for i, section in enumerate(sections)
+                          if section.priority > 0 and levels[i] < len(section.variants) - 1]
+            if not candidates:
+                break
+            index = max(candidates, key=lambda i: (sections[i].priority, i))
+            levels[index] += 1
+            new_tokens = self.counter.count(sections[index].variants[levels[index]])
+            total += new_tokens - tokens[index]
+            tokens[index] = new_tokens
+
+        report = {
+            'total': total,
+            'budget': self.max_tokens or None,
+            'over_budget': bool(self.max_tokens and total > self.max_tokens),
+            'sections': {**fixed_tokens, **{section.name: count for section, count in zip(sections, tokens)}},
+            # 줄인 섹션: 이름 -> 'dropped' 또는 몇 단계 줄였는지
+            'trimmed': {
+                section.name: 'dropped' if not section.variants[level] else level
+                for section, level in zip(sections, levels) if level
+            },
+        }
+        text = ''.join(section.variants[level] for section, level in zip(sections, levels))
+        return text, report
@@ -0,0 +1,349 @@
+"""로어북별로 미리 컴파일해 두는 프롬프트 템플릿.
+
+행동/판정 프롬프트에서 로어북으로부터 만들어지는 부분(GM 역할, 세계관 개요, GM 지침)은
+로어북이 바뀌지 않는 한 매 턴 똑같습니다. 이 부분을 로어북당 한 번만 만들어
+불변 템플릿(PromptTemplates)의 `prefix`로 두고, 턴마다 바뀌는 부분만 `suffix`로 채웁니다.
+
+prefix가 항상 프롬프트 맨 앞에 같은 내용으로 오기 때문에 Gemini의 암묵적 캐싱이 적용되기 쉽고,
+PrefixContextCache를 켜면 prefix를 명시적인 캐시 컨텍스트(CachedContent)로 등록해
+턴마다 세계관 텍스트의 입력 토큰 비용과 지연을 다시 지불하지 않습니다.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+
+from dice_odds import format_odds
+from prompt_budget import PromptSection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORLD_OVERVIEW = "포스트 아포칼립스 대한민국."
+DEFAULT_GM_DIRECTIVES = "Proceed with the story according to the player's actions."
+APPENDIX_SECTION_TITLE = '부록: 전체 세계관 정보 (Appendix: World Info)'
+
+# "### A. 세계관 개요 (World Overview)" 아래부터 "### B. 주요 인물 (Key NPCs)" 또는 문자열 끝까지
+_WORLD_OVERVIEW_PATTERN = re.compile(
+    r'### A\. 세계관 개요 \(World Overview\)\s*\n(.*?)(?=\n### B\. 주요 인물 \(Key NPCs\)|\Z)', re.DOTALL
+)
+
+_RESPONSE_JSON_FORMAT = """```json
+{{
+    "story": "[ {story_hint} ]",
+    "require_roll": false,
+    "roll_stat": null,
+    "hp_change": 0,
+    "sp_change": 0,
+    "add_inventory": [],
+    "remove_inventory": [],
+    "new_location": null,
+    "new_scenario_state": "[ 여기에 새로운 상황 요약을 작성합니다. ]",
+    "new_scene_id": null
+}}
+```
+"""
+
+_ACTION_RULES = """# --- GM's Judgment Rules ---
+# 1. **CRITICAL:** If you set "require_roll" to `true`, your "story" text MUST end with a clear call for a roll. (e.g., "...감각 판정이 필요합니다.")
+# 2. The 'roll_stat' must be one of: "strength", "agility", "intelligence", "senses", "willpower".
+# 3. If the "current_goal" from the summary is resolved or significantly changed by the action, reflect this in the "new_scenario_state".
+
+""" + _RESPONSE_JSON_FORMAT.format(story_hint="여기에 다음 상황 묘사나 판정 요구를 작성합니다.")
+
+_ROLL_JSON_FORMAT = _RESPONSE_JSON_FORMAT.format(story_hint="여기에 주사위 굴림 결과에 따른 상세한 상황 묘사와 다음 질문을 작성합니다.")
+
+_ROOM_JSON_FORMAT = """```json
+{
+    "story": "[ 모든 플레이어가 함께 보는 이번 라운드의 장면 묘사와 다음 질문 ]",
+    "players": [
+        {
+            "player_id": "[ 플레이어 ID ]",
+            "story": "[ 이 플레이어의 행동 결과 (한두 문장) ]",
+            "hp_change": 0,
+            "sp_change": 0,
+            "add_inventory": [],
+            "remove_inventory": []
+        }
+    ],
+    "new_location": null,
+    "new_scenario_state": "[ 여기에 새로운 상황 요약을 작성합니다. ]",
+    "new_scene_id": null
+}
+```
+"""
+
+
+class CompiledPrompt(namedtuple('CompiledPrompt', ['prefix', 'suffix', 'fingerprint', 'budget'], defaults=(None,))):
+    """턴 하나의 프롬프트. prefix는 로어북별 고정 부분, suffix는 턴별 동적 부분입니다.
+
+    예산을 적용해 조립했으면 budget에 섹션별 토큰 내역(PromptBudget.assemble의 보고서)이 들어 있습니다.
+    """
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return self.prefix + self.suffix
+
+
+def _format_relevant_lore(relevant_lore):
+    """검색된 로어북 조각을 프롬프트 섹션으로 만듭니다. 조각이 없으면 빈 문자열."""
+    if not relevant_lore:
+        return ''
+    entries = '\n\n'.join(chunk.text for chunk in relevant_lore)
+    return f"""
+# [RELEVANT LORE - REFERENCE]
+# Lorebook entries related to the current situation. Use them to keep names, places and details consistent.
+{entries}
+"""
+
+
+def _story_summary_variants(story_summary, header):
+    """스토리 요약 섹션: 전체 → 목록을 최근 항목만 남긴 압축본 → 현재 목표/마지막 사건만."""
+    reduced = {key: value[-3:] if isinstance(value, list) else value for key, value in story_summary.items()}
+    if isinstance(story_summary.get('recent_log'), list):
+        reduced['recent_log'] = story_summary['recent_log'][-2:]
+    minimal = {key: story_summary[key] for key in ('current_goal', 'last_key_event', 'unresolved_threats') if key in story_summary}
+    compact = dict(ensure_ascii=False, separators=(',', ':'))
+    return [
+        f"{header}\n{json.dumps(story_summary, ensure_ascii=False, indent=2)}\n",
+        f"{header}\n{json.dumps(reduced, **compact)}\n",
+        f"{header}\n{json.dumps(minimal, **compact)}\n",
+    ]
+
+
+def _relevant_lore_variants(relevant_lore):
+    """관련 로어북 섹션: 검색 순위가 낮은 조각부터 하나씩 뺍니다 (마지막은 섹션 없음)."""
+    relevant_lore = list(relevant_lore or ())
+    return [_format_relevant_lore(relevant_lore[:k]) for k in range(len(relevant_lore), -1, -1)]
+
+
+def _character_state_variants(player_char, max_items=5):
+    """캐릭터 상태 섹션: 인벤토리가 길면 앞의 몇 개만 남긴 대체 텍스트를 둡니다."""
+    def render(inventory):
+        return f"""# --- Current Game State (for reference only) ---
+# Player: '{player_char['name']}' ({player_char.get('description', 'Not set')})
+# HP: {player_char['hp']}/{player_char['maxHp']}, SP: {player_char['sp']}/{player_char['maxSp']}
+# Inventory: {inventory}
+# Current Location: {player_char.get('location', 'Unknown')}
+
+"""
+    inventory = player_char['inventory']
+    variants = [render(inventory)]
+    if len(inventory) > max_items:
+        variants.append(render(inventory[:max_items] + [f"... 외 {len(inventory) - max_items}개"]))
+    return variants
+
+
+def extract_world_overview(lorebook_data):
+    """로어북에서 세계관 개요 텍스트를 찾습니다. 없으면 기본 문구를 반환합니다."""
+    appendix_full_content = lorebook_data.get(APPENDIX_SECTION_TITLE, '')
+    match = _WORLD_OVERVIEW_PATTERN.search(appendix_full_content)
+    if match:
+        return match.group(1).strip()
+    # 부록이 없는 로어북은 "## 1. 세계관 개요 (World Overview)" 같은 H2 섹션을 사용
+    for title, content in lorebook_data.items():
+        if '세계관 개요' in title and isinstance(content, str) and content.strip():
+            return content.strip()
+    return DEFAULT_WORLD_OVERVIEW
+
+
+@dataclass(frozen=True)
+class PromptTemplates:
+    """로어북 하나에 대해 컴파일된 불변 프롬프트 템플릿. prefix_sections는 토큰 내역용 prefix의 (이름, 텍스트) 구성입니다."""
+    prefix: str
+    fingerprint: str
+    prefix_sections: tuple = ()
+
+    def _compile(self, sections, budget=None):
+        """섹션들을 suffix로 이어 붙입니다. budget(PromptBudget)이 있으면 예산에 맞춰 줄이고 토큰 내역을 함께 담습니다."""
+        if budget is None:
+            return CompiledPrompt(self.prefix, ''.join(section.variants[0] for section in sections), self.fingerprint)
+        suffix, report = budget.assemble(sections, fixed=self.prefix_sections or (('prefix', self.prefix),))
+        return CompiledPrompt(self.prefix, suffix, self.fingerprint, report)
+
+    def build_action_prompt(self, player_char, story_summary, player_action, relevant_lore=(), budget=None):
+        # 예산을 넘으면 관련 로어북 조각 → 스토리 요약 → 인벤토리 목록 순으로 줄입니다.
+        sections = [
+            PromptSection('story_summary', _story_summary_variants(story_summary, """
+# [CONTEXT SUMMARY - PRIMARY DIRECTIVE]
+# You must base your response on the following structured summary of the current situation. This is your primary source of truth."""), priority=2),
+            PromptSection('relevant_lore', _relevant_lore_variants(relevant_lore), priority=3),
+            PromptSection('instructions', f"""
+# [SCENE LOCK - CRITICAL RULE]
+# You are currently in Scene ID: "{player_char.get('scene_id', 'UNKNOWN_SCENE')}". Do not change the scene unless the player's action directly causes it.
+
+# [NARRATIVE ANCHOR - ABSOLUTE PRIORITY]
+# Your immediate task is to respond to the player's very last action based on the context above.
+# 1. Player's Last Action: "{player_action}"
+# 2. Based on the "current_goal" from the summary, decide if this action requires a dice roll.
+# All your narrative output for the 'story' field in the JSON response MUST be in Korean.
+
+"""),
+            PromptSection('character_state', _character_state_variants(player_char), priority=1),
+            PromptSection('rules', _ACTION_RULES),
+        ]
+        return self._compile(sections, budget)
+
+    def build_roll_prompt(self, player_char, story_summary, roll_info, relevant_lore=(), budget=None):
+        roll_outcome = roll_info['outcome']
+        sections = [
+            PromptSection('story_summary', _story_summary_variants(story_summary, """
+# [CONTEXT SUMMARY - PRIMARY DIRECTIVE]
+# You must base your response on the following structured summary of the current situation."""), priority=2),
+            PromptSection('relevant_lore', _relevant_lore_variants(relevant_lore), priority=3),
+            PromptSection('instructions', f"""
+# [ROLL CONTINUITY RULE - ABSOLUTE PRIORITY]
+# Your response must be a direct description of the result of the following **specific action**.
+# **Action Being Resolved:** "{roll_info['pending_action']}"
+# **Dice Roll Result:** "{roll_outcome}"
+#
+# ❌ Do NOT reference past events from the log. ONLY resolve the action above.
+# Only describe "how this action ended".
+# All your narrative output for the 'story' field in the JSON response MUST be in Korean.
+
+# --- GM's Story Generation Rules ---
+# 1. Describe the story in a way that fits the "{roll_outcome}".
+# 2. Clearly state how the **Action Being Resolved** led to the "{roll_outcome}".
+# 3. After describing the story, ask a question to guide the player's next action.
+
+# --- Detailed Dice Roll Breakdown (for reference only) ---
+# Total {roll_info['total']} (Dice 1: {roll_info['dice1']}, Dice 2: {roll_info['dice2']}, Stat: {roll_info['stat_name_ko']}, Modifier: {roll_info['modifier']})
+# Odds before the roll: {format_odds(roll_info['odds']) if roll_info.get('odds') else 'unknown'} (describe an unlikely result as a surprising turn)
+
+"""),
+            PromptSection('rules', _ROLL_JSON_FORMAT),
+        ]
+        return self._compile(sections, budget)
+
+    def build_room_prompt(self, scene, party, story_summary, round_dice, relevant_lore=(), budget=None):
+        """여러 플레이어의 한 라운드 행동을 한 번에 처리하는 프롬프트. party는 (player_id, 캐릭터, 행동 또는 None) 목록입니다."""
+        party_lines = []
+        for player_id, character, action in party:
+            dice1, dice2 = round_dice[player_id]
+            party_lines.append(
+                f"# - player_id \"{player_id}\": '{character['name']}' ({character.get('description') or 'Not set'}), "
+                f"HP {character['hp']}/{character['maxHp']}, SP {character['sp']}/{character['maxSp']}, "
+                f"Stats {character['stats']}, Inventory {character['inventory']}\n"
+                f"#   Action: \"{action or '(이번 라운드에 행동하지 않음)'}\"\n"
+                f"#   Pre-rolled 2d6 for this round: {dice1}+{dice2}"
+            )
+        party_text = '\n'.join(party_lines)
+        sections = [
+            PromptSection('story_summary', _story_summary_variants(story_summary, """
+# [CONTEXT SUMMARY - PRIMARY DIRECTIVE]
+# You must base your response on the following structured summary of the current situation. This is your primary source of truth."""), priority=2),
+            PromptSection('relevant_lore', _relevant_lore_variants(relevant_lore), priority=3),
+            PromptSection('instructions', f"""
+# [SCENE LOCK - CRITICAL RULE]
+# The whole party is in Scene ID: "{scene.get('scene_id', 'UNKNOWN_SCENE')}" at "{scene.get('location', 'Unknown')}". Do not change the scene unless the party's actions directly cause it.
+
+# [PARTY ROUND - ABSOLUTE PRIORITY]
+# Several players act in the same scene this round. Resolve ALL of their actions together in ONE response.
+# - Actions happen at the same time and can affect each other. Describe them as one continuous scene in "story".
+# - If an action needs a check, use that player's pre-rolled 2d6 plus the modifier of the most fitting stat (stat 1 or less: -1, 2: 0, 3 or more: +1).
+#   Total 10+ is a full success, 7-9 a success at a cost, 6 or less a failure. Mention the result in that player's story.
+# - Return exactly one entry in "players" for every player_id below.
+# All your narrative output MUST be in Korean.
+
+# --- Party ---
+{party_text}
+
+"""),
+            PromptSection('rules', _ROOM_JSON_FORMAT),
+        ]
+        return self._compile(sections, budget)
+
+
+def compile_prompt_templates(lorebook_data):
+    """로어북 데이터로부터 고정 prefix를 한 번 만들어 PromptTemplates로 반환합니다."""
+    world_overview_content = extract_world_overview(lorebook_data)
+    lorebook_gm_directives = lorebook_data.get('GM 지침', DEFAULT_GM_DIRECTIVES)
+
+    gm_role = f"""
+# [TRPG GM ROLE]
+# You are the Game Master for a TTRPG set in a post-apocalyptic Korea.
+# Your style must be **dark, atmospheric, and sparse**. Use Korean only.
+# - Always describe the scene based on the current context and the player's action.
+# - Your response must always end with a question or a clear consequence that drives the story forward.
+# - If the player's action requires a check, you **MUST** set "require_roll": true and "roll_stat" to one of: "strength", "agility", "intelligence", "senses", "willpower".
+# - The story's tone must reflect the following world overview:
+
+"""
+    world_overview = f"""# [WORLD OVERVIEW - TONE AND SETTING PRIORITY]
+{world_overview_content}
+
+"""
+    gm_directives = f"""# --- GM's Directives (for context) ---
+# GM 지침: {lorebook_gm_directives}
+"""
+    prefix_sections = (('gm_role', gm_role), ('world_overview', world_overview), ('gm_directives', gm_directives))
+    prefix = ''.join(text for _, text in prefix_sections)
+    fingerprint = hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:16]
+    return PromptTemplates(prefix=prefix, fingerprint=fingerprint, prefix_sections=prefix_sections)
+
+
+class PrefixContextCache:
+    """프롬프트 prefix를 Gemini 캐시 컨텍스트로 등록하고, 그 캐시에 묶인 모델을 돌려줍니다.
+
+    prefix가 모델의 최소 캐시 토큰 수보다 짧거나 API가 캐싱을 지원하지 않으면 등록에 실패하며,
+    이 경우 해당 prefix는 다시 시도하지 않고 None을 반환합니다 (호출자는 전체 프롬프트를 전송).
+    """
+
+    def __init__(self, model_name, ttl_seconds=3600, generation_kwargs=None):
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.generation_kwargs = generation_kwargs or {}
+        self._entries = {}  # fingerprint -> (model, expires_at) 또는 (None, 0) = 등록 불가
+        self._registering = set()  # 지금 등록 중인 fingerprint
+        self._lock = threading.Lock()
+
+    def get_model(self, prompt):
+        """prefix 캐시에 묶인 모델을 반환합니다.
+
+        등록(네트워크 호출)은 잠금 밖에서 하므로 느리거나 실패하는 등록이 다른 턴을 막지 않습니다.
+        같은 prefix를 등록하는 중에 온 턴은 기다리지 않고 아직 유효한 이전 캐시(없으면 None = 전체 프롬프트)를 씁니다.
+        """
+        key = prompt.fingerprint
+        with self._lock:
+            entry = self._entries.get(key)
+            current = None
+            if entry is not None:
+                cached_model, expires_at = entry
+                if cached_model is None:
+                    return None
+                # 만료 직전의 캐시는 사용하지 않고 새로 등록
+                if time.time() < expires_at - 60:
+                    return cached_model
+                if time.time() < expires_at:
+                    current = cached_model
+            if key in self._registering:
+                return current
+            self._registering.add(key)
+        try:
+            cached_model = self._register(prompt)
+            entry = (cached_model, time.time() + self.ttl_seconds)
+            logger.info(f"프롬프트 prefix 캐시 등록됨: {key}")
+        except Exception as e:
+            logger.warning(f"프롬프트 prefix 캐시 등록 실패 ({key}), 전체 프롬프트를 전송합니다: {e}")
+            cached_model, entry = None, (None, 0)
+        with self._lock:
+            self._entries[key] = entry
+            self._registering.discard(key)
+        return cached_model
+
+    def _register(self, prompt):
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        cached_content = caching.CachedContent.create(
+            model=self.model_name,
+            display_name=f"trpg-prefix-{prompt.fingerprint}",
+            contents=[prompt.prefix],
+            ttl=datetime.timedelta(seconds=self.ttl_seconds),
+        )
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content, **self.generation_kwargs)
@@ -0,0 +1,140 @@
+"""/campaign/export로 내려받은 캠페인 기록을 재생해 검증하는 도구.
+
+기본 모드는 이벤트를 순서대로 적용(apply_event)해 묶음별 스냅샷과 마지막 상태를 다시 만들어 내는지 확인합니다.
+--rerun을 주면 앱을 같은 프로세스에서 TEST_MODE로 띄우고, 기록된 GM 응답을 돌려주는 대체 모델과
+기록된 주사위 눈으로 턴을 /game-turn에 다시 보내 마지막 상태가 같은지 확인하고 턴별 처리 시간을 보고합니다.
+프롬프트 구성, 라우팅, 상태 반영 코드를 바꾼 뒤 실제 캠페인으로 회귀/성능을 확인할 때 씁니다.
+
+사용 예 (backend 폴더에서):
+    curl -b cookies.txt http://localhost:5000/campaign/export > campaign.json
+    python replay.py campaign.json
+    python replay.py campaign.json --rerun --latency-ms 0
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+from campaign_log import SNAPSHOT_FIELDS, apply_event, snapshot
+
+
+def _diff(expected, actual):
+    """스냅샷 필드 중 값이 다른 것의 이름 목록. 기록에 없는 필드(내보낼 때 뺀 주사위 시드)는 비교하지 않습니다."""
+    return [field for field in SNAPSHOT_FIELDS if field in expected and expected[field] != actual.get(field)]
+
+
+def verify(record):
+    """이벤트를 처음부터 적용해 스냅샷/마지막 상태와 비교합니다. 틀린 지점 목록을 반환합니다."""
+    snapshots = {item['event_seq']: item for item in record['snapshots']}
+    state, problems = {}, []
+    if record.get('missing'):
+        # 저장소에서 사라진 묶음: 그 구간의 이벤트가 없으므로 이후 비교도 어긋남
+        problems.append(('missing', record['missing']))
+    for event in record['events']:
+        apply_event(state, copy.deepcopy(event))
+        expected = snapshots.get(event['seq'])
+        if expected is not None and _diff(expected, snapshot(state)):
+            problems.append((event['seq'], _diff(expected, snapshot(state))))
+    if _diff(record['head'], snapshot(state)):
+        problems.append(('head', _diff(record['head'], snapshot(state))))
+    return problems
+
+
+def _recorded_reply(event):
+    """gm 이벤트를 모델 응답 형식(parse_ai_response가 읽는 dict)으로 되돌립니다."""
+    return {'story': event['story'], 'require_roll': event.get('require_roll', False),
+            'roll_stat': event.get('roll_stat'), **event.get('delta', {})}
+
+
+def rerun(record, latency_ms):
+    """기록된 GM 응답으로 턴을 다시 실행합니다. (턴별 결과 목록, 마지막 상태의 차이)를 반환합니다."""
+    if any(event['type'] == 'line' for event in record['events']):
+        raise SystemExit("이벤트 로그 이전 형식에서 옮긴 캠페인(line 이벤트)은 --rerun으로 재생할 수 없습니다.")
+    # 앱을 import하기 전에 재생에 방해되는 기능(입장 제어, 턴 마감, 응답 캐시, 추측 생성)을 끕니다.
+    os.environ.update({
+        'TEST_MODE': '1', 'ADMISSION_CONTROL': '0', 'TURN_SLO_SECONDS': '0', 'RESPONSE_CACHE_MAX_ENTRIES': '0',
+        'SPECULATIVE_ROLLS': '0', 'FAKE_MODEL_LATENCY_MS': str(latency_ms), 'FAKE_MODEL_LATENCY_DIST': 'fixed',
+    })
+    import logging
+    import app as app_module
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    replies = [_recorded_reply(event) for event in record['events'] if event['type'] == 'gm']
+
+    def responder(prompt_text):
+        if '[TRPG CAMPAIGN MEMORY' in prompt_text or not replies:
+            return app_module._mock_model_reply(prompt_text)
+        return replies.pop(0)
+    app_module.model.responder = responder
+    app_module.fast_model.responder = responder
+    # 내보낸 기록에는 주사위 시드가 없으므로 roll 이벤트의 눈을 순서대로 돌려줌
+    dice = {event['index']: (event['dice1'], event['dice2']) for event in record['events'] if event['type'] == 'roll'}
+    app_module.roll_dice = lambda seed, index: dice[index]
+
+    start = record['events'][0]
+    client = app_module.app.test_client()
+    sid = app_module.new_session_id()
+    with client.session_transaction() as sess:
+        sess['sid'] = sid
+    app_module.session_store.save(sid, app_module.campaign_log.start(
+        sid, start['character'], start.get('lorebook_id'), start['story']
+    ))
+
+    turns = []
+    for event in record['events'][1:]:
+        if event['type'] == 'action':
+            payload = {'type': 'action', 'player_action': event['text']}
+        elif event['type'] == 'roll':
+            payload = {'type': 'roll', 'modifier_stat': event['stat']}
+        elif event['type'] == 'note':
+            # 늦게 도착한 응답은 타이밍에 따라 생기므로 기록된 그대로 로그에 넣음
+            state = app_module.session_store.load(sid)
+            app_module.campaign_log.append(sid, state, app_module.new_event('note', label=event.get('label'), story=event['story']))
+            app_module.session_store.save(sid, state)
+            continue
+        else:
+            continue
+        started = time.perf_counter()
+        response = client.post('/game-turn', json=payload)
+        turns.append({'seq': event['seq'], 'type': payload['type'], 'status': response.status_code,
+                      'ms': round((time.perf_counter() - started) * 1000, 1)})
+    final = snapshot(app_module.session_store.load(sid))
+    return turns, _diff(record['head'], final)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('campaign', help='/campaign/export 응답을 저장한 JSON 파일')
+    parser.add_argument('--rerun', action='store_true', help='기록된 GM 응답으로 턴을 앱에 다시 보내 재생')
+    parser.add_argument('--latency-ms', type=float, default=0, help='--rerun에서 대체 모델의 고정 지연')
+    parser.add_argument('--json', action='store_true', help='결과를 JSON 줄로 출력')
+    args = parser.parse_args()
+
+    with open(args.campaign, encoding='utf-8') as f:
+        record = json.load(f)
+
+    problems = verify(record)
+    result = {'events': len(record['events']), 'snapshots': len(record['snapshots']),
+              'verify': 'ok' if not problems else problems}
+    if args.rerun:
+        turns, diff = rerun(record, args.latency_ms)
+        times = sorted(turn['ms'] for turn in turns)
+        result.update({'rerun': 'ok' if not diff else diff, 'turns': len(turns),
+                       'errors': sum(1 for turn in turns if turn['status'] != 200),
+                       'turn_ms_total': round(sum(times), 1), 'turn_ms_max': times[-1] if times else 0})
+        if not args.json:
+            for turn in turns:
+                print(f"#{turn['seq']:>5} {turn['type']:>6} {turn['status']} {turn['ms']:>8.1f}ms")
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for name, value in result.items():
+            print(f"{name:>14}: {value}")
+    ok = not problems and result.get('rerun', 'ok') == 'ok'
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""모델 응답 캐시.
+
+같은 (모델 이름, 전체 프롬프트, 생성 설정)에 대한 응답 텍스트를 해시 키로 저장해 두었다가,
+새로고침/재시도 요청이나 모든 새 캐릭터가 같은 '시작 설정' 상태에서 같은 첫 행동을 하는 경우,
+리플레이/QA 실행처럼 결정적인 상황에서 Gemini를 다시 호출하지 않고 바로 돌려줍니다.
+
+- 메모리 계층: 크기(max_entries)와 TTL로 제한되는 LRU
+- 디스크 계층(선택): SQLite 파일. 메모리에서 밀려나거나 재시작한 뒤에도 TTL 동안 재사용
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(model_name, prompt_text, settings=None):
+    """캐시 키(sha256 hex)를 만듭니다. settings는 JSON으로 표현 가능한 값이어야 하며, 아니면 str()로 변환됩니다."""
+    payload = json.dumps([model_name, prompt_text, settings], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, ttl_seconds=600, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (text, stored_at)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._disk.execute('PRAGMA journal_mode=WAL')
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, text TEXT NOT NULL, stored_at REAL NOT NULL)'
+            )
+
+    def get(self, key):
+        """캐시된 응답 텍스트를 반환합니다. 없거나 만료되었으면 None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                text, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return text
+                del self._entries[key]
+
+            if self._disk is not None:
+                row = self._disk.execute('SELECT text, stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    # 디스크에서 찾은 항목은 메모리 계층으로 올려 다음 조회를 빠르게
+                    self._store_memory(key, row[0], row[1])
+                    self._counters['disk_hits'] += 1
+                    return row[0]
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, text, now)
+            self._counters['stores'] += 1
+            if self._disk is not None:
+                self._disk.execute(
+                    'INSERT OR REPLACE INTO responses (key, text, stored_at) VALUES (?, ?, ?)', (key, text, now)
+                )
+                self._disk.execute('DELETE FROM responses WHERE stored_at < ?', (now - self.ttl_seconds,))
+
+    def _store_memory(self, key, text, stored_at):
+        self._entries[key] = (text, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['disk_hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'hit_ratio': round((self._counters['hits'] + self._counters['disk_hits']) / lookups, 3) if lookups else 0.0,
+            }
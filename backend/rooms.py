@@ -0,0 +1,261 @@
+"""여러 플레이어가 한 장면을 함께 진행하는 방(room) 모드.
+
+방의 캐릭터들은 장면(scene_id, location, current_scenario_state)과 게임 로그를 공유합니다.
+플레이어들의 행동을 라운드 시간(round_window_seconds) 동안 모았다가, 모두 행동했거나 시간이 지나면
+한 번의 GM 호출로 함께 처리합니다. 플레이어 N명이 한 라운드에 N번 호출하던 것을 1번으로 줄입니다.
+
+라운드 처리 결과와 참가/행동 알림은 방을 구독 중인 클라이언트(SSE)에 바로 전달됩니다.
+방 상태는 프로세스 메모리에 있으므로, 같은 방의 플레이어는 같은 서버 프로세스에 연결되어야 합니다.
+"""
+import logging
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class RoomError(Exception):
+    """방 요청을 처리할 수 없을 때 발생합니다. `status`는 응답할 HTTP 상태 코드입니다."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class RoomLog:
+    """최근 max_lines줄만 보관하는 방 게임 로그.
+
+    len()과 인덱스는 지금까지 쌓인 전체 줄 수 기준이라, 스토리 메모리 커서가 로그가 잘려도 그대로 맞습니다.
+    보관 범위 밖의 줄은 슬라이스 결과에서 빠집니다 (그 앞부분은 스토리 메모리 요약에 이미 반영되어 있음).
+    """
+
+    def __init__(self, max_lines, lines=(), total=None):
+        self._lines = deque(lines, maxlen=max_lines)
+        self._total = len(self._lines) if total is None else total
+
+    def append(self, line):
+        self._lines.append(line)
+        self._total += 1
+
+    def copy(self):
+        return RoomLog(self._lines.maxlen, self._lines, self._total)
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, index):
+        first = self._total - len(self._lines)  # 보관 중인 첫 줄의 인덱스
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._total)
+            start = max(start, first)
+            if stop <= start:
+                return []
+            return list(islice(self._lines, start - first, stop - first))[::step]
+        if index < 0:
+            index += self._total
+        if not first <= index < self._total:
+            raise IndexError(index)
+        return self._lines[index - first]
+
+    def __iter__(self):
+        return iter(list(self._lines))
+
+    def __reversed__(self):
+        return reversed(list(self._lines))
+
+
+class Room:
+    def __init__(self, room_id, lorebook_id, scene, opening_message, max_log_lines=100):
+        self.room_id = room_id
+        self.lorebook_id = lorebook_id
+        self.scene = dict(scene)  # scene_id, location, current_scenario_state
+        self.players = OrderedDict()  # player_id -> 캐릭터 dict
+        self.game_log = RoomLog(max_log_lines, [f"<strong>GM:</strong> {opening_message}"])
+        self.round_no = 1
+        self.actions = OrderedDict()  # 이번 라운드에 모인 행동: player_id -> 행동
+        self.round_deadline = None
+        self.resolving = False
+        self.subscribers = []
+        self.updated_at = time.monotonic()
+        self.lock = threading.RLock()
+        self._timer = None
+
+    @property
+    def memory_key(self):
+        """스토리 메모리 등 세션 단위 컴포넌트에서 이 방을 가리키는 키."""
+        return f"room:{self.room_id}"
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'room_id': self.room_id,
+                'lorebook_id': self.lorebook_id,
+                'scene': dict(self.scene),
+                'players': [{'player_id': player_id, **character} for player_id, character in self.players.items()],
+                'round': self.round_no,
+                'submitted': list(self.actions),
+                'round_deadline_in': (round(max(0.0, self.round_deadline - time.monotonic()), 1)
+                                      if self.round_deadline else None),
+                'resolving': self.resolving,
+                'game_log': self.game_log[-20:],
+            }
+
+
+class RoomManager:
+    """방 목록과 라운드 진행을 관리합니다.
+
+    `generate_round(room, actions)`는 방의 현재 상태와 이번 라운드 행동들로 GM 결과를 만들고 (락 없이, 모델 호출 포함),
+    `apply_round(room, actions, result)`는 그 결과를 방 상태에 반영해 클라이언트에 보낼 dict를 반환합니다 (방 락 안에서 호출).
+    """
+
+    def __init__(self, generate_round, apply_round, round_window_seconds=20.0, max_players=6,
+                 max_rooms=200, idle_ttl_seconds=3600, max_workers=4, on_expire=None, max_log_lines=100):
+        self.generate_round = generate_round
+        self.on_expire = on_expire  # 정리된 방마다 호출 (방에 딸린 스토리 메모리 등을 지우도록)
+        self.apply_round = apply_round
+        self.round_window_seconds = round_window_seconds
+        self.max_players = max_players
+        self.max_log_lines = max_log_lines  # 방마다 보관하는 게임 로그 줄 수
+        self.max_rooms = max_rooms
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='room-round')
+        self._counters = {'rounds': 0, 'actions': 0, 'failed_rounds': 0}
+
+    # --- 방 / 참가자 ---
+    def create(self, lorebook_id, scene, opening_message):
+        self._expire_idle()
+        with self._lock:
+            if len(self._rooms) >= self.max_rooms:
+                raise RoomError("열 수 있는 방의 수를 넘었습니다. 잠시 후 다시 시도해주세요.", status=503)
+            room = Room(secrets.token_urlsafe(6), lorebook_id, scene, opening_message, self.max_log_lines)
+            self._rooms[room.room_id] = room
+        logger.info(f"방 생성됨: {room.room_id} (로어북: {lorebook_id})")
+        return room
+
+    def get(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            raise RoomError(f"방을 찾을 수 없습니다: {room_id}", status=404)
+        return room
+
+    def join(self, room_id, character):
+        room = self.get(room_id)
+        with room.lock:
+            if len(room.players) >= self.max_players:
+                raise RoomError("방이 가득 찼습니다.", status=409)
+            player_id = secrets.token_urlsafe(6)
+            room.players[player_id] = character
+            room.game_log.append(f"<strong>GM:</strong> {character['name']}님이 합류했습니다.")
+            room.updated_at = time.monotonic()
+            self._publish(room, 'member', {'player_id': player_id, 'name': character['name'], 'players': len(room.players)})
+        return player_id
+
+    # --- 라운드 ---
+    def submit(self, room_id, player_id, action):
+        """이번 라운드의 행동을 등록합니다. 모든 플레이어가 행동하면 라운드를 바로 처리합니다."""
+        room = self.get(room_id)
+        with room.lock:
+            if player_id not in room.players:
+                raise RoomError("이 방의 참가자가 아닙니다.", status=403)
+            if room.resolving:
+                raise RoomError("이번 라운드를 처리 중입니다. 결과를 받은 뒤 다음 행동을 보내주세요.", status=409)
+            room.actions[player_id] = action
+            room.updated_at = time.monotonic()
+            if room.round_deadline is None:
+                room.round_deadline = time.monotonic() + self.round_window_seconds
+                room._timer = threading.Timer(self.round_window_seconds, self._close_round, args=(room, room.round_no))
+                room._timer.daemon = True
+                room._timer.start()
+            waiting_for = [room.players[pid]['name'] for pid in room.players if pid not in room.actions]
+            self._publish(room, 'action', {
+                'round': room.round_no, 'name': room.players[player_id]['name'], 'waiting_for': waiting_for
+            })
+            if not waiting_for:
+                self._close_round(room, room.round_no)
+            return {'round': room.round_no, 'waiting_for': waiting_for}
+
+    def _close_round(self, room, round_no):
+        """라운드를 마감하고 처리 작업을 예약합니다. 이미 마감된 라운드면 아무것도 하지 않습니다."""
+        with room.lock:
+            if room.round_no != round_no or room.resolving or not room.actions:
+                return
+            if room._timer is not None:
+                room._timer.cancel()
+                room._timer = None
+            room.resolving = True
+            actions = OrderedDict(room.actions)
+        self._executor.submit(self._resolve, room, round_no, actions)
+
+    def _resolve(self, room, round_no, actions):
+        try:
+            result = self.generate_round(room, actions)
+            with room.lock:
+                payload = self.apply_round(room, actions, result)
+                payload['round'] = round_no
+                self._counters['rounds'] += 1
+                self._counters['actions'] += len(actions)
+                self._publish(room, 'round', payload)
+        except Exception as e:
+            logger.error(f"방 {room.room_id} 라운드 {round_no} 처리 중 오류: {e}", exc_info=True)
+            with room.lock:
+                self._counters['failed_rounds'] += 1
+                # 이번 라운드의 행동은 아래 finally에서 비워지므로, 다음 라운드에 다시 제출하도록 알림
+                self._publish(room, 'error', {'round': round_no, 'story': "GM: 라운드를 처리하지 못했습니다. 행동을 다시 보내주세요."})
+        finally:
+            with room.lock:
+                room.round_no = round_no + 1
+                room.actions = OrderedDict()
+                room.round_deadline = None
+                room.resolving = False
+                room.updated_at = time.monotonic()
+
+    # --- 구독 (SSE) ---
+    def subscribe(self, room_id):
+        room = self.get(room_id)
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with room.lock:
+            room.subscribers.append(subscriber)
+        return room, subscriber
+
+    def unsubscribe(self, room, subscriber):
+        with room.lock:
+            if subscriber in room.subscribers:
+                room.subscribers.remove(subscriber)
+
+    def _publish(self, room, event, payload):
+        for subscriber in list(room.subscribers):
+            try:
+                subscriber.put_nowait((event, payload))
+            except queue.Full:
+                # 읽지 않는 클라이언트 때문에 라운드 처리가 막히지 않도록 연결을 끊음
+                room.subscribers.remove(subscriber)
+
+    # --- 관리 ---
+    def _expire_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [room_id for room_id, room in self._rooms.items()
+                    if now - room.updated_at > self.idle_ttl_seconds and not room.subscribers]
+            expired = [self._rooms.pop(room_id) for room_id in idle]
+        if self.on_expire is not None:
+            for room in expired:
+                self.on_expire(room)
+
+    def stats(self):
+        with self._lock:
+            rooms = len(self._rooms)
+        return {
+            **self._counters,
+            'rooms': rooms,
+            # 방 모드가 없었다면 행동마다 한 번씩 호출했을 것
+            'model_calls_saved': self._counters['actions'] - self._counters['rounds'],
+        }
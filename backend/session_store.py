@@ -0,0 +1,155 @@
+"""서버 측 게임 세션 저장소.
+
+Flask 쿠키 세션에는 짧은 세션 ID(`sid`)만 저장하고, 턴마다 커지는 `game_log`와
+`character_data` 같은 게임 상태는 이 모듈의 저장소에 보관합니다.
+덕분에 캠페인이 길어져도 요청/응답마다 오가는 쿠키 크기는 일정하게 유지됩니다.
+
+- MemorySessionStore: 프로세스 메모리에 보관하는 크기 제한 LRU 저장소 (기본값)
+- SqliteSessionStore: SQLite 파일에 보관하여 서버 재시작 후에도 세션이 유지되는 저장소
+"""
+import abc
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def new_session_id():
+    """쿠키에 담을 짧고 추측하기 어려운 세션 ID를 생성합니다."""
+    return secrets.token_urlsafe(16)
+
+
+class SessionStore(abc.ABC):
+    """세션 저장소 공통 인터페이스. 상태는 JSON 직렬화 가능한 dict여야 합니다.
+
+    메서드를 빠뜨린 구현은 첫 요청이 아니라 생성 시점에 TypeError로 드러납니다.
+    """
+
+    @abc.abstractmethod
+    def load(self, sid):
+        """세션 상태를 반환합니다. 없으면 None을 반환합니다."""
+
+    @abc.abstractmethod
+    def save(self, sid, state):
+        """세션 상태를 저장하고, 직렬화된 크기(바이트)를 반환합니다."""
+
+    @abc.abstractmethod
+    def delete(self, sid):
+        """세션 상태를 지웁니다. 없으면 아무것도 하지 않습니다."""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """보관 중인 세션 수."""
+
+    @staticmethod
+    def _dumps(state):
+        return json.dumps(state, ensure_ascii=False, separators=(',', ':'))
+
+
+class MemorySessionStore(SessionStore):
+    """최대 `max_sessions`개까지만 보관하는 LRU 메모리 저장소.
+
+    상태를 JSON 문자열로 저장하므로, 호출자가 불러온 dict를 수정해도 저장된 값은
+    save()를 다시 호출하기 전까지 바뀌지 않습니다 (쿠키 세션과 같은 동작).
+    """
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            payload = self._data.get(sid)
+            if payload is None:
+                return None
+            self._data.move_to_end(sid)
+        return json.loads(payload)
+
+    def save(self, sid, state):
+        payload = self._dumps(state)
+        with self._lock:
+            self._data[sid] = payload
+            self._data.move_to_end(sid)
+            # 가장 오래 사용되지 않은 세션부터 제거
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+        return len(payload.encode('utf-8'))
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SqliteSessionStore(SessionStore):
+    """SQLite 파일 기반 저장소. 서버 재시작이나 여러 gunicorn 워커 간에도 세션을 공유합니다.
+
+    `ttl_seconds`가 주어지면 그보다 오래 갱신되지 않은 세션은 저장 시점에 정리되며, 정리된 세션마다
+    `on_expire(sid, state)`를 호출합니다 (세션에 딸린 다른 저장소의 데이터를 함께 지우도록).
+    같은 파일에 여러 저장소를 둘 때는 `table`로 구분합니다.
+    """
+
+    def __init__(self, path, ttl_seconds=None, table='sessions', on_expire=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.on_expire = on_expire
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            ' sid TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_updated ON {table}(updated_at)')
+
+    def load(self, sid):
+        with self._lock:
+            row = self._conn.execute(f'SELECT state FROM {self.table} WHERE sid = ?', (sid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, sid, state):
+        payload = self._dumps(state)
+        now = time.time()
+        expired = []
+        with self._lock:
+            self._conn.execute(
+                f'INSERT INTO {self.table} (sid, state, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(sid) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at',
+                (sid, payload, now)
+            )
+            if self.ttl_seconds:
+                cutoff = now - self.ttl_seconds
+                if self.on_expire is not None:
+                    expired = self._conn.execute(f'SELECT sid, state FROM {self.table} WHERE updated_at < ?', (cutoff,)).fetchall()
+                self._conn.execute(f'DELETE FROM {self.table} WHERE updated_at < ?', (cutoff,))
+        for expired_sid, expired_state in expired:
+            self.on_expire(expired_sid, json.loads(expired_state))
+        return len(payload.encode('utf-8'))
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE sid = ?', (sid,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+
+def create_session_store(backend='memory', max_sessions=1000, path=None, ttl_seconds=None, table='sessions', on_expire=None):
+    """설정 문자열로 세션 저장소를 생성합니다. backend: 'memory' 또는 'sqlite'."""
+    backend = (backend or 'memory').lower()
+    if backend == 'memory':
+        return MemorySessionStore(max_sessions=max_sessions)
+    if backend == 'sqlite':
+        if not path:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db')
+        return SqliteSessionStore(path, ttl_seconds=ttl_seconds, table=table, on_expire=on_expire)
+    raise ValueError(f"알 수 없는 세션 저장소 종류입니다: {backend}")
@@ -0,0 +1,106 @@
+"""판정 결과 서술의 추측 생성(speculative pre-generation).
+
+행동 턴이 판정을 요구하면 서버는 이미 보류 중인 행동, 능력치, 수정치를 알고 있습니다.
+주사위를 그 자리에서 서버 측에 확정해 두면 판정 프롬프트도 확정되므로, 플레이어가 판정 버튼을
+누르기 전에 백그라운드에서 미리 판정 결과 서술을 생성해 둘 수 있습니다.
+
+추측은 프롬프트 전체의 해시로 식별합니다. 판정 요청이 왔을 때 다시 만든 프롬프트가 같을 때만
+미리 생성한 응답을 사용하므로, 그 사이 상태가 바뀌었다면(능력치 변경, 스토리 메모리 갱신 등)
+자동으로 일반 경로로 생성합니다. 사용되지 않은 추측은 취소하고 통계에 남깁니다.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def speculation_key(prompt):
+    return hashlib.sha256(prompt.text.encode('utf-8')).hexdigest()
+
+
+class _Speculation:
+    __slots__ = ('key', 'future', 'started_at', 'finished_at')
+
+    def __init__(self, key, future):
+        self.key = key
+        self.future = future
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def mark_finished(self, _future):
+        self.finished_at = time.monotonic()
+
+
+class RollSpeculator:
+    """세션별로 최대 하나의 추측 생성(future)을 보관합니다. future는 `client.submit()`으로 만든 것이어야 합니다."""
+
+    def __init__(self, client, max_age_seconds=300):
+        self.client = client
+        self.max_age_seconds = max_age_seconds
+        self._entries = {}  # sid -> _Speculation
+        self._lock = threading.Lock()
+        self._counters = {'started': 0, 'hits': 0, 'ready_hits': 0, 'misses': 0, 'wasted': 0, 'failed': 0}
+        self._saved_seconds = 0.0
+
+    def start(self, sid, key, future):
+        """추측 생성을 등록합니다. 같은 세션의 이전 추측은 버립니다."""
+        entry = _Speculation(key, future)
+        future.add_done_callback(entry.mark_finished)
+        with self._lock:
+            previous = self._entries.pop(sid, None)
+            self._entries[sid] = entry
+            self._counters['started'] += 1
+        if previous is not None:
+            self._drop(previous)
+        self._expire()
+
+    def take(self, sid, key):
+        """`key`와 일치하는 추측이 있으면 그 future를 반환합니다. 일치하지 않는 추측은 버립니다."""
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+        if entry is None:
+            return None
+        future = entry.future
+        if entry.key != key:
+            with self._lock:
+                self._counters['misses'] += 1
+            self._drop(entry)
+            return None
+        if future.done() and future.exception() is not None:
+            with self._lock:
+                self._counters['failed'] += 1
+            logger.info(f"추측 생성이 실패해 일반 경로로 생성합니다: {future.exception()}")
+            return None
+        with self._lock:
+            self._counters['hits'] += 1
+            if future.done():
+                self._counters['ready_hits'] += 1
+            # 판정 요청 시점까지 이미 진행된 생성 시간 = 플레이어가 기다리지 않아도 되는 시간
+            self._saved_seconds += (entry.finished_at or time.monotonic()) - entry.started_at
+        return future
+
+    def discard(self, sid):
+        """세션의 추측을 버립니다 (플레이어가 판정 대신 다른 행동을 한 경우 등)."""
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+        if entry is not None:
+            self._drop(entry)
+
+    def _drop(self, entry):
+        self.client.cancel(entry.future)  # 아직 대기열에 있으면 모델을 호출하지 않음. 이미 실행 중이면 결과만 버림
+        with self._lock:
+            self._counters['wasted'] += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, entry in self._entries.items() if now - entry.started_at > self.max_age_seconds]
+            entries = [self._entries.pop(sid) for sid in expired]
+        for entry in entries:
+            self._drop(entry)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'pending': len(self._entries), 'saved_seconds': round(self._saved_seconds, 2)}
@@ -0,0 +1,45 @@
+"""서버 시작(cold start) 단계별 소요 시간 기록.
+
+Render처럼 쉬고 있던 인스턴스가 요청을 받아 다시 뜨는 환경에서는 모듈 import와 초기화 시간이
+곧 첫 요청의 지연입니다. StartupProfile은 app.py가 import되는 동안의 단계(`mark`)와
+첫 턴 전에 미뤄 둔 초기화(`phase`: 로어북 색인, 모델 클라이언트 생성 등)의 소요 시간을 기록합니다.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._last_mark = self.started
+        self._phases = {}  # 단계 이름 -> 밀리초
+        self._lock = threading.Lock()
+        self.ready_ms = None  # import가 끝나 요청을 받을 수 있게 된 시점
+
+    def mark(self, name):
+        """직전 mark 이후 지금까지의 시간을 `name` 단계로 기록합니다."""
+        now = time.perf_counter()
+        with self._lock:
+            self._phases[name] = round((now - self._last_mark) * 1000, 1)
+            self._last_mark = now
+
+    def ready(self):
+        self.mark('app_init')
+        self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._phases[name] = round(seconds * 1000, 1)
+
+    def report(self):
+        with self._lock:
+            return {'ready_ms': self.ready_ms, 'phases_ms': dict(self._phases)}
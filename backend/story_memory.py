@@ -0,0 +1,161 @@
+"""게임 로그의 점진적 요약(rolling memory).
+
+`_create_story_summary`가 마지막 GM 메시지만 보고 요약을 만들면 긴 캠페인에서 맥락을 잃고,
+반대로 game_log 전체를 프롬프트에 넣으면 프롬프트가 캠페인 길이에 비례해 커집니다.
+
+StoryMemory는 세션마다 작은 구조화 요약(목표, 위협, 만난 NPC, 얻은 아이템, 주요 사건, 남은 의문)을
+유지하고, N턴마다 "지난 요약 이후 새로 쌓인 로그"만 요약기에 넘겨 갱신합니다.
+갱신은 백그라운드 스레드에서 수행되므로 플레이어의 턴 응답 시간에는 영향을 주지 않습니다.
+"""
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ('goals', 'threats', 'npcs_met', 'items_gained', 'key_events', 'open_questions')
+LOG_LINES_PER_TURN = 2  # 턴마다 (플레이어 행동 또는 판정 결과, GM 응답) 두 줄이 쌓임
+RECENT_TURNS_WITHOUT_MEMORY = 4  # 요약 갱신을 끈 경우 프롬프트에 넣을 최근 턴 수
+
+_HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def strip_log_markup(entry):
+    """게임 로그 한 줄에서 HTML 태그를 제거합니다."""
+    return _HTML_TAG_PATTERN.sub('', entry).strip()
+
+
+def empty_summary():
+    return {name: [] for name in SUMMARY_FIELDS}
+
+
+def build_summary_prompt(previous_summary, new_entries):
+    """이전 요약과 새 로그만으로 갱신된 요약을 요청하는 프롬프트를 만듭니다."""
+    previous_json = json.dumps(previous_summary, ensure_ascii=False, indent=2)
+    log_text = '\n'.join(f"- {strip_log_markup(entry)}" for entry in new_entries)
+    return f"""
+# [TRPG CAMPAIGN MEMORY - SUMMARIZER]
+# You maintain a compact memory of an ongoing TTRPG campaign. Use Korean only.
+# Update the previous memory using ONLY the new log entries below.
+# - Keep entries short (one line each). Merge duplicates. Drop goals/threats/questions that were resolved.
+# - "key_events" keeps only the most important events of the whole campaign, oldest first.
+
+# --- Previous Memory ---
+{previous_json}
+
+# --- New Log Entries ---
+{log_text}
+
+```json
+{{
+    "goals": ["[ 플레이어가 추구하는 목표 ]"],
+    "threats": ["[ 아직 해결되지 않은 위협 ]"],
+    "npcs_met": ["[ 만난 인물: 한 줄 설명 ]"],
+    "items_gained": ["[ 얻은 중요한 아이템 ]"],
+    "key_events": ["[ 주요 사건 ]"],
+    "open_questions": ["[ 아직 풀리지 않은 의문 ]"]
+}}
+```
+"""
+
+
+class StoryMemory:
+    """세션별 구조화 요약을 N턴마다 백그라운드에서 갱신하는 컴포넌트.
+
+    `summarize_fn(previous_summary, new_entries)`는 갱신된 요약 dict를 반환해야 합니다.
+    요약은 게임 상태와 별도의 키(`<sid>:memory`)로 `store`에 저장되므로,
+    백그라운드 갱신이 진행 중인 턴의 상태 저장과 충돌하지 않습니다.
+    """
+
+    def __init__(self, store, summarize_fn, update_every_turns=4, max_items=8):
+        self.store = store
+        self.summarize_fn = summarize_fn
+        self.update_every_turns = update_every_turns
+        self.max_items = max_items
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='story-memory')
+        self._updating = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(sid):
+        return f"{sid}:memory"
+
+    def delete(self, sid):
+        """세션(또는 방)이 정리될 때 요약을 지웁니다."""
+        if sid:
+            self.store.delete(self._key(sid))
+
+    def get(self, sid):
+        """{'summary': {...}, 'cursor': 요약에 반영된 로그 줄 수}를 반환합니다."""
+        memory = self.store.load(self._key(sid)) if sid else None
+        return memory or {'summary': empty_summary(), 'cursor': 0}
+
+    @property
+    def recent_window(self):
+        """프롬프트에 넣을 최근 로그 줄 수 (요약 갱신 주기만큼, 갱신을 껐으면 RECENT_TURNS_WITHOUT_MEMORY턴)."""
+        return (self.update_every_turns if self.update_every_turns > 0 else RECENT_TURNS_WITHOUT_MEMORY) * LOG_LINES_PER_TURN
+
+    def pending_entries(self, sid, game_log):
+        """아직 요약에 반영되지 않은 로그 줄들 중 최근 recent_window줄.
+
+        갱신이 밀리거나 꺼져 있으면 커서가 제자리이므로, 창 밖의 로그(보관된 이벤트 묶음)는 불러오지 않습니다.
+        """
+        cursor = self.get(sid)['cursor'] if self.update_every_turns > 0 else 0
+        if cursor > len(game_log):  # 새 게임으로 로그가 짧아졌다면 처음부터
+            cursor = 0
+        return game_log[max(cursor, len(game_log) - self.recent_window):]
+
+    def maybe_schedule(self, sid, game_log):
+        """새 로그가 N턴 이상 쌓였으면 백그라운드 갱신을 예약합니다. 예약했으면 True."""
+        if not sid or self.update_every_turns <= 0:
+            return False
+        memory = self.get(sid)
+        cursor = memory['cursor'] if memory['cursor'] <= len(game_log) else 0
+        if len(game_log) - cursor < self.update_every_turns * LOG_LINES_PER_TURN:
+            return False
+        with self._lock:
+            if sid in self._updating:
+                return False
+            self._updating.add(sid)
+        self._executor.submit(self._update, sid, memory['summary'], list(game_log[cursor:]), len(game_log))
+        return True
+
+    def _update(self, sid, previous_summary, new_entries, new_cursor):
+        try:
+            try:
+                updated = self.summarize_fn(previous_summary, new_entries)
+            except Exception as e:
+                logger.warning(f"요약기 호출 실패, 간단한 요약으로 대체합니다: {e}")
+                updated = None
+            summary = self._merge(previous_summary, updated, new_entries)
+            self.store.save(self._key(sid), {'summary': summary, 'cursor': new_cursor})
+            logger.debug(f"스토리 메모리 갱신됨: sid={sid[:6]}…, 로그 {new_cursor}줄까지 반영")
+        except Exception as e:
+            logger.error(f"스토리 메모리 갱신 중 오류: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._updating.discard(sid)
+
+    def _merge(self, previous_summary, updated, new_entries):
+        """요약기 결과를 정리하고 항목 수를 제한합니다. 결과가 없으면 새 GM 메시지를 주요 사건으로 추가합니다."""
+        if not isinstance(updated, dict):
+            updated = dict(previous_summary)
+            gm_lines = [strip_log_markup(entry).replace('GM:', '', 1).strip()
+                        for entry in new_entries if entry.strip().startswith('<strong>GM:')]
+            updated['key_events'] = list(previous_summary.get('key_events', [])) + [line[:120] for line in gm_lines[-2:]]
+
+        summary = {}
+        for name in SUMMARY_FIELDS:
+            values = updated.get(name) or []
+            if not isinstance(values, list):
+                values = [values]
+            cleaned = []
+            for value in values:
+                value = str(value).strip()
+                if value and value not in cleaned:
+                    cleaned.append(value)
+            # 오래된 항목부터 버려서 요약 크기를 일정하게 유지
+            summary[name] = cleaned[-self.max_items:]
+        return summary
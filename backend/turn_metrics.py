@@ -0,0 +1,186 @@
+"""턴 단위 성능 계측과 Prometheus 형식 지표.
+
+턴 하나를 처리하는 동안 단계별 소요 시간(스토리 요약, 프롬프트 생성, 모델 호출의 첫 토큰/전체,
+응답 파싱, 상태 반영, 세션 저장)을 TurnTrace에 기록하고, 턴이 끝나면 TurnMetrics가
+히스토그램/카운터로 집계합니다. 집계 결과는 `/metrics`에서 Prometheus 텍스트 형식으로 내보냅니다.
+
+외부 의존성 없이 동작하도록 필요한 만큼의 Counter/Histogram만 직접 구현했습니다.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = tuple(label_names)
+        self._series = {}  # 레이블 -> [버킷별 개수..., +Inf 개수], 합계
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class TurnTrace:
+    """턴 하나의 단계별 소요 시간과 크기 정보."""
+
+    def __init__(self, turn_type, mode):
+        self.turn_type = turn_type
+        self.mode = mode  # 'sync' (/game-turn) 또는 'stream' (/game-turn-stream)
+        self.started = time.perf_counter()
+        self.phases = {}  # 단계 이름 -> 초 (같은 단계가 여러 번이면 합산)
+        self.sizes = {}   # prompt_tokens, response_tokens, session_bytes
+        self.prompt_sections = {}  # 프롬프트 섹션 -> 토큰 수
+        self.prompt_trimmed = []   # 예산 때문에 줄인 섹션
+        self.cache_hit = False
+
+    @contextmanager
+    def span(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def record(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class TurnMetrics:
+    """TurnTrace를 집계하는 지표 모음. `slow_turn_seconds`를 넘는 턴은 단계별 내역과 함께 로그로 남깁니다."""
+
+    def __init__(self, slow_turn_seconds=0, prefix='trpg'):
+        self.slow_turn_seconds = slow_turn_seconds
+        self.turns = Counter(f'{prefix}_turns_total', 'Game turns processed', ('turn_type', 'mode', 'status'))
+        self.turn_seconds = Histogram(f'{prefix}_turn_seconds', 'End-to-end game turn latency',
+                                      LATENCY_BUCKETS, ('turn_type', 'mode'))
+        self.phase_seconds = Histogram(f'{prefix}_turn_phase_seconds', 'Time spent in each phase of a game turn',
+                                       LATENCY_BUCKETS, ('phase', 'turn_type'))
+        self.tokens = Histogram(f'{prefix}_turn_tokens', 'Estimated prompt/response tokens per turn',
+                                TOKEN_BUCKETS, ('kind', 'turn_type'))
+        self.session_bytes = Histogram(f'{prefix}_session_state_bytes', 'Serialized session state size after a turn',
+                                       BYTE_BUCKETS)
+        self.cache_hits = Counter(f'{prefix}_turn_response_cache_hits_total', 'Turns answered from the response cache',
+                                  ('turn_type',))
+        self.section_tokens = Histogram(f'{prefix}_prompt_section_tokens', 'Estimated tokens per prompt section',
+                                        TOKEN_BUCKETS, ('section', 'turn_type'))
+        self.trimmed_sections = Counter(f'{prefix}_prompt_trimmed_total', 'Prompt sections shortened to fit the token budget',
+                                        ('section',))
+        self._collectors = []  # (이름, 설명, 콜백) - 수집 시점에 값을 읽는 gauge
+        self._extra_metrics = []  # 다른 컴포넌트가 직접 갱신하는 Counter/Histogram
+
+    def add_gauge(self, name, documentation, callback):
+        """`/metrics`를 읽을 때마다 callback()의 값을 gauge로 내보냅니다."""
+        self._collectors.append((name, documentation, callback))
+
+    def add_metric(self, metric):
+        """다른 컴포넌트가 관리하는 Counter/Histogram을 `/metrics` 출력에 포함합니다."""
+        self._extra_metrics.append(metric)
+
+    def observe_turn(self, trace, status):
+        total = trace.elapsed()
+        self.turns.inc(turn_type=trace.turn_type, mode=trace.mode, status=status)
+        self.turn_seconds.observe(total, turn_type=trace.turn_type, mode=trace.mode)
+        for phase, seconds in trace.phases.items():
+            self.phase_seconds.observe(seconds, phase=phase, turn_type=trace.turn_type)
+        for kind in ('prompt', 'response'):
+            if f'{kind}_tokens' in trace.sizes:
+                self.tokens.observe(trace.sizes[f'{kind}_tokens'], kind=kind, turn_type=trace.turn_type)
+        if 'session_bytes' in trace.sizes:
+            self.session_bytes.observe(trace.sizes['session_bytes'])
+        if trace.cache_hit:
+            self.cache_hits.inc(turn_type=trace.turn_type)
+        for section, tokens in trace.prompt_sections.items():
+            self.section_tokens.observe(tokens, section=section, turn_type=trace.turn_type)
+        for section in trace.prompt_trimmed:
+            self.trimmed_sections.inc(section=section)
+
+        if self.slow_turn_seconds and total >= self.slow_turn_seconds:
+            breakdown = {phase: round(seconds * 1000, 1) for phase, seconds in trace.phases.items()}
+            logger.warning(
+                f"Slow turn: {trace.turn_type}/{trace.mode} {total * 1000:.0f}ms (status={status}, cache_hit={trace.cache_hit}) "
+                f"phases_ms={json.dumps(breakdown)} sizes={json.dumps(trace.sizes)}"
+            )
+
+    def render(self):
+        lines = []
+        for metric in (self.turns, self.turn_seconds, self.phase_seconds, self.tokens, self.session_bytes, self.cache_hits,
+                       self.section_tokens, self.trimmed_sections, *self._extra_metrics):
+            lines.extend(metric.render())
+        for name, documentation, callback in self._collectors:
+            try:
+                value = callback()
+            except Exception as e:
+                logger.debug(f"gauge {name} 수집 실패: {e}")
+                continue
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,148 @@
+"""GM 턴 응답 JSON의 스키마와 정규화.
+
+프롬프트의 응답 형식(```json 블록)에 나열된 필드를 Gemini 구조화 출력(response_schema)으로도 선언해,
+모델이 처음부터 스키마에 맞는 JSON을 내도록 합니다. 모델 출력은 loads_tolerant로 읽은 뒤
+normalize_turn_response로 타입을 맞추므로, 값 하나가 어긋났다고 턴 전체를 버리지 않습니다.
+"""
+STAT_MAPPING_KO = {'strength': '근력', 'agility': '민첩', 'intelligence': '지능', 'senses': '감각', 'willpower': '정신력'}
+ROLL_STATS = tuple(STAT_MAPPING_KO)
+_ROLL_STAT_ALIASES = {**{name: name for name in ROLL_STATS}, **{ko: name for name, ko in STAT_MAPPING_KO.items()}}
+
+_NULLABLE_STRING = {'type': 'STRING', 'nullable': True}
+_STRING_LIST = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+
+# google.generativeai의 response_schema 형식 (OpenAPI 스키마의 부분집합)
+# story를 맨 앞에 선언해 두어야 스트리밍 중에 story가 먼저 생성되어 바로 흘려보낼 수 있습니다.
+TURN_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'story': {'type': 'STRING'},
+        'require_roll': {'type': 'BOOLEAN'},
+        'roll_stat': {'type': 'STRING', 'enum': list(ROLL_STATS), 'nullable': True},
+        'hp_change': {'type': 'INTEGER'},
+        'sp_change': {'type': 'INTEGER'},
+        'add_inventory': _STRING_LIST,
+        'remove_inventory': _STRING_LIST,
+        'new_location': _NULLABLE_STRING,
+        'new_scenario_state': _NULLABLE_STRING,
+        'new_scene_id': _NULLABLE_STRING,
+    },
+    'required': ['story', 'require_roll', 'roll_stat'],
+}
+
+TURN_GENERATION_CONFIG = {'response_mime_type': 'application/json', 'response_schema': TURN_RESPONSE_SCHEMA}
+
+# 방(room) 모드: 한 라운드의 여러 플레이어 행동을 한 번에 처리한 결과
+ROOM_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'story': {'type': 'STRING'},
+        'players': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'player_id': {'type': 'STRING'},
+                    'story': {'type': 'STRING'},
+                    'hp_change': {'type': 'INTEGER'},
+                    'sp_change': {'type': 'INTEGER'},
+                    'add_inventory': _STRING_LIST,
+                    'remove_inventory': _STRING_LIST,
+                },
+                'required': ['player_id', 'story'],
+            },
+        },
+        'new_location': _NULLABLE_STRING,
+        'new_scenario_state': _NULLABLE_STRING,
+        'new_scene_id': _NULLABLE_STRING,
+    },
+    'required': ['story', 'players'],
+}
+
+ROOM_GENERATION_CONFIG = {'response_mime_type': 'application/json', 'response_schema': ROOM_RESPONSE_SCHEMA}
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', '1', '예')
+    return bool(value)
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):  # OverflowError: 1e999, Infinity
+        return 0
+
+
+def _to_str_list(value):
+    if value in (None, ''):
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [str(item).strip() for item in value if item is not None and str(item).strip()]
+
+
+def _to_optional_str(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value if value and value.lower() not in ('null', 'none') else None
+
+
+def normalize_turn_response(data):
+    """모델이 낸 턴 JSON의 필드 타입을 스키마에 맞춥니다. story가 없으면 None을 반환합니다."""
+    if not isinstance(data, dict):
+        return None
+    story = data.get('story')
+    if not isinstance(story, str) or not story.strip():
+        return None
+
+    roll_stat = _ROLL_STAT_ALIASES.get(str(data.get('roll_stat') or '').strip().lower())
+    # 판정 능력치를 알 수 없으면 판정을 요구하지 않음 (프론트엔드가 굴릴 능력치가 없으므로)
+    require_roll = _to_bool(data.get('require_roll')) and roll_stat is not None
+
+    # 스키마에 선언된 필드만 남김 (모델이 지어낸 키가 턴 응답에 섞이지 않도록)
+    return {
+        'story': story,
+        'require_roll': require_roll,
+        'roll_stat': roll_stat if require_roll else None,
+        'hp_change': _to_int(data.get('hp_change', 0)),
+        'sp_change': _to_int(data.get('sp_change', 0)),
+        'add_inventory': _to_str_list(data.get('add_inventory')),
+        'remove_inventory': _to_str_list(data.get('remove_inventory')),
+        'new_location': _to_optional_str(data.get('new_location')),
+        'new_scenario_state': _to_optional_str(data.get('new_scenario_state')),
+        'new_scene_id': _to_optional_str(data.get('new_scene_id')),
+    }
+
+
+def normalize_room_response(data, player_ids):
+    """방 라운드 결과의 타입을 맞춥니다. 결과가 빠진 플레이어는 변화 없음으로 채웁니다. story가 없으면 None."""
+    if not isinstance(data, dict):
+        return None
+    story = data.get('story')
+    if not isinstance(story, str) or not story.strip():
+        return None
+
+    results = {}
+    for entry in data.get('players') or []:
+        if isinstance(entry, dict) and str(entry.get('player_id')) in player_ids:
+            results[str(entry['player_id'])] = entry
+    players = {}
+    for player_id in player_ids:
+        entry = results.get(player_id, {})
+        players[player_id] = {
+            'story': str(entry.get('story') or '').strip(),
+            'hp_change': _to_int(entry.get('hp_change', 0)),
+            'sp_change': _to_int(entry.get('sp_change', 0)),
+            'add_inventory': _to_str_list(entry.get('add_inventory')),
+            'remove_inventory': _to_str_list(entry.get('remove_inventory')),
+        }
+    return {
+        'story': story,
+        'players': players,
+        'new_location': _to_optional_str(data.get('new_location')),
+        'new_scenario_state': _to_optional_str(data.get('new_scenario_state')),
+        'new_scene_id': _to_optional_str(data.get('new_scene_id')),
+    }
@@ -18,7 +18,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const remainingPointsSpan = document.getElementById('remaining-points');
     const initialInventoryTextarea = document.getElementById('initial-inventory');
     const charDescriptionTextarea = document.getElementById('char-description'); // Add this line
+    const lorebookSelect = document.getElementById('lorebook-select');
     const createCharacterBtn = document.getElementById('create-character-btn');
+    const roomCodeInput = document.getElementById('room-code');
+    const createRoomBtn = document.getElementById('create-room-btn');
 
     // 캐릭터 정보 표시 DOM 요소
     const displayCharName = document.getElementById('display-char-name');
@@ -42,9 +45,13 @@ document.addEventListener('DOMContentLoaded', () => {
     let animationInterval;
     let pendingRollStat = null; // AI가 요구한 주사위 굴림 능력치(영어)를 저장
     let pendingRollStatKo = null; // AI가 요구한 주사위 굴림 능력치(한글)를 저장
+    let pendingRollOdds = null; // 그 판정의 결과별 확률 (서버 계산)
 
     // 플레이어 캐릭터 데이터 (초기값 및 생성 후 사용)
     let playerCharacter = {}; // 백엔드에서 데이터를 받아 채울 것이므로 빈 객체로 시작
+    let stateVersion = null; // 마지막으로 받은 게임 상태 버전 (턴 응답은 이 버전 이후의 변경분만 보냄)
+    let roomId = null; // 방 모드로 참가했을 때의 방 코드 (혼자 플레이하면 null)
+    let playerId = null; // 방 안에서의 내 player_id
 
     // --- 유틸리티 함수 ---
     function addMessageToLog(message, type = 'gm-message') {
@@ -55,15 +62,18 @@ document.addEventListener('DOMContentLoaded', () => {
         chatLog.scrollTop = chatLog.scrollHeight;
     }
 
-    function setDiceRollAreaState(enabled, stat = '', statKo = '') {
+    function setDiceRollAreaState(enabled, stat = '', statKo = '', odds = null) {
         pendingRollStat = enabled ? stat : null;
         pendingRollStatKo = enabled ? statKo : null; // 한글 스탯 이름도 함께 관리
+        pendingRollOdds = enabled ? odds : null;
         if (enabled) {
             diceRollArea.classList.remove('disabled');
             rollDiceBtn.removeAttribute('disabled');
             // 한글 스탯 이름이 있으면 사용하고, 없으면 영어 스탯 이름을 사용
             const displayStat = statKo || stat; 
             rollDiceBtn.textContent = displayStat ? `${displayStat} 판정 (2d6)` : '주사위 굴리기 (2d6)';
+            // 서버가 계산한 성공 확률 (완전한 성공 + 대가를 치르는 성공)
+            if (odds) rollDiceBtn.textContent += ` · 성공 ${Math.round(odds.success * 100)}%`;
         } else {
             diceRollArea.classList.add('disabled');
             rollDiceBtn.setAttribute('disabled', 'true');
@@ -119,6 +129,19 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // 턴 응답의 상태 반영: 버전이 어긋나 전체 캐릭터가 오면 그대로 쓰고, 아니면 변경분(delta)만 적용합니다.
+    function applyTurnState(data) {
+        if (data.character) {
+            updateCharacterUI(data.character);
+        } else if (data.delta) {
+            const { inventory_add = [], inventory_remove = [], ...fields } = data.delta;
+            const inventory = playerCharacter.inventory.filter(item => !inventory_remove.includes(item));
+            inventory_add.forEach(item => { if (!inventory.includes(item)) inventory.push(item); });
+            updateCharacterUI({ ...playerCharacter, ...fields, inventory });
+        }
+        if (data.version !== undefined) stateVersion = data.version;
+    }
+
     function setActionInputState(enabled, message) {
         playerActionInput.disabled = !enabled;
         sendActionBtn.disabled = !enabled;
@@ -183,6 +206,50 @@ document.addEventListener('DOMContentLoaded', () => {
     // 초기 능력치 UI 설정
     updateStatsAllocationDisplay();
 
+    // 선택 가능한 로어북(캠페인) 목록 불러오기
+    async function loadLorebookOptions() {
+        try {
+            const response = await fetch(`${API_BASE_URL}/lorebooks`, { credentials: 'include' });
+            if (!response.ok) return;
+            const result = await response.json();
+            lorebookSelect.innerHTML = '';
+            result.lorebooks.forEach(lorebook => {
+                const option = document.createElement('option');
+                option.value = lorebook.id;
+                option.textContent = lorebook.start_location ? `${lorebook.title} (${lorebook.start_location})` : lorebook.title;
+                option.selected = lorebook.default;
+                lorebookSelect.appendChild(option);
+            });
+        } catch (error) {
+            // 목록을 못 불러와도 기본 캠페인으로 진행할 수 있으므로 게임은 계속합니다.
+            console.error('로어북 목록을 불러오지 못했습니다:', error);
+        }
+    }
+    loadLorebookOptions();
+
+    // 방 코드는 ?room=<id> 주소로도 받을 수 있습니다 (방을 만든 사람이 주소를 공유)
+    roomCodeInput.value = new URLSearchParams(window.location.search).get('room') || '';
+
+    createRoomBtn.addEventListener('click', async () => {
+        createRoomBtn.disabled = true;
+        try {
+            const response = await fetch(`${API_BASE_URL}/rooms`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'include',
+                body: JSON.stringify({ lorebook: lorebookSelect.value || undefined })
+            });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || response.statusText);
+            roomCodeInput.value = result.room.room_id;
+        } catch (error) {
+            console.error('방을 만들지 못했습니다:', error);
+            alert(`방을 만들지 못했습니다: ${error.message}`);
+        } finally {
+            createRoomBtn.disabled = false;
+        }
+    });
+
     createCharacterBtn.addEventListener('click', async () => {
         const name = charNameInput.value.trim();
         if (!name) {
@@ -199,9 +266,17 @@ document.addEventListener('DOMContentLoaded', () => {
             name: name,
             stats: { ...allocatedStats },
             inventory: initialInventoryTextarea.value.split(',').map(item => item.trim()).filter(item => item),
-            description: charDescriptionTextarea.value.trim() // Add this line
+            description: charDescriptionTextarea.value.trim(), // Add this line
+            lorebook: lorebookSelect.value || undefined
         };
 
+        // 방 코드가 있으면 혼자 하는 게임 대신 그 방에 참가
+        const roomCode = roomCodeInput.value.trim();
+        if (roomCode) {
+            await joinRoom(roomCode, characterDataToSend);
+            return;
+        }
+
         // 백엔드로 캐릭터 데이터 전송
         try {
             const response = await fetch(`${API_BASE_URL}/create-character`, {
@@ -222,6 +297,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (result.status === 'success' && result.character) {
                 // 백엔드에서 받은 최종 데이터로 UI 업데이트
                 updateCharacterUI(result.character);
+                stateVersion = result.version;
 
                 // UI 전환
                 charCreationScreen.classList.add('hidden');
@@ -243,40 +319,223 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
 
+    // --- 방 모드 ---
+    // 방에 참가하고 방 이벤트(SSE)를 구독합니다. 라운드 결과는 서버가 모든 참가자에게 밀어 줍니다.
+    async function joinRoom(code, characterDataToSend) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/rooms/${encodeURIComponent(code)}/join`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'include',
+                body: JSON.stringify(characterDataToSend)
+            });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || response.statusText);
+
+            roomId = result.room.room_id;
+            playerId = result.player_id;
+            updateCharacterUI(result.character);
+
+            charCreationScreen.classList.add('hidden');
+            gameContainer.classList.remove('hidden');
+            document.querySelector('.tab-button.active').click(); // 캐릭터 탭 활성화
+
+            result.room.game_log.forEach(line => addMessageToLog(line));
+            addMessageToLog(`<strong>GM:</strong> 방 코드 <strong>${roomId}</strong>를 공유하면 다른 플레이어가 참가할 수 있습니다.`);
+            connectRoomEvents();
+        } catch (error) {
+            console.error('방 참가 중 오류 발생:', error);
+            alert(`방에 참가하지 못했습니다: ${error.message}`);
+        }
+    }
+
+    function connectRoomEvents() {
+        const roomEvents = new EventSource(`${API_BASE_URL}/rooms/${encodeURIComponent(roomId)}/events`, { withCredentials: true });
+        roomEvents.addEventListener('member', (event) => {
+            const data = JSON.parse(event.data);
+            if (data.player_id !== playerId) addMessageToLog(`<strong>GM:</strong> ${data.name}님이 합류했습니다.`);
+        });
+        roomEvents.addEventListener('action', (event) => {
+            const data = JSON.parse(event.data);
+            const waiting = data.waiting_for.length
+                ? `아직 기다리는 중: ${data.waiting_for.join(', ')}`
+                : '모두 행동했습니다. GM이 라운드를 처리하고 있습니다...';
+            addMessageToLog(`<strong>GM:</strong> ${data.name}님이 행동을 정했습니다. (${waiting})`);
+        });
+        roomEvents.addEventListener('round', (event) => {
+            const data = JSON.parse(event.data);
+            const players = Object.values(data.players);
+            players.filter(p => p.action).forEach(p => {
+                addMessageToLog(`<strong>${p.name}:</strong> ${p.action}`, 'player-message');
+            });
+            const playerStories = players.filter(p => p.story).map(p => `<br>${p.name}: ${p.story}`).join('');
+            addMessageToLog(`<strong>GM:</strong> ${data.story}${playerStories}`);
+            if (data.players[playerId]) updateCharacterUI(data.players[playerId].character);
+            setActionInputState(true, '여기에 행동을 입력하세요 (예: 승강장을 둘러본다)...');
+        });
+        roomEvents.addEventListener('error', (event) => {
+            // 서버가 보낸 error 이벤트(라운드 처리 실패)만 data가 있고, 연결 오류는 EventSource가 알아서 다시 연결합니다.
+            if (event.data) {
+                addMessageToLog(JSON.parse(event.data).story, 'gm-message');
+                setActionInputState(true, '여기에 행동을 입력하세요 (예: 승강장을 둘러본다)...');
+            } else if (roomEvents.readyState === EventSource.CLOSED) {
+                addMessageToLog('<strong>GM:</strong> 방과의 연결이 끊어졌습니다. 페이지를 새로고침해주세요.', 'gm-message');
+            }
+        });
+    }
+
+    async function handleRoomAction(actionText) {
+        setActionInputState(false, '다른 플레이어의 행동과 함께 처리됩니다...');
+        try {
+            const response = await fetch(`${API_BASE_URL}/rooms/${encodeURIComponent(roomId)}/action`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'include',
+                body: JSON.stringify({ player_action: actionText })
+            });
+            if (!response.ok) {
+                const errorData = await response.json().catch(() => ({}));
+                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+            }
+            // 결과는 라운드가 끝나면 round 이벤트로 도착합니다.
+        } catch (error) {
+            console.error('Room Action Error:', error);
+            addMessageToLog(`<strong>GM:</strong> 행동을 보내지 못했습니다: ${error.message}.`, 'gm-message');
+            setActionInputState(true, '여기에 행동을 입력하세요 (예: 승강장을 둘러본다)...');
+        }
+    }
+
+
+    // --- 스트리밍 통신 함수 ---
+    // /game-turn-stream 응답(Server-Sent Events)을 읽어 이벤트마다 handlers[이벤트 이름]을 호출합니다.
+    // 최종 응답('done' 이벤트의 데이터)을 반환합니다.
+    async function streamGameTurn(payload, handlers) {
+        const response = await fetch(`${API_BASE_URL}/game-turn-stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            credentials: 'include',
+            body: JSON.stringify(payload)
+        });
+
+        if (!response.ok) {
+            // 429/503(요청이 몰림)이면 서버가 알려준 재시도 안내를 보여줍니다.
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let finalData = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE 메시지는 빈 줄(\n\n)로 구분됩니다.
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                const eventData = dataText ? JSON.parse(dataText) : {};
+
+                if (eventName === 'error') throw new Error(eventData.story || '스트리밍 중 오류가 발생했습니다.');
+                if (eventName === 'done') finalData = eventData;
+                if (handlers[eventName]) handlers[eventName](eventData);
+            }
+        }
+
+        if (!finalData) throw new Error('GM 응답이 중간에 끊어졌습니다.');
+        return finalData;
+    }
+
+    // GM 메시지를 빈 문단으로 먼저 만들고, 스트리밍되는 글자를 이어 붙이는 함수를 반환합니다.
+    function startStreamingGmMessage(prefix = '') {
+        const p = document.createElement('p');
+        p.classList.add('gm-message');
+        p.innerHTML = '<strong>GM:</strong> ';
+        const textSpan = document.createElement('span');
+        textSpan.textContent = prefix;
+        p.appendChild(textSpan);
+        chatLog.appendChild(p);
+        return {
+            append(text) {
+                textSpan.textContent += text;
+                chatLog.scrollTop = chatLog.scrollHeight;
+            },
+            finish(finalHtml) {
+                // 완성된 응답으로 한 번 더 그려서 일반 응답과 동일한 모양을 유지
+                p.innerHTML = `<strong>GM:</strong> ${finalHtml}`;
+                chatLog.scrollTop = chatLog.scrollHeight;
+            },
+            remove() {
+                p.remove();
+            }
+        };
+    }
+
+    // 응답이 늦어 대체 응답으로 진행한 턴: 실제 GM 응답이 도착하면 로그에 덧붙입니다.
+    async function showLateAnswer(answerId, attempts = 20) {
+        for (let i = 0; i < attempts; i++) {
+            await new Promise(resolve => setTimeout(resolve, 3000));
+            try {
+                const response = await fetch(`${API_BASE_URL}/late-answer/${answerId}`, { credentials: 'include' });
+                if (!response.ok) return;
+                const result = await response.json();
+                if (result.status === 'ready') {
+                    addMessageToLog(`<strong>GM (늦게 도착한 서술):</strong> ${result.story}`);
+                    return;
+                }
+                if (result.status === 'failed') return;
+            } catch (error) {
+                return;
+            }
+        }
+    }
+
     // --- 핵심 게임 로직 함수 ---
     async function handleAction() {
         const actionText = playerActionInput.value.trim();
         if (!actionText || playerActionInput.disabled) return;
 
+        if (roomId) {
+            // 방 모드: 판정 주사위는 서버가 라운드마다 굴립니다.
+            playerActionInput.value = '';
+            await handleRoomAction(actionText);
+            return;
+        }
+
         addMessageToLog(`<strong>플레이어:</strong> ${actionText}`, 'player-message');
         playerActionInput.value = '';
         setDiceRollAreaState(false);
         setActionInputState(false, 'GM이 응답을 준비하고 있습니다...');
 
+        const gmMessage = startStreamingGmMessage();
         try {
-            const response = await fetch(`${API_BASE_URL}/game-turn`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                credentials: 'include',
-                body: JSON.stringify({ type: 'action', player_action: actionText })
+            const data = await streamGameTurn({ type: 'action', player_action: actionText, base_version: stateVersion }, {
+                story: (event) => gmMessage.append(event.delta)
             });
+            gmMessage.finish(data.story);
 
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            
-            const data = await response.json();
-            addMessageToLog(`<strong>GM:</strong> ${data.story}`);
-
-            // 서버로부터 받은 최신 캐릭터 정보로 UI 업데이트
-            if (data.character) {
-                updateCharacterUI(data.character);
-            }
+            // 서버로부터 받은 캐릭터 변경분으로 UI 업데이트
+            applyTurnState(data);
 
             if (data.require_roll && data.roll_stat) {
-                setDiceRollAreaState(true, data.roll_stat, data.roll_stat_ko);
+                setDiceRollAreaState(true, data.roll_stat, data.roll_stat_ko, data.roll_odds);
             }
+            if (data.late_answer_id) showLateAnswer(data.late_answer_id);
 
         } catch (error) {
             console.error('Action Error:', error);
+            gmMessage.remove();
             addMessageToLog(`<strong>GM:</strong> 오류가 발생했습니다: ${error.message}. 다시 시도해주세요.`, 'gm-message');
         } finally {
             // 주사위 굴림이 필요하지 않은 경우에만 입력창을 다시 활성화
@@ -294,44 +553,51 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         
         const displayStat = pendingRollStatKo || statToRoll;
+        const rollOdds = pendingRollOdds;
         addMessageToLog(`<strong>플레이어:</strong> ${displayStat} 판정을 위해 주사위를 굴립니다...`, 'player-message');
         setDiceRollAreaState(false);
         startDiceAnimation();
 
+        let gmMessage = null;
         try {
-            const response = await fetch(`${API_BASE_URL}/game-turn`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                credentials: 'include',
-                body: JSON.stringify({ type: 'roll', modifier_stat: statToRoll })
+            const data = await streamGameTurn({ type: 'roll', modifier_stat: statToRoll, base_version: stateVersion }, {
+                // 주사위 결과는 서술보다 먼저 도착하므로 바로 보여줍니다.
+                roll: (event) => {
+                    stopDiceAnimation();
+                    diceDisplay.textContent = `${event.dice1} + ${event.dice2}`;
+                    addMessageToLog(event.roll_summary);
+                    gmMessage = startStreamingGmMessage();
+                },
+                story: (event) => gmMessage && gmMessage.append(event.delta)
             });
-
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-
-            const data = await response.json();
             stopDiceAnimation();
             diceDisplay.textContent = `${data.dice1} + ${data.dice2}`;
-            addMessageToLog(`<strong>GM:</strong> ${data.story}`);
-
-            // 서버로부터 받은 최신 캐릭터 정보로 UI 업데이트
-            if (data.character) {
-                updateCharacterUI(data.character);
+            if (gmMessage) {
+                gmMessage.finish(data.story);
+            } else {
+                addMessageToLog(data.roll_summary);
+                addMessageToLog(`<strong>GM:</strong> ${data.story}`);
             }
+
+            // 서버로부터 받은 캐릭터 변경분으로 UI 업데이트
+            applyTurnState(data);
             
             // 굴림 후에는 항상 행동 입력을 활성화
             setActionInputState(true, '여기에 행동을 입력하세요 (예: 승강장을 둘러본다)...');
             
             // 굴림 후에 또 다른 굴림이 필요한 경우가 있다면 상태를 다시 설정 (AI의 "story" 응답에 따라 결정됨)
             if (data.require_roll && data.roll_stat) {
-                 setDiceRollAreaState(true, data.roll_stat, data.roll_stat_ko);
+                 setDiceRollAreaState(true, data.roll_stat, data.roll_stat_ko, data.roll_odds);
             }
+            if (data.late_answer_id) showLateAnswer(data.late_answer_id);
 
         } catch (error) {
             console.error('Roll Error:', error);
+            if (gmMessage) gmMessage.remove();
             addMessageToLog(`<strong>GM:</strong> 오류가 발생했습니다: ${error.message}.`, 'gm-message');
             stopDiceAnimation();
             diceDisplay.textContent = '? + ?';
-            setDiceRollAreaState(true, statToRoll, pendingRollStatKo); // 오류 시 다시 굴릴 기회 제공
+            setDiceRollAreaState(true, statToRoll, displayStat, rollOdds); // 오류 시 다시 굴릴 기회 제공
         }
     }
 
@@ -343,9 +609,45 @@ document.addEventListener('DOMContentLoaded', () => {
     });
     rollDiceBtn.addEventListener('click', handleRoll);
 
+    // 새로고침 후 이어하기: 세션에 진행 중인 게임이 있으면 /game-log를 페이지 단위로 받아 화면을 복원합니다.
+    async function restoreGame() {
+        let since = 0;
+        try {
+            while (true) {
+                const response = await fetch(`${API_BASE_URL}/game-log?since=${since}&limit=100`, { credentials: 'include' });
+                if (!response.ok) return false;
+                const page = await response.json();
+                if (page.version === 0) return false; // 캐릭터를 만들기 전의 세션
+                page.entries.forEach(entry => {
+                    addMessageToLog(entry.html, entry.type === 'action' ? 'player-message' : 'gm-message');
+                });
+                since = page.next;
+                if (!page.has_more) {
+                    updateCharacterUI(page.character);
+                    stateVersion = page.version;
+                    if (page.pending_roll) {
+                        const { roll_stat, roll_stat_ko, roll_odds } = page.pending_roll;
+                        setDiceRollAreaState(true, roll_stat, roll_stat_ko, roll_odds);
+                        setActionInputState(false);
+                    }
+                    return true;
+                }
+            }
+        } catch (error) {
+            console.error('이전 게임을 불러오지 못했습니다:', error);
+            chatLog.innerHTML = '';
+            return false;
+        }
+    }
+
     // --- 게임 시작 ---
-    // 초기 상태 설정: 캐릭터 생성 화면 표시
+    // 초기 상태 설정: 캐릭터 생성 화면 표시 (이어할 게임이 있으면 게임 화면으로 전환)
     charCreationScreen.classList.remove('hidden');
     gameContainer.classList.add('hidden');
     updateStatsAllocationDisplay();
+    restoreGame().then(restored => {
+        if (!restored) return;
+        charCreationScreen.classList.add('hidden');
+        gameContainer.classList.remove('hidden');
+    });
 });
\ No newline at end of file